@@ -1,18 +1,26 @@
+import argparse
+import os
+
 from src.pdf_file_utils import PDFDocumentLoader
 from src.database import VectorDatabase
+from src.ingestion import DirectoryIngestor
 from src.prompt import ChatPromptTemplate
 from src.runnables import DictTransformer, RunnablePassthrough
 from src.settings import settings
 from src.llm import AzureChatOpenAI
 import asyncio
 
-async def main():
-    file_path = r"C:\Users\Nazlı\Desktop\smallchain\deneme_pdf.pdf"
-    loader = PDFDocumentLoader(file_path)
-    
-    docs = loader.load() 
+async def main(file_path: str, question: str):
+    # parsing and embedding block, so they run off the event loop
+    if os.path.isdir(file_path):
+        # a directory tree is ingested incrementally, only new or changed PDFs are re-embedded
+        vectorstore = await asyncio.to_thread(DirectoryIngestor(file_path).ingest)
+    else:
+        loader = PDFDocumentLoader(file_path)
+
+        docs = await asyncio.to_thread(loader.load)
 
-    vectorstore = await VectorDatabase.afrom_documents(docs)
+        vectorstore = await VectorDatabase.afrom_documents(docs)
 
     retriever = vectorstore.as_retriever()
 
@@ -28,8 +36,19 @@ async def main():
     retrieval_chain = DictTransformer({"context": retriever, "question": RunnablePassthrough()}) | prompt | llm
     
 
-    result = retrieval_chain.invoke("where did harrison work?")
-    print(result)
+    # tokens are printed as the LLM produces them instead of after the whole generation
+    async for token in retrieval_chain.astream(question):
+        print(token, end="", flush=True)
+    print()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Answer a question from PDF documents.")
+    parser.add_argument("path", nargs="?", default=settings.RAG_DOCUMENTS_PATH,
+                        help="A PDF file or a directory of PDFs, RAG_DOCUMENTS_PATH by default")
+    parser.add_argument("--question", default="where did harrison work?")
+    args = parser.parse_args()
+    if args.path is None:
+        parser.error("give a PDF file or directory, or set RAG_DOCUMENTS_PATH")
+
+    asyncio.run(main(args.path, args.question))
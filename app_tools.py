@@ -1,13 +1,14 @@
 import os
-from time import perf_counter
-from typing import Any
+import json
+import argparse
+from pathlib import Path
+from typing import Any, Optional
 from uuid import uuid4
 import asyncio
 
-from openai import AsyncAzureOpenAI
+from aiohttp import web
 from loguru import logger
 from rich.console import Console
-from termcolor import colored
 
 from src.tools.google_tools.google_maps_tool import GoogleMapsTool
 from src.tools.get_weather import WeatherTool
@@ -15,34 +16,39 @@ from src.tools.utils import prepare_schemas
 from src.tools.google_tools.google_tools_executors import GmailReadTool, GmailSendTool, CalendarReadTool, CalendarInsertTool
 from src.settings import settings
 from src.tools.google_tools.credentials import GoogleCredsManager
-from src.prompts import generate_prompt
-from src.visualizer import Visualizer
-from src.tts import TextToSpeech
-from src.stt import SpeechToText
-from src.astream import ahandle_stream, extract_tool_input_args
+from src.prompts import PromptAssembler, generate_prompt
+from src.context import ConversationContext, LLMSummarizer
+from src.agent import Agent
 from src.persistence import save_json_chat_history
+from src.replay import load_conversations, replay_conversations, summarize_timings
+from src.server import AssistantServer, session_credentials, session_tools
+from src.resilience import AsyncResilientClient
+from src.llm_cache import CachedClient, LLMResponseCache, get_llm_cache, set_llm_cache
+from src.clients import (aclose_http_clients, get_async_azure_client, get_async_gpt_client, get_async_tts_client,
+                         get_async_whisper_client)
 
 console = Console()
 
 google_creds_manager = GoogleCredsManager()
 
-whisper_client = AsyncAzureOpenAI(
-    api_key=settings.AZURE_OPENAI_WHISPER_API_KEY,
-    api_version=settings.AZURE_OPENAI_WHISPER_API_VERSION,
-    azure_endpoint=settings.AZURE_OPENAI_WHISPER_ENDPOINT
-) 
+# every client shares one HTTP/2 keep-alive connection pool
+whisper_client = get_async_whisper_client()
+tts_client = get_async_tts_client()
+azure_openai_client = get_async_gpt_client()
 
-tts_client = AsyncAzureOpenAI(api_key=settings.AZURE_OPENAI_TTS_API_KEY,
-                              api_version=settings.AZURE_OPENAI_TTS_API_VERSION,
-                              azure_endpoint=settings.AZURE_OPENAI_TTS_ENDPOINT)
+gpt_fallbacks = []
+if settings.AZURE_OPENAI_GPT_FALLBACK_ENDPOINT:
+    gpt_fallbacks.append((get_async_azure_client(settings.AZURE_OPENAI_GPT_FALLBACK_ENDPOINT,
+                                                 settings.AZURE_OPENAI_GPT_FALLBACK_API_KEY or settings.AZURE_OPENAI_GPT_API_KEY,
+                                                 settings.AZURE_OPENAI_GPT_API_VERSION),
+                          settings.AZURE_OPENAI_GPT_FALLBACK_DEPLOYMENT))
 
-azure_openai_client = AsyncAzureOpenAI(api_key=settings.AZURE_OPENAI_GPT_API_KEY,
-                                  api_version=settings.AZURE_OPENAI_GPT_API_VERSION,
-                                  azure_endpoint=settings.AZURE_OPENAI_GPT_ENDPOINT
-                                  )
+if settings.LLM_CACHE_PATH:
+    set_llm_cache(LLMResponseCache(path=settings.LLM_CACHE_PATH))
 
-tts = TextToSpeech(client=tts_client)
-stt = SpeechToText()
+# exact-match completion cache, then per-call deadline, hedging of slow first tokens and fallback deployment
+gpt_client = CachedClient(AsyncResilientClient(azure_openai_client, fallbacks=gpt_fallbacks, timeout=settings.LLM_TIMEOUT),
+                          is_async=True)
 
 google_cred_tools: dict[str, Any] = {
     "read_gmail_emails": GmailReadTool,
@@ -58,32 +64,75 @@ other_tools: dict[str, Any] = {
 
 google_creds_manager = GoogleCredsManager()
 
-SYSTEM_PROMPT: str = generate_prompt(prepare_schemas(models=[*other_tools.values(), *google_cred_tools.values()]))
+TOOLS: dict[str, Any] = {**other_tools, **google_cred_tools}
+
+
+def make_prompt_assembler(tools: dict[str, Any]) -> PromptAssembler:
+    if settings.NATIVE_TOOLS:
+        # schemas go in the `tools` parameter, several calls per response
+        system_prompt: str = generate_prompt()
+    else:
+        system_prompt: str = generate_prompt(prepare_schemas(models=[*tools.values()]))
+    # static prompt first, date last: every request shares its cacheable prefix with the previous one
+    return PromptAssembler(system_prompt)
+
+
+prompt_assembler = make_prompt_assembler(TOOLS)
+# sessions of server users, without and with Google credentials
+session_prompt_assemblers: dict[bool, PromptAssembler] = {google: make_prompt_assembler(session_tools(google))
+                                                          for google in (False, True)}
 
 
 def fancy_print(prompt: str, role: str):
     """Prints user input with a typing effect and styling."""
     console.print(f"[bold cyan]{role} >[/bold cyan] {prompt}", end=" ", style="cyan", highlight=False)
 
+def make_agent(verbose: bool = True, tools: dict[str, Any] = TOOLS, assembler: PromptAssembler = prompt_assembler,
+               creds_manager: Optional[GoogleCredsManager] = google_creds_manager) -> Agent:
+    """
+    Agent with its own conversation context; the clients, their connection pool and the caches are shared.
+    The Gmail and Calendar tools among `tools` act with `creds_manager`.
+    """
+    # recent turns and a rolling summary of the older ones, without the system prompt (see `prompt_assembler`)
+    context = ConversationContext(budget=settings.CONTEXT_MAX_TOKENS,
+                                  summarizer=LLMSummarizer(gpt_client, model="gpt-4o-attention-project"))
+    dependencies = {"google_creds_manager": creds_manager} if creds_manager is not None else None
+    return Agent(gpt_client, model="gpt-4o-attention-project", tools=tools, prompt_assembler=assembler,
+                 context=context, dependencies=dependencies, native_tools=settings.NATIVE_TOOLS, verbose=verbose)
+
+
+def make_session_agent(user: str) -> Agent:
+    """Agent of a server session: the server's own tool set, with the user's Google credentials, never the operator's."""
+    creds_manager = session_credentials(user, settings.SERVER_GOOGLE_TOKENS)
+    google = creds_manager is not None
+    return make_agent(verbose=False, tools=session_tools(google), assembler=session_prompt_assemblers[google],
+                      creds_manager=creds_manager)
+
+
 async def main():
+    # audio and video devices are only needed by the interactive loop
+    from src.visualizer import Visualizer
+    from src.tts import TextToSpeech
+    from src.stt import SpeechToText
+
+    tts = TextToSpeech(client=tts_client)
+    stt = SpeechToText()
+
     visualizer: Visualizer = Visualizer(video_path="orb.mp4")
     asyncio.create_task(visualizer._run_video_loop())
     await asyncio.sleep(3)
 
     conversation_id: str = str(uuid4())
-    logger.info("Starting conversation with ID: {id}", id=conversation_id)
+    logger.info("Starting conversation with ID: {id}, prompt prefix: {f}", id=conversation_id,
+                f=prompt_assembler.fingerprint)
 
     chat_history: dict[str, Any] = {
         "conversation_id": conversation_id,
         "content": [],
     }
 
-    messages: list[dict[str, str]] = [
-        {
-            "role": "system",
-            "content": SYSTEM_PROMPT,
-        },
-    ]
+    agent = make_agent()
+    context = agent.context
     os.system("clear")
 
     while True:
@@ -95,58 +144,79 @@ async def main():
         if user_prompt.lower().strip() in ("exit", "quit"):
             break
 
-        messages.append({"role": "user", "content": user_prompt})
-
-        logger.info("Azure OpenAI Service generating response...")
-        _now: float = perf_counter()
-        stream_response = await azure_openai_client.chat.completions.create(model="gpt-4o-attention-project",
-                                            messages=messages,
-                                            stream=True)
-        logger.info("Azure OpenAI Service generation time: {s:.3f} seconds", s=perf_counter() - _now)
-        print(colored("Assistant > ", "green"), end="", flush=True)
-        
-        extracted_response, metadata, tool_calls = await ahandle_stream(stream_response)
-
-        messages.append({"role": "assistant", "content": extracted_response})
-
-        if tool_calls:
-            logger.info("tool call: {r}", r=extracted_response.removeprefix("<tool>").removesuffix("</tool>"))
-            tool_args: dict[str, Any] = extract_tool_input_args(input=extracted_response)
-            tool_name: str = tool_args.get("name")
-            tool_inputs: dict[str, Any] = tool_args.get("parameters")
-
-            if tool_name in google_cred_tools:
-                tool_inputs["google_creds_manager"] = google_creds_manager
-                tool_output: Any = await google_cred_tools.get(tool_name)(**tool_inputs).arun()
-            else:
-                tool_output: Any = await other_tools.get(tool_name)(**tool_inputs).arun()
-            logger.info("Tool output: {o}", o=tool_output)
-
-            messages.append({"role": "user", "content": user_prompt+"\n\n"+"Context: "+"\n\n"+str(tool_output)})
-
-            chat_history["content"].append({"messages": messages.copy(), **metadata.model_dump()})
-            save_json_chat_history(conversation_id=conversation_id, chat_history=chat_history)
-
-
-            logger.info("Azure OpenAI Service generating response...")
-            _now: float = perf_counter()
-            stream_response = await azure_openai_client.chat.completions.create(model="gpt-4o-attention-project",
-                                                messages=messages,
-                                                stream=True)
-            logger.info("Azure OpenAI Service generation time: {s:.3f} seconds", s=perf_counter() - _now)
-            print(colored("Assistant > ", "green"), end="", flush=True)
-            
-            extracted_response, metadata, _ = await ahandle_stream(stream_response)
-
-        else:
-            logger.info("There is no tool call")
-        
-        await tts.stream_text_to_speech(text=extracted_response, visualizer=visualizer)
+        # each sentence is spoken as soon as it is generated
+        speech = tts.speech_stream(visualizer=visualizer)
+        try:
+            extracted_response, metadata = await agent.arun(user_prompt, on_text=speech.feed)
+        except BaseException:
+            await speech.cancel()
+            raise
+        await speech.finish()
 
         print()
-        chat_history["content"].append({"messages": messages.copy(), **metadata.model_dump()})
+        chat_history["content"].append({"messages": context.transcript.copy(), **metadata.model_dump()})
         save_json_chat_history(conversation_id=conversation_id, chat_history=chat_history)
 
+    await context.aclose()
+    if (llm_cache := get_llm_cache()) is not None:
+        logger.info("LLM cache: {stats}", stats=llm_cache.stats)
+    await aclose_http_clients()
+
+
+async def replay(paths: list[str], concurrency: int, report: Optional[Path] = None):
+    """Headless mode: replay saved conversations without microphone, speaker or window and report stage timings."""
+    conversations = load_conversations(paths)
+    logger.info("Replaying {n} conversations, {c} at a time, prompt prefix: {f}", n=len(conversations), c=concurrency,
+                f=prompt_assembler.fingerprint)
+
+    results = await replay_conversations(lambda: make_agent(verbose=False), conversations, concurrency=concurrency)
+    summary = summarize_timings(results)
+    logger.info("Replay timings: {s}", s=summary)
+
+    if report is not None:
+        report.write_text(json.dumps({"summary": summary, "turns": [result.model_dump() for result in results]},
+                                     indent=4))
+    if (llm_cache := get_llm_cache()) is not None:
+        logger.info("LLM cache: {stats}", stats=llm_cache.stats)
+    await aclose_http_clients()
+
+
+def serve(host: str, port: int):
+    """Server mode: many users at once over WebSocket, each session with its own conversation context."""
+    if not settings.SERVER_TOKENS:
+        logger.warning("SERVER_TOKENS is empty: every connection will be refused")
+    server = AssistantServer(make_agent=make_session_agent, tokens=settings.SERVER_TOKENS,
+                             max_sessions=settings.SERVER_MAX_SESSIONS,
+                             max_active_turns=settings.SERVER_MAX_ACTIVE_TURNS,
+                             idle_timeout=settings.SERVER_IDLE_TIMEOUT)
+    app = server.app()
+
+    async def close_clients(app):
+        if (llm_cache := get_llm_cache()) is not None:
+            logger.info("LLM cache: {stats}", stats=llm_cache.stats)
+        await aclose_http_clients()
+
+    app.on_cleanup.append(close_clients)
+    logger.info("Serving on ws://{host}:{port}/ws, prompt prefix: {f}", host=host, port=port,
+                f=prompt_assembler.fingerprint)
+    web.run_app(app, host=host, port=port)
+
 if __name__ == "__main__":
 
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Voice assistant with tools.")
+    parser.add_argument("--replay", nargs="+", metavar="PATH",
+                        help="Replay the user turns of text files (one turn per line) or saved history/*.json "
+                             "conversations, or of the files of a directory, without audio or video")
+    parser.add_argument("--concurrency", type=int, default=4, help="Conversations replayed at the same time")
+    parser.add_argument("--report", type=Path, help="JSON file receiving the timings of every replayed turn")
+    parser.add_argument("--serve", action="store_true", help="Serve many concurrent sessions over WebSocket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.host, args.port)
+    elif args.replay:
+        asyncio.run(replay(args.replay, concurrency=args.concurrency, report=args.report))
+    else:
+        asyncio.run(main())
@@ -10,6 +10,7 @@ setup(
     license="MIT",
     install_requires=[
         "openai",
+        "httpx[http2]",
         "torch",
         "loguru",
         "rich",
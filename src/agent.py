@@ -0,0 +1,258 @@
+import asyncio
+import json
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+
+from loguru import logger
+from pydantic import BaseModel
+from termcolor import colored
+
+from src.astream import ahandle_stream, extract_tool_input_args
+from src.context import ConversationContext
+from src.metadata import Metadata
+from src.prompts import PromptAssembler
+from src.tools.base import AsyncBaseTool
+from src.tools.compaction import compact_tool_output
+from src.tools.utils import prepare_tools
+
+
+def log_usage(metadata: Optional[Metadata]) -> None:
+    if metadata is None or metadata.prompt_tokens is None:
+        return
+    logger.info("Prompt tokens: {p}, cached: {c} ({r:.0%}), completion tokens: {o}", p=metadata.prompt_tokens,
+                c=metadata.cached_tokens, r=metadata.cached_tokens / (metadata.prompt_tokens or 1),
+                o=metadata.completion_tokens)
+
+
+class TurnTimings(BaseModel):
+    """
+    Where the time of a turn went, in seconds.
+    """
+    # from the user's prompt to the first text of the answer
+    first_text: Optional[float] = None
+    # requests and their streams
+    llm: float = 0.0
+    # tools still running once the streams were over
+    tools: float = 0.0
+    total: float = 0.0
+    rounds: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+
+    def add_response(self, seconds: float, metadata: Optional[Metadata]) -> None:
+        self.llm += seconds
+        self.rounds += 1
+        if metadata is not None and metadata.prompt_tokens is not None:
+            self.prompt_tokens += metadata.prompt_tokens
+            self.cached_tokens += metadata.cached_tokens or 0
+            self.completion_tokens += metadata.completion_tokens or 0
+
+
+class Agent:
+    """
+    Tool-calling loop of the assistant.
+
+    With native function calling the tools are passed in the `tools` parameter of the request; all the calls
+    of a response run concurrently and their results go back in a single follow-up request. Without it the model
+    answers with the `<tool>{...}</tool>` text protocol described in its system prompt, one call per response.
+
+    Read-only tools (and tools marked `speculative`) start the moment their arguments are complete in the stream,
+    while the rest of the response is still being read.
+
+    Usage:
+        agent = Agent(client, model, tools={"get_weather_data": WeatherTool}, prompt_assembler=assembler,
+                      context=ConversationContext())
+        answer, metadata = await agent.arun("What's the weather in Paris?")
+    """
+
+    def __init__(self, client, model: str, tools: Dict[str, Type[AsyncBaseTool]], prompt_assembler: PromptAssembler,
+                 context: ConversationContext, dependencies: Optional[Dict[str, Any]] = None,
+                 native_tools: bool = True, max_rounds: int = 4, speculate: bool = True,
+                 verbose: bool = True):
+        """
+        Args:
+            client: Asynchronous OpenAI client.
+            model (str): Chat deployment.
+            tools (Dict[str, Type[AsyncBaseTool]]): Tool classes by function name.
+            prompt_assembler (PromptAssembler): Builds the messages of every request.
+            context (ConversationContext): The conversation history.
+            dependencies (Optional[Dict[str, Any]]): Values given to every tool with a field of the same name,
+                e.g. `{"google_creds_manager": manager}`.
+            native_tools (bool): Use native function calling instead of the `<tool>` text protocol.
+            max_rounds (int): Maximum number of requests per user prompt; the last one cannot call tools.
+            speculate (bool): Start read-only tools, and tools marked `speculative`, as soon as their call is
+                complete in the stream instead of after the end of the response.
+            verbose (bool): Print the responses while they stream.
+        """
+        self.client = client
+        self.model = model
+        self.tools = tools
+        self.prompt_assembler = prompt_assembler
+        self.context = context
+        self.dependencies = dependencies or {}
+        self.native_tools = native_tools
+        self.max_rounds = max_rounds
+        self.speculate = speculate
+        self.verbose = verbose
+        self.tool_definitions = prepare_tools(models=list(tools.values())) if native_tools else None
+        self.last_timings: Optional[TurnTimings] = None
+
+    async def run_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
+        """
+        Instantiate the tool `name` with `arguments` and the matching dependencies, then run it.
+        """
+        tool_class = self.tools.get(name)
+        if tool_class is None:
+            raise ValueError(f"Unknown function '{name}'")
+        injected = {key: value for key, value in self.dependencies.items() if key in tool_class.model_fields}
+        return await tool_class(**arguments, **injected).arun()
+
+    async def _run_tool_call(self, tool_call: Dict[str, Any]) -> str:
+        name = tool_call["function"]["name"]
+        try:
+            arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+            output = await self.run_tool(name, arguments)
+        except Exception as exc:
+            # the model gets the error and can explain it or try again
+            logger.warning("Tool {name} failed: {e}", name=name, e=exc)
+            return f"Error: {exc}"
+        tool_class = self.tools[name]
+        text, report = compact_tool_output(output, budget=tool_class.output_budget,
+                                           field_priority=tool_class.field_priority)
+        logger.info("Tool output of {name}: {before} tokens, {after} after compaction (saved {saved})", name=name,
+                    before=report.tokens_before, after=report.tokens_after, saved=report.tokens_saved)
+        logger.debug("Tool output: {o}", o=text)
+        return text
+
+    def can_speculate(self, name: str) -> bool:
+        tool_class = self.tools.get(name)
+        return tool_class is not None and (tool_class.read_only or tool_class.speculative)
+
+    async def _complete(self, last_round: bool, on_text: Optional[Callable[[str], None]] = None
+                        ) -> Tuple[str, Metadata, List[Dict[str, Any]], Dict[Union[str, int], asyncio.Task]]:
+        """
+        Send a request and read its stream.
+
+        Returns:
+            The text, metadata and tool calls of the response, and the tool runs already started,
+            by call id (by index in the text for a `<tool>` text call).
+        """
+        request: Dict[str, Any] = {
+            "model": self.model,
+            "messages": self.prompt_assembler.messages(self.context.messages()),
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        if self.tool_definitions:
+            request["tools"] = self.tool_definitions
+            if last_round:
+                request["tool_choice"] = "none"
+
+        logger.info("Azure OpenAI Service generating response...")
+        _now: float = perf_counter()
+        stream_response = await self.client.chat.completions.create(**request)
+        logger.info("Azure OpenAI Service generation time: {s:.3f} seconds", s=perf_counter() - _now)
+        if self.verbose:
+            print(colored("Assistant > ", "green"), end="", flush=True)
+
+        started: Dict[Union[str, int], asyncio.Task] = {}
+
+        def on_tool_call(index: int, tool_call: Dict[str, Any]) -> None:
+            if self.speculate and self.can_speculate(tool_call["function"]["name"]):
+                logger.info("Starting {name} before the end of the response", name=tool_call["function"]["name"])
+                key = tool_call["id"] if tool_call["id"] is not None else index
+                started[key] = asyncio.create_task(self._run_tool_call(tool_call))
+
+        try:
+            text, metadata, tool_calls = await ahandle_stream(stream_response, verbose=self.verbose,
+                                                           on_tool_call=on_tool_call, on_text=on_text)
+        except BaseException:
+            await self._discard(started)
+            raise
+        log_usage(metadata)
+        return text, metadata, tool_calls, started
+
+    @staticmethod
+    async def _discard(started: Dict[Union[str, int], asyncio.Task]) -> None:
+        """
+        Cancel the speculative tool runs whose results are not used, and wait for them to stop.
+        """
+        tasks = list(started.values())
+        started.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def arun(self, user_prompt: str, on_text: Optional[Callable[[str], None]] = None) -> Tuple[str, Metadata]:
+        """
+        Answer a user prompt, calling tools as needed. The stage timings of the turn are left in `last_timings`.
+
+        Args:
+            user_prompt (str): The user's message.
+            on_text (Optional[Callable[[str], None]]): Called with the text of the responses while they stream,
+                e.g. `SpeechStream.feed`.
+
+        Returns:
+            Tuple[str, Metadata]: The final answer and the metadata of the last response.
+        """
+        timings = self.last_timings = TurnTimings()
+        turn_start = perf_counter()
+
+        def on_turn_text(token: str) -> None:
+            if timings.first_text is None:
+                timings.first_text = perf_counter() - turn_start
+            if on_text is not None:
+                on_text(token)
+
+        try:
+            self.context.append({"role": "user", "content": user_prompt})
+            for round_ in range(self.max_rounds):
+                _now = perf_counter()
+                text, metadata, tool_calls, started = await self._complete(last_round=round_ == self.max_rounds - 1,
+                                                                           on_text=on_turn_text)
+                timings.add_response(perf_counter() - _now, metadata)
+
+                _now = perf_counter()
+                try:
+                    if tool_calls:
+                        self.context.append({"role": "assistant", "content": text or None, "tool_calls": tool_calls})
+                        logger.info("Tool calls: {calls}", calls=[(call["function"]["name"],
+                                                                   call["function"]["arguments"])
+                                                                  for call in tool_calls])
+                        try:
+                            outputs = await asyncio.gather(*(started.pop(call["id"], None)
+                                                             or self._run_tool_call(call) for call in tool_calls))
+                        except asyncio.CancelledError:
+                            # every call needs a result, or the next request of the conversation is rejected
+                            for tool_call in tool_calls:
+                                self.context.append({"role": "tool", "tool_call_id": tool_call["id"],
+                                                     "content": "Error: cancelled by the user"})
+                            raise
+                        for tool_call, output in zip(tool_calls, outputs):
+                            self.context.append({"role": "tool", "tool_call_id": tool_call["id"], "content": output})
+                        timings.tools += perf_counter() - _now
+                        continue
+
+                    self.context.append({"role": "assistant", "content": text})
+                    if "<tool>" not in text or round_ == self.max_rounds - 1:
+                        return text, metadata
+
+                    # text protocol fallback: only the first call of the response runs
+                    logger.info("tool call: {r}", r=text.removeprefix("<tool>").removesuffix("</tool>"))
+                    start = text.index("<tool>")
+                    end = text.find("</tool>", start)
+                    tool_args: Dict[str, Any] = extract_tool_input_args(
+                        input=text[start:end + len("</tool>")] if end != -1 else text[start:].strip())
+                    tool_name: str = tool_args.get("name")
+                    output = await (started.pop(0, None) or self._run_tool_call(
+                        {"function": {"name": tool_name, "arguments": json.dumps(tool_args.get("parameters") or {})}}))
+                    self.context.append({"role": "system",
+                                         "content": f"Output of the function '{tool_name}':\n\n{output}"})
+                    timings.tools += perf_counter() - _now
+                finally:
+                    # runs started for calls that were not used
+                    await self._discard(started)
+            return text, metadata
+        finally:
+            timings.total = perf_counter() - turn_start
@@ -1,14 +1,13 @@
-from typing import Any, Dict, List, Union
+from typing import Any, Callable, Dict, List, Optional
 import json
 
 from openai import AsyncStream
 from termcolor import colored
 
 from src.metadata import Metadata
+from src.stream_parser import Finish, StreamParser, TextDelta, ToolArgsComplete, ToolStart, decode_embedded_json
 
 
-from typing import Any, Dict, Union
-
 def extract_tool_input_args(input: str) -> Dict[str, Any]:
     """
     Extracts and processes tool input arguments from the model response, ensuring any embedded
@@ -30,52 +29,52 @@ def extract_tool_input_args(input: str) -> Dict[str, Any]:
     except json.JSONDecodeError as e:
         raise ValueError("The content inside the <tool> tags is not valid JSON.") from e
 
-    def parse_embedded_json(value: Union[str, Dict, List, Any]) -> Any:
-        """
-        Recursively parses strings that are valid JSON, returning the parsed object if applicable.
-
-        Args:
-            value (Union[str, Dict, List, Any]): The value to inspect and possibly decode.
+    return decode_embedded_json(data)
 
-        Returns:
-            Any: The original value if not a JSON string, or the parsed JSON object if applicable.
-        """
-        if isinstance(value, str):
-            try:
-                return json.loads(value)
-            except json.JSONDecodeError:
-                return value
-        elif isinstance(value, dict):
-            return {k: parse_embedded_json(v) for k, v in value.items()}
-        elif isinstance(value, list):
-            return [parse_embedded_json(v) for v in value]
-        else:
-            return value
 
-    return parse_embedded_json(data)
 
+async def ahandle_stream(stream: AsyncStream, verbose: bool = True,
+                         on_tool_call: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                         on_text: Optional[Callable[[str], None]] = None) -> tuple[str, Metadata, List[Dict[str, Any]]]:
+    """
+    Print a streamed answer while collecting it.
 
+    Args:
+        stream (AsyncStream): The chat completion chunks.
+        verbose (bool): Print the text and the progress of the response.
+        on_tool_call (Optional[Callable[[int, Dict[str, Any]], None]]): Called with its index and the call as soon
+            as the arguments of a tool call are complete, before the rest of the stream is read. A `<tool>` text
+            call is reported with no id.
+        on_text (Optional[Callable[[str], None]]): Called with every piece of text meant for the user,
+            `<tool>` calls excluded.
 
-async def ahandle_stream(stream: AsyncStream, verbose: bool = True) -> tuple[str, Metadata, bool]:
-    response: list[str] = []
-    tool_calls: bool = False
+    Returns:
+        tuple[str, Metadata, List[Dict[str, Any]]]: The text, the metadata and usage of the response, and its
+            native tool calls in the format of an assistant message. A `<tool>` text call stays in the text.
+    """
+    parser = StreamParser()
+    thinking: bool = False
+
+    def handle(events) -> None:
+        nonlocal thinking
+        for event in events:
+            if isinstance(event, TextDelta):
+                if verbose and not thinking:
+                    print(colored(event.text, "blue"), end="", flush=True)
+                if on_text is not None:
+                    on_text(event.text)
+            elif isinstance(event, ToolStart):
+                if not thinking:
+                    thinking = True
+                    if verbose:
+                        print(colored("Thinking ...", "yellow"), end="", flush=True)
+            elif isinstance(event, ToolArgsComplete):
+                if on_tool_call is not None:
+                    on_tool_call(event.index, event.as_tool_call())
+            elif isinstance(event, Finish) and verbose:
+                print(colored("Generating ended", "red"), end="", flush=True)
 
     async for chunk in stream:
-        if not chunk.choices:
-
-            metadata: Metadata = Metadata(
-                **chunk.model_dump()
-            )
-        elif token := chunk.choices[0].delta.content:
-            response.append(token)
-            if "<tool>" in "".join(response):
-                tool_calls = True
-                print(colored("Thinking ...", "yellow"), end="", flush=True)
-
-            elif verbose and not tool_calls:
-                # When the stream message stops. This is the n-1 chunk.
-                print(colored(token, "blue"), end="", flush=True)
-        
-        else:
-            print(colored("Generating ended", "red"), end="", flush=True)
-    return "".join(response), metadata, tool_calls
\ No newline at end of file
+        handle(parser.feed(chunk))
+    handle(parser.close())
+    return parser.text, parser.metadata, parser.tool_calls
@@ -0,0 +1,151 @@
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+from loguru import logger
+from openai import AsyncAzureOpenAI, AzureOpenAI
+
+from src.rate_limiter import RateLimitedAsyncTransport, RateLimitedTransport, get_rate_limiter
+from src.settings import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:  # pragma: no cover
+    logger.warning("The h2 package is missing, Azure OpenAI connections fall back to HTTP/1.1 (pip install 'httpx[http2]').")
+    HTTP2 = False
+
+# connections are kept open between turns of the conversation, so that only the first request pays a TLS handshake
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=300.0)
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_azure_clients: Dict[Tuple[str, str, str], AzureOpenAI] = {}
+_async_azure_clients: Dict[Tuple[str, str, str], AsyncAzureOpenAI] = {}
+
+
+def _current_http_client() -> httpx.Client:
+    # the caller holds `_lock`
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        transport = RateLimitedTransport(httpx.HTTPTransport(http2=HTTP2, limits=HTTP_LIMITS), get_rate_limiter())
+        _http_client = httpx.Client(transport=transport, timeout=HTTP_TIMEOUT)
+        # the clients built on the closed pool would keep failing with it
+        _azure_clients.clear()
+    return _http_client
+
+
+def _current_async_http_client() -> httpx.AsyncClient:
+    # the caller holds `_lock`
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        transport = RateLimitedAsyncTransport(httpx.AsyncHTTPTransport(http2=HTTP2, limits=HTTP_LIMITS),
+                                              get_rate_limiter())
+        _async_http_client = httpx.AsyncClient(transport=transport, timeout=HTTP_TIMEOUT)
+        _async_azure_clients.clear()
+    return _async_http_client
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Return the process-wide synchronous HTTP client, creating it on first use. Its requests go through
+    the shared rate limiter.
+    """
+    with _lock:
+        return _current_http_client()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide asynchronous HTTP client, creating it on first use.
+
+    Its connections belong to the event loop that opened them; call `aclose_http_clients` before that loop
+    ends when the process starts another one.
+    """
+    with _lock:
+        return _current_async_http_client()
+
+
+def get_azure_client(endpoint: str, api_key: str, api_version: str) -> AzureOpenAI:
+    """
+    Return the synchronous Azure OpenAI client of a resource, backed by the shared connection pool. The client
+    is built again when that pool was closed and replaced.
+
+    Args:
+        endpoint (str): Endpoint of the Azure OpenAI resource.
+        api_key (str): API key of the resource.
+        api_version (str): API version.
+
+    Returns:
+        AzureOpenAI: A client shared by every caller using the same resource.
+    """
+    key = (endpoint, api_key, api_version)
+    with _lock:
+        http_client = _current_http_client()
+        client = _azure_clients.get(key)
+        if client is None:
+            client = _azure_clients[key] = AzureOpenAI(azure_endpoint=endpoint, api_key=api_key,
+                                                       api_version=api_version, http_client=http_client)
+        return client
+
+
+def get_async_azure_client(endpoint: str, api_key: str, api_version: str) -> AsyncAzureOpenAI:
+    """
+    Asynchronous counterpart of `get_azure_client`.
+    """
+    key = (endpoint, api_key, api_version)
+    with _lock:
+        http_client = _current_async_http_client()
+        client = _async_azure_clients.get(key)
+        if client is None:
+            client = _async_azure_clients[key] = AsyncAzureOpenAI(azure_endpoint=endpoint, api_key=api_key,
+                                                                  api_version=api_version, http_client=http_client)
+        return client
+
+
+def get_gpt_client() -> AzureOpenAI:
+    return get_azure_client(settings.AZURE_OPENAI_GPT_ENDPOINT, settings.AZURE_OPENAI_GPT_API_KEY,
+                            settings.AZURE_OPENAI_GPT_API_VERSION)
+
+
+def get_async_gpt_client() -> AsyncAzureOpenAI:
+    return get_async_azure_client(settings.AZURE_OPENAI_GPT_ENDPOINT, settings.AZURE_OPENAI_GPT_API_KEY,
+                                  settings.AZURE_OPENAI_GPT_API_VERSION)
+
+
+def get_embeddings_client() -> AzureOpenAI:
+    return get_azure_client(settings.AZURE_OPENAI_ENDPOINT, settings.AZURE_OPENAI_API_KEY,
+                            settings.AZURE_OPENAI_API_VERSION)
+
+
+def get_async_embeddings_client() -> AsyncAzureOpenAI:
+    return get_async_azure_client(settings.AZURE_OPENAI_ENDPOINT, settings.AZURE_OPENAI_API_KEY,
+                                  settings.AZURE_OPENAI_API_VERSION)
+
+
+def get_async_tts_client() -> AsyncAzureOpenAI:
+    return get_async_azure_client(settings.AZURE_OPENAI_TTS_ENDPOINT, settings.AZURE_OPENAI_TTS_API_KEY,
+                                  settings.AZURE_OPENAI_TTS_API_VERSION)
+
+
+def get_async_whisper_client() -> AsyncAzureOpenAI:
+    return get_async_azure_client(settings.AZURE_OPENAI_WHISPER_ENDPOINT, settings.AZURE_OPENAI_WHISPER_API_KEY,
+                                  settings.AZURE_OPENAI_WHISPER_API_VERSION)
+
+
+async def aclose_http_clients() -> None:
+    """
+    Close the shared connection pools. The next client requested opens new ones.
+    """
+    global _http_client, _async_http_client
+    with _lock:
+        http_client, async_http_client = _http_client, _async_http_client
+        _http_client = _async_http_client = None
+        _azure_clients.clear()
+        _async_azure_clients.clear()
+    if async_http_client is not None:
+        await async_http_client.aclose()
+    if http_client is not None:
+        http_client.close()
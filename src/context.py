@@ -0,0 +1,223 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from src.rate_limiter import BACKGROUND, priority
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # pragma: no cover - tiktoken is optional, or its encoding could not be downloaded
+    _ENCODING = None
+
+# tokens the chat format adds around every message
+MESSAGE_OVERHEAD = 4
+
+SUMMARY_PROMPT = (
+    "You maintain the memory of a conversation between a user and their voice assistant. "
+    "Merge the previous summary and the new exchanges into one short summary written in the third person. "
+    "Keep names, dates, places, decisions, open requests and facts returned by tools; drop greetings and filler."
+)
+
+Summarizer = Callable[[str, List[Dict[str, Any]]], Awaitable[str]]
+
+
+def count_tokens(text: str) -> int:
+    """
+    Number of tokens of `text`: exact with tiktoken installed, about four characters per token otherwise.
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(message: Dict[str, Any]) -> int:
+    """
+    Number of tokens a chat message takes in a request.
+    """
+    content = message.get("content")
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    tokens = MESSAGE_OVERHEAD + count_tokens(content or "")
+    if message.get("tool_calls"):
+        tokens += count_tokens(json.dumps(message["tool_calls"], default=str))
+    return tokens
+
+
+def format_transcript(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"{message['role']}: {message.get('content') or json.dumps(message.get('tool_calls'), default=str)}"
+                     for message in messages)
+
+
+class LLMSummarizer:
+    """
+    Summarizer calling a chat completion at background priority, so that it never delays an interactive request.
+    """
+
+    def __init__(self, client, model: str, max_tokens: int = 300):
+        """
+        Args:
+            client: Asynchronous OpenAI client.
+            model (str): Deployment used for the summaries.
+            max_tokens (int): Maximum length of a summary.
+        """
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+
+    async def __call__(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        content = f"Previous summary:\n{summary or '(none)'}\n\nNew exchanges:\n{format_transcript(messages)}"
+        with priority(BACKGROUND):
+            completion = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": content}],
+                max_tokens=self.max_tokens,
+                temperature=0,
+            )
+        return (completion.choices[0].message.content or "").strip()
+
+
+class ConversationContext:
+    """
+    Conversation history kept within a token budget.
+
+    The most recent turns are sent verbatim. Once they grow past `summarize_at` of the budget, the oldest ones
+    are folded into a rolling summary by a background task; they stay in the window until the summary is ready,
+    unless the hard budget forces them out earlier. A turn starts with a user message and holds everything
+    up to the next one.
+
+    Usage:
+        context = ConversationContext(budget=6000, summarizer=LLMSummarizer(client, model))
+        context.append({"role": "user", "content": prompt})
+        messages = prompt_assembler.messages(context.messages())
+    """
+
+    def __init__(self, budget: int = 6000, summarize_at: float = 0.75, min_turns: int = 2,
+                 summarizer: Optional[Summarizer] = None):
+        """
+        Args:
+            budget (int): Maximum number of tokens of the history, summary included.
+            summarize_at (float): Fraction of the budget above which older turns are summarized.
+            min_turns (int): Number of most recent turns never folded or dropped.
+            summarizer (Optional[Summarizer]): Coroutine function `(summary, messages) -> summary`.
+                Older turns are dropped without summary when None.
+        """
+        self.budget = budget
+        self.summarize_at = summarize_at
+        self.min_turns = min_turns
+        self.summarizer = summarizer
+        self.summary: str = ""
+        self.turns: List[List[Dict[str, Any]]] = []
+        self.transcript: List[Dict[str, Any]] = []
+        self._turn_tokens: List[int] = []
+        self._summary_tokens = 0
+        # number of leading turns handed to the running summary task
+        self._folding = 0
+        # messages pushed out of the window and waiting for the next summary
+        self._pending: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def tokens(self) -> int:
+        return self._summary_tokens + sum(self._turn_tokens)
+
+    def append(self, message: Dict[str, Any]) -> None:
+        """
+        Add a message to the conversation; a user message starts a new turn.
+        """
+        self.transcript.append(message)
+        if message["role"] == "user" or not self.turns:
+            self.turns.append([])
+            self._turn_tokens.append(0)
+        self.turns[-1].append(message)
+        self._turn_tokens[-1] += count_message_tokens(message)
+        self._fit()
+
+    def extend(self, messages: List[Dict[str, Any]]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def messages(self) -> List[Dict[str, Any]]:
+        """
+        The history to send: the summary of the older turns, then the recent turns.
+        """
+        messages = [message for turn in self.turns for message in turn]
+        if self.summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        return messages
+
+    def _foldable(self) -> int:
+        return max(0, len(self.turns) - self.min_turns)
+
+    def _fit(self) -> None:
+        if self.summarizer is not None and self._task is None and self.tokens > self.budget * self.summarize_at:
+            count, tokens = 0, self.tokens
+            # fold enough turns to go back under half the threshold
+            while count < self._foldable() and tokens > self.budget * self.summarize_at / 2:
+                tokens -= self._turn_tokens[count]
+                count += 1
+            if count or self._pending:
+                self._start_summary(count)
+        while self.tokens > self.budget and self._foldable():
+            self._drop_oldest()
+
+    def _drop_oldest(self) -> None:
+        turn = self.turns.pop(0)
+        self._turn_tokens.pop(0)
+        if self._folding:
+            self._folding -= 1
+        elif self.summarizer is not None:
+            self._pending.extend(turn)
+        else:
+            logger.warning("Dropped a turn of {n} messages from the conversation context without summary", n=len(turn))
+
+    def _start_summary(self, count: int) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._folding = count
+        pending, self._pending = self._pending, []
+        self._task = loop.create_task(self._summarize(pending, self.turns[:count]))
+
+    async def _summarize(self, pending: List[Dict[str, Any]], folded: List[List[Dict[str, Any]]]) -> None:
+        messages = pending + [message for turn in folded for message in turn]
+        try:
+            summary = await self.summarizer(self.summary, messages)
+        except Exception as exc:
+            # turns dropped for the budget meanwhile wait for the next summary with the older pending ones,
+            # the turns still in the window stay there; the next append tries again
+            logger.warning("Conversation summary failed: {e}", e=exc)
+            dropped = folded[:len(folded) - self._folding]
+            self._pending[:0] = pending + [message for turn in dropped for message in turn]
+            self._folding = 0
+            return
+        finally:
+            self._task = None
+        for _ in range(self._folding):
+            self.turns.pop(0)
+            self._turn_tokens.pop(0)
+        self._folding = 0
+        self.summary = summary
+        self._summary_tokens = count_message_tokens({"role": "system", "content": summary}) if summary else 0
+        logger.info("Folded {n} messages into the conversation summary, context: {t}/{b} tokens",
+                    n=len(messages), t=self.tokens, b=self.budget)
+
+    async def wait(self) -> None:
+        """
+        Wait for the running summary, if any.
+        """
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
@@ -7,6 +7,7 @@ from src.settings import settings
 from src.text_splitter import CRecursiveTextSplitter
 from src.document import Document
 from src.cosine_sim import cosine_similarity
+from src.clients import get_embeddings_client, get_async_embeddings_client
 import torch
 
 VDB = TypeVar("VDB", bound="VectorDatabase")
@@ -20,20 +21,47 @@ class VectorDatabase(Runnable):
         #self.client = AzureOpenAI(api_key=settings.AZURE_OPENAI_API_KEY, api_version=settings.AZURE_OPENAI_API_VERSION, azure_endpoint=settings.AZURE_OPENAI_ENDPOINT)
         
     def acreate_embeddings(self, text: Union[str, List[str]], embedding_model_name: str="text-embedding-ada-002") -> Union[List[float], List[List[float]]]:
-        if (settings.AZURE_OPENAI_API_KEY is None or settings.AZURE_OPENAI_API_VERSION is None or settings.AZURE_OPENAI_ENDPOINT is None):
-            raise ValueError(
-                "Some of them are missing or set wrong: api_key, api_version, azure_endpoint"
-            )
-        async_client = AzureOpenAI(api_key=settings.AZURE_OPENAI_API_KEY, api_version=settings.AZURE_OPENAI_API_VERSION, azure_endpoint=settings.AZURE_OPENAI_ENDPOINT)
+        self._check_settings()
+        client = get_embeddings_client()
         if isinstance(text, str):
-            embeddings = async_client.embeddings.create(input=text, model=embedding_model_name)
+            embeddings = client.embeddings.create(input=text, model=embedding_model_name)
             return torch.Tensor(embeddings.data[0].embedding)
         elif isinstance(text, list) and all(isinstance(item, str) for item in text):
-            list_of_embeddings = async_client.embeddings.create(input=text, model=embedding_model_name)
+            list_of_embeddings = client.embeddings.create(input=text, model=embedding_model_name)
             return [torch.Tensor(embeddings.embedding) for embeddings in list_of_embeddings.data]
         raise ValueError(
             "Type of the input is not supported. It must be string or list of strings."
         )
+
+    async def aembed(self, text: Union[str, List[str]], embedding_model_name: str="text-embedding-ada-002") -> Union[torch.Tensor, List[torch.Tensor]]:
+        """
+        Natively asynchronous counterpart of `acreate_embeddings`.
+
+        Args:
+            text (Union[str, List[str]]): A text, or several texts embedded in a single request.
+            embedding_model_name (str): Name of the embedding deployment.
+
+        Returns:
+            Union[torch.Tensor, List[torch.Tensor]]: The embedding of the text, or one per text.
+        """
+        self._check_settings()
+        client = get_async_embeddings_client()
+        if isinstance(text, str):
+            embeddings = await client.embeddings.create(input=text, model=embedding_model_name)
+            return torch.Tensor(embeddings.data[0].embedding)
+        elif isinstance(text, list) and all(isinstance(item, str) for item in text):
+            list_of_embeddings = await client.embeddings.create(input=text, model=embedding_model_name)
+            return [torch.Tensor(embeddings.embedding) for embeddings in list_of_embeddings.data]
+        raise ValueError(
+            "Type of the input is not supported. It must be string or list of strings."
+        )
+
+    @staticmethod
+    def _check_settings() -> None:
+        if (settings.AZURE_OPENAI_API_KEY is None or settings.AZURE_OPENAI_API_VERSION is None or settings.AZURE_OPENAI_ENDPOINT is None):
+            raise ValueError(
+                "Some of them are missing or set wrong: api_key, api_version, azure_endpoint"
+            )
         
     @classmethod
     async def afrom_documents(cls: Type[VDB], documents: List[Document], embedding_model_name: str="text-embedding-ada-002", splitter: Optional[CRecursiveTextSplitter] = None) -> VDB:
@@ -67,6 +95,85 @@ class VectorDatabase(Runnable):
             texts=docs_list
         )
     
+    def add_documents(self, documents: List[Document]) -> List[int]:
+        """
+        Append already embedded documents to the store, assigning each one a fresh chunk id.
+
+        Args:
+            documents (List[Document]): Documents whose embeddings are already computed.
+
+        Returns:
+            List[int]: The chunk ids assigned to the documents, in order.
+        """
+        if self.texts is None:
+            self.texts = []
+        next_id = max((doc.id for doc in self.texts if doc.id is not None), default=-1) + 1
+        ids = []
+        for chunk_id, doc in enumerate(documents, start=next_id):
+            doc.id = chunk_id
+            ids.append(chunk_id)
+        self.texts.extend(documents)
+        return ids
+
+    def delete(self, ids: List[int]) -> int:
+        """
+        Remove the documents with the given chunk ids from the store.
+
+        Args:
+            ids (List[int]): Chunk ids to be removed.
+
+        Returns:
+            int: Number of documents removed.
+        """
+        if not self.texts or not ids:
+            return 0
+        ids = set(ids)
+        before = len(self.texts)
+        # in-place so retrievers sharing this list see the deletion
+        self.texts[:] = [doc for doc in self.texts if doc.id not in ids]
+        return before - len(self.texts)
+
+    def save(self, path: Union[str, os.PathLike]) -> None:
+        """
+        Persist the documents and their embeddings to disk. The file is written atomically.
+
+        Args:
+            path (Union[str, os.PathLike]): Destination file.
+        """
+        texts = self.texts or []
+        payload = {
+            "ids": [doc.id for doc in texts],
+            "page_contents": [doc.page_content for doc in texts],
+            "metadatas": [doc.metadata for doc in texts],
+            "embeddings": [doc.embeddings for doc in texts],
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        torch.save(payload, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls: Type[VDB], path: Union[str, os.PathLike], k: Optional[int]=5) -> VDB:
+        """
+        Load a store previously written with `save`.
+
+        Args:
+            path (Union[str, os.PathLike]): File written by `save`.
+            k (Optional[int]): Number of documents to be retrieved.
+
+        Returns:
+            VectorDatabase: The restored store.
+        """
+        # metadata holds arbitrary PDF objects, so this cannot be a weights-only load
+        payload = torch.load(path, weights_only=False)
+        texts = [
+            Document(page_content=page_content, id=doc_id, metadata=metadata, embeddings=embeddings)
+            for doc_id, page_content, metadata, embeddings in zip(
+                payload["ids"], payload["page_contents"], payload["metadatas"], payload["embeddings"]
+            )
+        ]
+        return cls(texts=texts, k=k)
+
     def as_retriever(self, k=5):
         return VectorDatabase(
             texts = self.texts,
@@ -86,9 +193,32 @@ class VectorDatabase(Runnable):
         Returns:
                 
         """
-        similarities = []
         question_embedding = self.acreate_embeddings(question)
+        return self._rank(question_embedding)
+
+    def process_batch(self, questions, *args, max_concurrency=None, **kwargs):
+        """
+        Query the database with several questions, embedding all of them in a single request.
 
+        Args:
+            questions (List[str]): Questions for vector database to be queried.
+
+        Returns:
+            list: The context retrieved for each question, in order.
+        """
+        question_embeddings = self.acreate_embeddings(list(questions))
+        return [self._rank(question_embedding) for question_embedding in question_embeddings]
+
+    async def aprocess(self, question, *args, **kwargs):
+        question_embedding = await self.aembed(question)
+        return self._rank(question_embedding)
+
+    async def aprocess_batch(self, questions, *args, max_concurrency=None, **kwargs):
+        question_embeddings = await self.aembed(list(questions))
+        return [self._rank(question_embedding) for question_embedding in question_embeddings]
+
+    def _rank(self, question_embedding):
+        similarities = []
 
         for doc in self.texts:
             similarity = cosine_similarity(question_embedding, doc.embeddings)
@@ -96,7 +226,6 @@ class VectorDatabase(Runnable):
 
         similarities.sort(key=lambda x: x[1], reverse=True)
 
-        final_context = "\n\n".join(doc[0].page_content for doc in similarities)
         return "\n\n".join(doc[0].page_content for doc in similarities)
 
 
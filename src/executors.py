@@ -0,0 +1,233 @@
+import asyncio
+import atexit
+import contextvars
+import os
+import sys
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Literal, Optional
+
+from src.runnables import Runnable
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:
+    import torch
+except ImportError:  # pragma: no cover
+    torch = None
+
+
+_executors: Dict[str, Executor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind: Literal["thread", "process"]) -> Executor:
+    """
+    Return the process-wide pool of the given kind, creating it on first use.
+
+    Args:
+        kind (str): "thread" or "process".
+
+    Returns:
+        Executor: The shared pool.
+    """
+    with _executors_lock:
+        if kind not in _executors:
+            if kind == "thread":
+                _executors[kind] = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4),
+                                                      thread_name_prefix="smallchain")
+            elif kind == "process":
+                if os.name == "posix":
+                    # forked workers inherit the tracker only if it runs already; otherwise each starts its own,
+                    # which warns about the segments it registered and unlinks them a second time at exit
+                    resource_tracker.ensure_running()
+                _executors[kind] = ProcessPoolExecutor(max_workers=os.cpu_count())
+            else:
+                raise ValueError(f"Executor kind must be 'thread' or 'process', got '{kind}'.")
+        return _executors[kind]
+
+
+@atexit.register
+def shutdown_executors() -> None:
+    """
+    Shut down the shared pools.
+    """
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+
+
+class SharedArray:
+    """
+    Picklable handle to an array placed in a shared memory segment.
+    """
+
+    def __init__(self, name: str, shape: tuple, dtype: str, is_tensor: bool):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.is_tensor = is_tensor
+
+
+def _open_segment(name: Optional[str] = None, size: int = 0, track: bool = True) -> shared_memory.SharedMemory:
+    """
+    Create a segment (without `name`) or attach to an existing one. Only the process that unlinks a segment
+    tracks it.
+
+    Before Python 3.13 every handle registers the segment with the resource tracker and `unlink` unregisters it
+    once. The workers share the tracker of the parent (see `get_executor`), where a segment is registered once
+    whatever the number of handles, so the parent's `unlink` leaves nothing behind.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, create=name is None, size=size, track=track)
+    return shared_memory.SharedMemory(name=name, create=name is None, size=size)
+
+
+def _pack(obj: Any, min_bytes: int, segments: List[shared_memory.SharedMemory], track: bool = True) -> Any:
+    """
+    Replace the NumPy arrays and torch tensors of at least `min_bytes` found in `obj`
+    (recursively through dicts, lists and tuples) by shared memory handles. With `track=False` the
+    segments are handed over to the process that unpacks them.
+    """
+    if isinstance(obj, dict):
+        return {key: _pack(value, min_bytes, segments, track) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_pack(value, min_bytes, segments, track) for value in obj)
+
+    is_tensor = torch is not None and isinstance(obj, torch.Tensor)
+    if is_tensor:
+        array = obj.detach().cpu().numpy()
+    elif np is not None and isinstance(obj, np.ndarray) and obj.dtype != object:
+        array = obj
+    else:
+        return obj
+    if array.nbytes < min_bytes:
+        return obj
+
+    segment = _open_segment(size=array.nbytes, track=track)
+    segments.append(segment)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+    return SharedArray(segment.name, array.shape, array.dtype.str, is_tensor)
+
+
+def _unpack(obj: Any, segments: List[shared_memory.SharedMemory], copy: bool, track: bool = True) -> Any:
+    """
+    Inverse of `_pack`. With `copy=False` the arrays are views onto the shared segments,
+    which must then stay open while they are used. Only the process that unlinks the segments tracks them.
+    """
+    if isinstance(obj, dict):
+        return {key: _unpack(value, segments, copy, track) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_unpack(value, segments, copy, track) for value in obj)
+    if not isinstance(obj, SharedArray):
+        return obj
+
+    segment = _open_segment(name=obj.name, track=track)
+    segments.append(segment)
+    array = np.ndarray(obj.shape, dtype=np.dtype(obj.dtype), buffer=segment.buf)
+    if copy:
+        array = array.copy()
+    return torch.from_numpy(array) if obj.is_tensor else array
+
+
+def _release(segments: List[shared_memory.SharedMemory], unlink: bool) -> None:
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            # a view onto the segment is still referenced, it is closed when collected
+            pass
+        if unlink:
+            segment.unlink()
+
+
+def _invoke_in_process(runnable: Runnable, packed_data: Any, min_bytes: int, args: tuple, kwargs: dict) -> Any:
+    """
+    Worker-side entry point of `RunnableExecutor(kind="process")`.
+    """
+    input_segments: List[shared_memory.SharedMemory] = []
+    output_segments: List[shared_memory.SharedMemory] = []
+    try:
+        # the caller owns every segment: it unlinks the input ones and copies the output out of the others
+        # before unlinking them
+        data = _unpack(packed_data, input_segments, copy=False, track=False)
+        result = runnable.invoke(data, *args, **kwargs)
+        packed_result = _pack(result, min_bytes, output_segments, track=False)
+        del data, result
+        return packed_result
+    finally:
+        _release(input_segments, unlink=False)
+        _release(output_segments, unlink=False)
+
+
+class RunnableExecutor(Runnable):
+    """
+    Run a runnable in the shared thread or process pool.
+
+    CPU-bound steps (PDF parsing, splitting, scoring) hold the GIL; with `kind="process"` they run
+    on another core. Large NumPy arrays and torch tensors in the input and output are exchanged
+    through shared memory instead of being pickled. The wrapped runnable itself must be picklable
+    in that case.
+    """
+
+    def __init__(self, runnable: Runnable, kind: Literal["thread", "process"] = "thread",
+                 shared_memory_threshold: int = 1 << 20):
+        """
+        Args:
+            runnable (Runnable): The runnable to run in the pool.
+            kind (str): "thread" or "process".
+            shared_memory_threshold (int): Arrays of at least this many bytes go through shared memory.
+        """
+        super().__init__()
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Executor kind must be 'thread' or 'process', got '{kind}'.")
+        self.runnable = runnable
+        self.kind = kind
+        self.shared_memory_threshold = shared_memory_threshold
+
+    def submit(self, data, *args, **kwargs) -> Future:
+        """
+        Start the wrapped runnable in the pool without waiting for it.
+
+        Returns:
+            Future: Resolves to the output of the wrapped runnable.
+        """
+        executor = get_executor(self.kind)
+        if self.kind == "thread":
+            context = contextvars.copy_context()
+            return executor.submit(context.run, self.runnable.invoke, data, *args, **kwargs)
+
+        input_segments: List[shared_memory.SharedMemory] = []
+        packed_data = _pack(data, self.shared_memory_threshold, input_segments)
+        result_future: Future = Future()
+
+        def on_done(future: Future) -> None:
+            _release(input_segments, unlink=True)
+            try:
+                output_segments: List[shared_memory.SharedMemory] = []
+                result = _unpack(future.result(), output_segments, copy=True)
+                _release(output_segments, unlink=True)
+            except BaseException as e:
+                result_future.set_exception(e)
+            else:
+                result_future.set_result(result)
+
+        try:
+            future = executor.submit(_invoke_in_process, self.runnable, packed_data,
+                                     self.shared_memory_threshold, args, kwargs)
+        except BaseException:
+            _release(input_segments, unlink=True)
+            raise
+        future.add_done_callback(on_done)
+        return result_future
+
+    def process(self, data, *args, **kwargs):
+        return self.submit(data, *args, **kwargs).result()
+
+    async def aprocess(self, data, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(data, *args, **kwargs))
@@ -0,0 +1,463 @@
+"""
+Local stand-in for the Azure OpenAI endpoints used by the project, for offline and reproducible benchmarks.
+
+Serves chat completions (JSON and SSE streaming, the `<tool>` text protocol of src/prompts.py and native
+tool calls), embeddings, speech (streamed PCM) and transcriptions, on both the Azure
+(`/openai/deployments/{deployment}/...`) and the OpenAI (`/v1/...`) paths, with configurable latency
+distributions, token rates and error injection.
+
+Usage:
+    python -m src.fake_server --port 8089 --ttft lognormal:-1.6,0.6 --tokens-per-second 60 --error-rate 0.02
+
+then point every AZURE_OPENAI_*_ENDPOINT setting to http://127.0.0.1:8089 (any key and API version work).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from loguru import logger
+from pydantic import BaseModel, Field
+
+_SCHEMA_BLOCK = re.compile(r"```json\s*(\{.*?\})\s*```", re.DOTALL)
+_WORD = re.compile(r"\w+")
+_FILLER = ("sure", "here", "is", "what", "I", "found", "for", "you", "and", "it", "looks", "like", "the",
+           "answer", "should", "help", "with", "that", "today", "let", "me", "know", "if", "anything", "else")
+
+
+class Latency(BaseModel):
+    """
+    Latency distribution, written "const:0.2", "uniform:0.1,0.5", "normal:0.3,0.05", "lognormal:-1.6,0.6"
+    or "exp:0.3" (seconds; lognormal takes the mean and deviation of the underlying normal).
+    """
+    kind: str = "const"
+    params: List[float] = [0.0]
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        kind, _, params = spec.partition(":")
+        if kind not in ("const", "uniform", "normal", "lognormal", "exp"):
+            raise ValueError(f"Unknown latency distribution '{kind}'.")
+        return cls(kind=kind, params=[float(p) for p in params.split(",") if p] or [0.0])
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(p[0], p[1])
+        elif self.kind == "exp":
+            value = rng.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        else:
+            value = p[0]
+        return max(0.0, value)
+
+
+class FakeServerConfig(BaseModel):
+    seed: int = 0
+    ttft: Latency = Field(default_factory=lambda: Latency(kind="lognormal", params=[-1.6, 0.5]))
+    tokens_per_second: float = 80.0
+    completion_tokens: int = 60
+    embedding_latency: Latency = Field(default_factory=lambda: Latency(kind="const", params=[0.05]))
+    embedding_dimensions: int = 1536
+    speech_latency: Latency = Field(default_factory=lambda: Latency(kind="const", params=[0.15]))
+    # how much faster than real time the PCM audio is streamed
+    speech_speed: float = 1.0
+    speech_sample_rate: int = 24000
+    transcription_latency: Latency = Field(default_factory=lambda: Latency(kind="const", params=[0.3]))
+    transcripts: List[str] = ["What is the weather like in Istanbul today?"]
+    error_rate: float = 0.0
+    error_status: int = 429
+    retry_after: float = 1.0
+    # Azure caches prompt prefixes of at least 1024 tokens, in 128-token steps
+    prefix_cache_min_tokens: int = 1024
+    prefix_cache_block_tokens: int = 128
+
+
+def count_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / 4)) if text else 0
+
+
+class FakeOpenAIServer:
+    """
+    Request handlers and the state they share (prefix cache, counters).
+    """
+
+    def __init__(self, config: Optional[FakeServerConfig] = None):
+        self.config = config or FakeServerConfig()
+        self.requests: Counter = Counter()
+        self.errors = 0
+        self._occurrences: Counter = Counter()
+        self._prefixes: set = set()
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        for prefix in ("/openai/deployments/{deployment}", "/v1", ""):
+            app.router.add_post(prefix + "/chat/completions", self.chat_completions)
+            app.router.add_post(prefix + "/embeddings", self.embeddings)
+            app.router.add_post(prefix + "/audio/speech", self.speech)
+            app.router.add_post(prefix + "/audio/transcriptions", self.transcriptions)
+        app.router.add_get("/stats", self.stats)
+        return app
+
+    def _rng(self, body: Any) -> random.Random:
+        # the same request draws the same latencies in every run, whatever the concurrency
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+        self._occurrences[digest] += 1
+        return random.Random(f"{self.config.seed}:{digest}:{self._occurrences[digest]}")
+
+    def _injected_error(self, rng: random.Random) -> Optional[web.Response]:
+        if rng.random() >= self.config.error_rate:
+            return None
+        self.errors += 1
+        status = self.config.error_status
+        headers = {}
+        if status == 429:
+            headers = {"retry-after": str(self.config.retry_after),
+                       "retry-after-ms": str(int(self.config.retry_after * 1000))}
+        return web.json_response({"error": {"code": str(status), "message": "Injected error from the fake server."}},
+                                 status=status, headers=headers)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"requests": dict(self.requests), "errors": self.errors})
+
+    # chat completions
+
+    def _cached_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Simulate prompt caching: the longest already seen prefix of the prompt, in blocks.
+        """
+        prompt = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+        cached = 0
+        for end in range(self.config.prefix_cache_min_tokens * 4, len(prompt) + 1, self.config.prefix_cache_block_tokens * 4):
+            digest = hashlib.sha256(prompt[:end].encode()).digest()
+            if digest in self._prefixes:
+                cached = end // 4
+            self._prefixes.add(digest)
+        return cached
+
+    @staticmethod
+    def _text_tools(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Function schemas listed in the system prompt for the `<tool>` protocol.
+        """
+        system = " ".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+        schemas = []
+        for block in _SCHEMA_BLOCK.findall(system):
+            try:
+                schema = json.loads(block)
+            except json.JSONDecodeError:
+                continue
+            if schema.get("name"):
+                schemas.append(schema)
+        return schemas
+
+    @staticmethod
+    def _pick_tools(text: str, schemas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Tools whose name words appear in the user's message, best match first.
+        """
+        text = text.lower()
+        scored = []
+        for schema in schemas:
+            words = [word.rstrip("s") for word in schema["name"].lower().split("_") if len(word) > 2 and word != "data"]
+            score = sum(word in text for word in words)
+            # the verb alone (get, read, ...) does not make a match
+            if score and any(word in text for word in words[1:] or words):
+                scored.append((score, schema))
+        scored.sort(key=lambda item: -item[0])
+        return [schema for _, schema in scored]
+
+    @staticmethod
+    def _arguments(schema: Dict[str, Any], text: str) -> Dict[str, Any]:
+        properties = schema.get("properties") or {}
+        words = _WORD.findall(text)
+        arguments = {}
+        for name in schema.get("required") or list(properties)[:1]:
+            spec = properties.get(name, {})
+            kind = spec.get("type", "string")
+            if "default" in spec:
+                arguments[name] = spec["default"]
+            elif "enum" in spec:
+                arguments[name] = spec["enum"][0]
+            elif kind == "integer":
+                arguments[name] = 1
+            elif kind == "number":
+                arguments[name] = 1.0
+            elif kind == "boolean":
+                arguments[name] = True
+            elif kind == "array":
+                arguments[name] = []
+            elif spec.get("format") == "date-time":
+                arguments[name] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            else:
+                example = spec.get("examples")
+                capitalized = [word for word in words[1:] if word[:1].isupper()]
+                arguments[name] = capitalized[-1] if capitalized else (example if isinstance(example, str) else words[-1] if words else "")
+        return arguments
+
+    def _answer(self, body: Dict[str, Any], rng: random.Random) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Text and native tool calls of the simulated answer.
+        """
+        messages = body.get("messages") or []
+        # system messages after the conversation carry context (date, tool output), not a question
+        last = next((message for message in reversed(messages) if message.get("role") != "system"), {})
+        user_text = str(last.get("content") or "") if last.get("role") == "user" else ""
+        # answer the question once the tool output is in the conversation
+        if user_text and "Context:" not in user_text:
+            if body.get("tools"):
+                schemas = [dict(tool["function"].get("parameters") or {}, name=tool["function"]["name"])
+                           for tool in body["tools"] if tool.get("type") == "function"]
+                picked = self._pick_tools(user_text, schemas)
+                if picked:
+                    if body.get("parallel_tool_calls") is False:
+                        picked = picked[:1]
+                    return "", [
+                        {"id": f"call_{rng.getrandbits(48):012x}", "type": "function",
+                         "function": {"name": schema["name"], "arguments": json.dumps(self._arguments(schema, user_text))}}
+                        for schema in picked
+                    ]
+            picked = self._pick_tools(user_text, self._text_tools(messages))
+            if picked:
+                call = {"name": picked[0]["name"], "parameters": self._arguments(picked[0], user_text)}
+                return f"<tool>{json.dumps(call)}</tool>", []
+
+        question = " ".join(_WORD.findall(user_text)[:12]) or "your request"
+        words = ["This", "is", "a", "simulated", "answer", "about", *question.split()]
+        while len(words) < self.config.completion_tokens:
+            words.append(rng.choice(_FILLER))
+        return " ".join(words[:max(self.config.completion_tokens, 1)]) + ".", []
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests["chat.completions"] += 1
+        rng = self._rng(body)
+        if (error := self._injected_error(rng)) is not None:
+            return error
+
+        model = request.match_info.get("deployment") or body.get("model", "fake-model")
+        messages = body.get("messages") or []
+        prompt_tokens = count_tokens(json.dumps(messages, ensure_ascii=False)) + count_tokens(json.dumps(body.get("tools") or []))
+        cached_tokens = self._cached_tokens(messages)
+        text, tool_calls = self._answer(body, rng)
+        pieces = re.findall(r"\S+\s*", text) if text else []
+        completion_tokens = len(pieces) + sum(count_tokens(call["function"]["arguments"]) + 1 for call in tool_calls)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens,
+                 "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+        completion_id = f"chatcmpl-{rng.getrandbits(64):016x}"
+        created = int(time.time())
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        ttft = self.config.ttft.sample(rng)
+        token_delay = 1 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + token_delay * completion_tokens)
+            return web.json_response({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": finish_reason,
+                             "message": {"role": "assistant", "content": text or None, "tool_calls": tool_calls or None}}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        header = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+
+        async def send(chunk: Dict[str, Any]) -> None:
+            await response.write(b"data: " + json.dumps(dict(header, **chunk)).encode() + b"\n\n")
+
+        await asyncio.sleep(ttft)
+        # Azure opens with the prompt filter results, a chunk without choices
+        await send({"choices": [], "prompt_filter_results": []})
+        await send({"choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+        for piece in pieces:
+            await asyncio.sleep(token_delay)
+            await send({"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+        for index, call in enumerate(tool_calls):
+            await send({"choices": [{"index": 0, "finish_reason": None, "delta": {"tool_calls": [
+                {"index": index, "id": call["id"], "type": "function", "function": {"name": call["function"]["name"], "arguments": ""}}
+            ]}}]})
+            arguments = call["function"]["arguments"]
+            for start in range(0, len(arguments), 8):
+                await asyncio.sleep(token_delay * 2)
+                await send({"choices": [{"index": 0, "finish_reason": None, "delta": {"tool_calls": [
+                    {"index": index, "function": {"arguments": arguments[start:start + 8]}}
+                ]}}]})
+        await send({"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send({"choices": [], "usage": usage})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    # embeddings
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests["embeddings"] += 1
+        rng = self._rng(body)
+        if (error := self._injected_error(rng)) is not None:
+            return error
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(self.config.embedding_latency.sample(rng))
+        dimensions = body.get("dimensions") or self.config.embedding_dimensions
+        tokens = sum(count_tokens(text) for text in texts)
+        return web.json_response({
+            "object": "list",
+            "model": request.match_info.get("deployment") or body.get("model", "fake-embedding"),
+            "data": [{"object": "embedding", "index": i, "embedding": embed(text, dimensions)} for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    # audio
+
+    async def speech(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests["audio.speech"] += 1
+        rng = self._rng(body)
+        if (error := self._injected_error(rng)) is not None:
+            return error
+        await asyncio.sleep(self.config.speech_latency.sample(rng))
+        rate = self.config.speech_sample_rate
+        # about 2.5 spoken words per second
+        duration = max(0.3, len(str(body.get("input", "")).split()) / 2.5)
+        response = web.StreamResponse(headers={"Content-Type": "audio/pcm"})
+        await response.prepare(request)
+        chunk_seconds = 0.1
+        for start in range(0, int(duration / chunk_seconds)):
+            samples = int(rate * chunk_seconds)
+            offset = start * samples
+            # a quiet tone, recognisable when played
+            pcm = b"".join(struct.pack("<h", int(1500 * math.sin(2 * math.pi * 220 * (offset + i) / rate)))
+                           for i in range(samples))
+            await response.write(pcm)
+            await asyncio.sleep(chunk_seconds / self.config.speech_speed)
+        await response.write_eof()
+        return response
+
+    async def transcriptions(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        self.requests["audio.transcriptions"] += 1
+        audio = form.get("file")
+        size = len(audio.file.read()) if hasattr(audio, "file") else 0
+        rng = self._rng({"size": size, "model": form.get("model")})
+        if (error := self._injected_error(rng)) is not None:
+            return error
+        await asyncio.sleep(self.config.transcription_latency.sample(rng))
+        text = self.config.transcripts[(self.requests["audio.transcriptions"] - 1) % len(self.config.transcripts)]
+        if form.get("response_format", "json") == "text":
+            return web.Response(text=text, content_type="text/plain")
+        return web.json_response({"text": text})
+
+
+@lru_cache(maxsize=65536)
+def _word_vector(word: str, dimensions: int) -> Tuple[float, ...]:
+    rng = random.Random(hashlib.sha256(word.encode()).digest())
+    return tuple(rng.gauss(0.0, 1.0) for _ in range(dimensions))
+
+
+def embed(text: str, dimensions: int = 1536) -> List[float]:
+    """
+    Deterministic unit embedding of `text`: the sum of a pseudo-random vector per word, so that texts
+    sharing words are close to each other.
+    """
+    vector = [0.0] * dimensions
+    for word in _WORD.findall(text.lower()) or [""]:
+        for i, value in enumerate(_word_vector(word, dimensions)):
+            vector[i] += value
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class FakeServer:
+    """
+    Run the fake server in the current event loop, e.g. in a benchmark.
+
+    Usage:
+        async with FakeServer(FakeServerConfig(error_rate=0.1)) as server:
+            client = AsyncAzureOpenAI(azure_endpoint=server.url, api_key="fake", api_version="2024-06-01")
+    """
+
+    def __init__(self, config: Optional[FakeServerConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.server = FakeOpenAIServer(config)
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def __aenter__(self) -> "FakeServer":
+        self._runner = web.AppRunner(self.server.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # resolve the port picked by the system when 0 was asked for
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible fake server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ttft", default="lognormal:-1.6,0.5", help="time to first token distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--embedding-latency", default="const:0.05")
+    parser.add_argument("--speech-latency", default="const:0.15")
+    parser.add_argument("--speech-speed", type=float, default=1.0)
+    parser.add_argument("--transcription-latency", default="const:0.3")
+    parser.add_argument("--transcript", action="append", help="text returned by transcriptions, in turn")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--print-env", action="store_true", help="print .env lines pointing the app to the server")
+    args = parser.parse_args()
+
+    if args.print_env:
+        url = f"http://{args.host}:{args.port}"
+        for service in ("", "GPT_", "TTS_", "WHISPER_"):
+            print(f"AZURE_OPENAI_{service}ENDPOINT={url}")
+            print(f"AZURE_OPENAI_{service}API_KEY=fake")
+            print(f"AZURE_OPENAI_{service}API_VERSION=2024-06-01")
+        return
+
+    config = FakeServerConfig(
+        seed=args.seed,
+        ttft=Latency.parse(args.ttft),
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        embedding_latency=Latency.parse(args.embedding_latency),
+        speech_latency=Latency.parse(args.speech_latency),
+        speech_speed=args.speech_speed,
+        transcription_latency=Latency.parse(args.transcription_latency),
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        **({"transcripts": args.transcript} if args.transcript else {}),
+    )
+    logger.info("Fake OpenAI server listening on http://{h}:{p}", h=args.host, p=args.port)
+    web.run_app(FakeOpenAIServer(config).app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+import asyncio
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.runnables import (DictTransformer, Runnable, RunnablePassthrough, RunnableSequence, _aapply_to_valid,
+                           _apply_to_valid)
+
+# name under which nodes depend on the input of the graph
+GRAPH_INPUT = "__input__"
+
+
+class GraphNode:
+    """
+    A runnable of a graph and the nodes whose outputs it consumes.
+    """
+
+    def __init__(self, name: str, runnable: Runnable, deps: Sequence[str], as_dict: bool, flat: bool):
+        self.name = name
+        self.runnable = runnable
+        self.deps = list(deps) or [GRAPH_INPUT]
+        self.as_dict = as_dict
+        # compiled nodes run only their own step, the `next` chain is part of the graph
+        self.flat = flat
+
+    def make_input(self, outputs: Dict[str, Any]) -> Any:
+        if len(self.deps) == 1 and not self.as_dict:
+            return outputs[self.deps[0]]
+        return {dep: outputs[dep] for dep in self.deps}
+
+    def run(self, data):
+        return self.runnable._run_process(data) if self.flat else self.runnable.invoke(data)
+
+    async def arun(self, data):
+        return await self.runnable._arun_process(data) if self.flat else await self.runnable.ainvoke(data)
+
+    def run_batch(self, items, max_concurrency):
+        if self.flat:
+            return _apply_to_valid(items, lambda valid: self.runnable._run_process_batch(valid, max_concurrency))
+        return self.runnable._batch(items, max_concurrency)
+
+    async def arun_batch(self, items, max_concurrency):
+        if self.flat:
+            return await _aapply_to_valid(
+                items, lambda valid: self.runnable._arun_process_batch(valid, max_concurrency)
+            )
+        return await self.runnable._abatch(items, max_concurrency)
+
+    def run_stream(self, data):
+        return self.runnable.process_stream(data) if self.flat else self.runnable.stream(data)
+
+    def arun_stream(self, data):
+        return self.runnable.aprocess_stream(data) if self.flat else self.runnable.astream(data)
+
+
+class _SelectKeys(Runnable):
+    """
+    Merge step of a compiled `DictTransformer`: renames the outputs of its branches to the mapping keys.
+    """
+
+    def __init__(self, keys: Dict[str, str]):
+        super().__init__()
+        self.keys = keys
+        self.name = "DictTransformer"
+
+    def process(self, data):
+        return {key: data[dep] for key, dep in self.keys.items()}
+
+    async def aprocess(self, data):
+        return self.process(data)
+
+    def process_batch(self, inputs, max_concurrency=None):
+        return [self.process(item) for item in inputs]
+
+    async def aprocess_batch(self, inputs, max_concurrency=None):
+        return self.process_batch(inputs)
+
+
+class RunnableGraph(Runnable):
+    """
+    Runnable made of nodes with explicit dependencies. Each node starts as soon as the outputs it
+    depends on are ready, so independent nodes (several retrievers, parallel lookups, ...) run
+    concurrently: as asyncio tasks on the asynchronous path, in a thread pool on the synchronous one.
+
+    A node without dependencies receives the input of the graph, a node with a single dependency
+    receives that node's output, and a node with several dependencies receives a dict mapping their
+    names to their outputs.
+
+    Usage:
+        graph = (RunnableGraph()
+                 .add_node("rewrite", rewriter)
+                 .add_node("dense", dense_retriever, deps=["rewrite"])
+                 .add_node("keyword", keyword_retriever, deps=["rewrite"])
+                 .add_node("answer", prompt | llm, deps=["dense", "keyword", GRAPH_INPUT]))
+        graph.invoke("question")
+
+        # or flatten an existing chain composed with `|`
+        graph = RunnableGraph.from_runnable(retrieval_chain)
+    """
+
+    def __init__(self, output: Optional[str] = None, max_concurrency: Optional[int] = None):
+        """
+        Args:
+            output (Optional[str]): Node whose output is the output of the graph, the last node added by default.
+            max_concurrency (Optional[int]): Maximum number of nodes running at the same time.
+        """
+        super().__init__()
+        self.nodes: Dict[str, GraphNode] = {}
+        self.output = output
+        self.max_concurrency = max_concurrency
+        self._order: Optional[List[GraphNode]] = None
+        self._linear = False
+
+    def add_node(self, name: str, runnable: Runnable, deps: Iterable[str] = (), as_dict: bool = False,
+                 flat: bool = False) -> "RunnableGraph":
+        """
+        Add a node to the graph.
+
+        Args:
+            name (str): Unique name of the node.
+            runnable (Runnable): The runnable run by the node.
+            deps (Iterable[str]): Names of the nodes it depends on; `GRAPH_INPUT` stands for the input of the graph.
+            as_dict (bool): Pass a dict of the dependency outputs even with a single dependency.
+            flat (bool): Run only the runnable's own step, ignoring its `next` chain.
+
+        Returns:
+            RunnableGraph: The graph itself, so that calls can be chained.
+        """
+        if name in self.nodes or name == GRAPH_INPUT:
+            raise ValueError(f"A node named '{name}' already exists in the graph.")
+        self.nodes[name] = GraphNode(name, runnable, list(deps), as_dict, flat)
+        self._order = None
+        return self
+
+    @property
+    def output_node(self) -> str:
+        if self.output is not None:
+            return self.output
+        if not self.nodes:
+            return GRAPH_INPUT
+        return next(reversed(self.nodes))
+
+    def topological_order(self) -> List[GraphNode]:
+        """
+        Nodes sorted so that every node comes after its dependencies.
+
+        Raises:
+            ValueError: If a dependency is unknown or the graph has a cycle.
+        """
+        if self._order is not None:
+            return self._order
+        if self.output_node != GRAPH_INPUT and self.output_node not in self.nodes:
+            raise ValueError(f"Output node '{self.output_node}' is not in the graph.")
+        order: List[GraphNode] = []
+        state: Dict[str, int] = {}  # 1: being visited, 2: done
+
+        def visit(name: str, path: List[str]) -> None:
+            if state.get(name) == 2 or name == GRAPH_INPUT:
+                return
+            if name not in self.nodes:
+                raise ValueError(f"Node '{path[-1]}' depends on unknown node '{name}'.")
+            if state.get(name) == 1:
+                raise ValueError(f"The graph has a cycle: {' -> '.join(path[path.index(name):] + [name])}.")
+            state[name] = 1
+            for dep in self.nodes[name].deps:
+                visit(dep, path + [name])
+            state[name] = 2
+            order.append(self.nodes[name])
+
+        for name in self.nodes:
+            visit(name, [])
+        # a plain chain of single-input nodes needs no scheduling
+        self._linear = order[-1:] == [self.nodes.get(self.output_node)] and all(
+            node.deps == [order[i - 1].name if i else GRAPH_INPUT] and not node.as_dict
+            for i, node in enumerate(order)
+        )
+        self._order = order
+        return order
+
+    def _dependents(self, order: List[GraphNode]) -> Dict[str, List[GraphNode]]:
+        dependents: Dict[str, List[GraphNode]] = {GRAPH_INPUT: []}
+        for node in order:
+            dependents.setdefault(node.name, [])
+            for dep in set(node.deps) - {GRAPH_INPUT}:
+                dependents[dep].append(node)
+        return dependents
+
+    def _run(self, data, stream_output: bool = False) -> Dict[str, Any]:
+        """
+        Run every node in dependency order. Ready nodes run in the calling thread when they are the only
+        ones, in a thread pool otherwise. With `stream_output` the output node is not run.
+        """
+        order = self.topological_order()
+        dependents = self._dependents(order)
+        waiting = {node.name: len(set(node.deps) - {GRAPH_INPUT}) for node in order}
+        outputs: Dict[str, Any] = {GRAPH_INPUT: data}
+        ready = [node for node in order if waiting[node.name] == 0]
+        skip = self.output_node if stream_output else None
+        running: Dict[Future, GraphNode] = {}
+        executor: Optional[ThreadPoolExecutor] = None
+
+        def complete(node: GraphNode, output: Any) -> None:
+            outputs[node.name] = output
+            for dependent in dependents[node.name]:
+                waiting[dependent.name] -= 1
+                if waiting[dependent.name] == 0:
+                    ready.append(dependent)
+
+        try:
+            while ready or running:
+                ready = [node for node in ready if node.name != skip]
+                if not ready and not running:
+                    break
+                if len(ready) == 1 and not running:
+                    # nothing to overlap with, skip the pool
+                    node = ready.pop()
+                    complete(node, node.run(node.make_input(outputs)))
+                    continue
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=self.max_concurrency or min(32, len(order)))
+                while ready and (self.max_concurrency is None or len(running) < self.max_concurrency):
+                    node = ready.pop(0)
+                    context = contextvars.copy_context()
+                    running[executor.submit(context.run, node.run, node.make_input(outputs))] = node
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    complete(running.pop(future), future.result())
+        finally:
+            if executor is not None:
+                for future in running:
+                    future.cancel()
+                executor.shutdown(wait=True)
+        return outputs
+
+    async def _arun(self, data, stream_output: bool = False) -> Tuple[Dict[str, Any], Dict[str, asyncio.Future]]:
+        """
+        Asynchronous counterpart of `_run`: one task per node, awaiting the tasks of its dependencies.
+        With `stream_output` it returns once the inputs of the output node are ready, along with the
+        tasks of the nodes that may still be running.
+        """
+        order = self.topological_order()
+        semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency else None
+        tasks: Dict[str, asyncio.Future] = {}
+        outputs: Dict[str, Any] = {GRAPH_INPUT: data}
+
+        async def run(node: GraphNode):
+            for dep in node.deps:
+                if dep != GRAPH_INPUT:
+                    await tasks[dep]
+            node_input = node.make_input(outputs)
+            if semaphore is None:
+                outputs[node.name] = await node.arun(node_input)
+            else:
+                async with semaphore:
+                    outputs[node.name] = await node.arun(node_input)
+
+        for node in order:
+            if not (stream_output and node.name == self.output_node):
+                tasks[node.name] = asyncio.ensure_future(run(node))
+        try:
+            if stream_output and self.output_node in self.nodes:
+                for dep in self.nodes[self.output_node].deps:
+                    if dep != GRAPH_INPUT:
+                        await tasks[dep]
+            else:
+                await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return outputs, tasks
+
+    def process(self, data):
+        order = self.topological_order()
+        if self._linear:
+            for node in order:
+                data = node.run(data)
+            return data
+        return self._run(data)[self.output_node]
+
+    async def aprocess(self, data):
+        order = self.topological_order()
+        if self._linear:
+            for node in order:
+                data = await node.arun(data)
+            return data
+        outputs, _ = await self._arun(data)
+        return outputs[self.output_node]
+
+    def process_stream(self, data):
+        """
+        Run the graph up to the output node, then stream the output node's chunks.
+        """
+        if self.output_node == GRAPH_INPUT:
+            yield data
+            return
+        node = self.nodes[self.output_node]
+        outputs = self._run(data, stream_output=True)
+        yield from node.run_stream(node.make_input(outputs))
+
+    async def aprocess_stream(self, data):
+        if self.output_node == GRAPH_INPUT:
+            yield data
+            return
+        node = self.nodes[self.output_node]
+        outputs, tasks = await self._arun(data, stream_output=True)
+        try:
+            async for chunk in node.arun_stream(node.make_input(outputs)):
+                yield chunk
+            # nodes the output does not depend on may still be running
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    def process_batch(self, inputs, max_concurrency=None):
+        """
+        Run every node on the whole batch, so that natively batching steps make one call per node.
+        """
+        outputs: Dict[str, List[Any]] = {GRAPH_INPUT: list(inputs)}
+        for node in self.topological_order():
+            outputs[node.name] = node.run_batch(self._batch_inputs(node, outputs, len(inputs)), max_concurrency)
+        return outputs[self.output_node]
+
+    async def aprocess_batch(self, inputs, max_concurrency=None):
+        outputs: Dict[str, List[Any]] = {GRAPH_INPUT: list(inputs)}
+        tasks: Dict[str, asyncio.Future] = {}
+
+        async def run(node: GraphNode):
+            for dep in node.deps:
+                if dep != GRAPH_INPUT:
+                    await tasks[dep]
+            outputs[node.name] = await node.arun_batch(self._batch_inputs(node, outputs, len(inputs)),
+                                                       max_concurrency)
+
+        for node in self.topological_order():
+            tasks[node.name] = asyncio.ensure_future(run(node))
+        await asyncio.gather(*tasks.values())
+        return outputs[self.output_node]
+
+    @staticmethod
+    def _batch_inputs(node: GraphNode, outputs: Dict[str, List[Any]], size: int) -> List[Any]:
+        items = []
+        for i in range(size):
+            values = {dep: outputs[dep][i] for dep in node.deps}
+            # an item fails in every node downstream of a failed dependency
+            error = next((value for value in values.values() if isinstance(value, BaseException)), None)
+            items.append(error if error is not None else node.make_input(values))
+        return items
+
+    @classmethod
+    def from_runnable(cls, runnable: Runnable, max_concurrency: Optional[int] = None) -> "RunnableGraph":
+        """
+        Compile a chain built with `|`, `next` and `DictTransformer` into a flat graph: each step becomes
+        a node, the branches of a `DictTransformer` run concurrently and no call recurses through the chain.
+
+        Args:
+            runnable (Runnable): The chain.
+            max_concurrency (Optional[int]): Maximum number of nodes running at the same time.
+
+        Returns:
+            RunnableGraph: A graph producing the same output as the chain.
+        """
+        graph = cls(max_concurrency=max_concurrency)
+        graph.output = graph._compile(runnable, GRAPH_INPUT)
+        graph.name = f"RunnableGraph({runnable.step_name})"
+        return graph
+
+    def _compile(self, runnable: Runnable, source: str) -> str:
+        """
+        Add the nodes of `runnable` reading the output of `source`, return the node producing its output.
+        """
+        if isinstance(runnable, RunnableSequence):
+            # a sequence delegates to its parts and ignores its own `next`
+            return self._compile(runnable.second, self._compile(runnable.first, source))
+
+        if type(runnable) is DictTransformer:
+            keys = {key: self._compile(branch, source) for key, branch in runnable.mapping.items()}
+            output = self._add_compiled(_SelectKeys(keys), sorted(set(keys.values())), as_dict=True)
+        elif type(runnable) is RunnablePassthrough:
+            output = source
+        elif type(runnable).invoke is not Runnable.invoke or type(runnable).ainvoke is not Runnable.ainvoke:
+            # custom control flow, kept as a single node
+            return self._add_compiled(runnable, [source], flat=False)
+        else:
+            output = self._add_compiled(runnable, [source])
+
+        if runnable.next is not None:
+            return self._compile(runnable.next, output)
+        return output
+
+    def _add_compiled(self, runnable: Runnable, deps: List[str], as_dict: bool = False, flat: bool = True) -> str:
+        name = f"{len(self.nodes)}:{runnable.step_name}"
+        self.add_node(name, runnable, deps, as_dict=as_dict, flat=flat)
+        return name
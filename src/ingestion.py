@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from src.database import VectorDatabase
+from src.document import Document
+from src.parse_cache import ParsedDocumentCache
+from src.pdf_file_utils import PDFDocumentLoader, file_sha256
+from src.rate_limiter import BACKGROUND, priority
+from src.text_splitter import CRecursiveTextSplitter
+
+
+class ManifestEntry(BaseModel):
+    """State of one ingested file, as recorded in the manifest."""
+
+    size: int
+    mtime: float
+    content_hash: str
+    chunk_ids: List[int] = Field(default_factory=list)
+    error: Optional[str] = None
+    # fingerprint of the splitter and embedding settings the chunks were made with
+    config: Optional[str] = None
+
+
+class IngestionStats(BaseModel):
+    """Counters of a single ingestion run."""
+
+    unchanged: int = 0
+    added: int = 0
+    updated: int = 0
+    deleted: int = 0
+    failed: int = 0
+    chunks_added: int = 0
+    chunks_deleted: int = 0
+
+
+class DirectoryIngestor:
+    """
+    Incrementally ingest a directory tree of PDFs into a persistent VectorDatabase.
+
+    A manifest keeps (path, size, mtime, content hash, chunk ids) for every file. On each run only
+    new or changed files are parsed and embedded, along with files that failed last time and files chunked
+    with other splitter or embedding settings; the chunks of deleted files are removed and progress
+    is checkpointed so that an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, directory: Union[str, os.PathLike],
+                 store_path: Optional[Union[str, os.PathLike]] = None,
+                 manifest_path: Optional[Union[str, os.PathLike]] = None,
+                 splitter: Optional[CRecursiveTextSplitter] = None,
+                 embedding_model_name: str = "text-embedding-ada-002",
+                 pattern: str = "**/*.pdf",
+                 checkpoint_every: int = 10,
+                 embedding_batch_size: int = 256,
+                 parse_cache: Optional[ParsedDocumentCache] = None):
+        """
+        Args:
+            directory (Union[str, os.PathLike]): Root of the directory tree to ingest.
+            store_path (Optional[Union[str, os.PathLike]]): Where the vector store is persisted.
+                Defaults to `<directory>/.smallchain/vectorstore.pt`.
+            manifest_path (Optional[Union[str, os.PathLike]]): Where the manifest is persisted.
+                Defaults to `<directory>/.smallchain/manifest.json`.
+            splitter (Optional[CRecursiveTextSplitter]): Splitter used to chunk the documents.
+            embedding_model_name (str): Embedding deployment name.
+            pattern (str): Glob pattern, relative to `directory`, selecting the files to ingest.
+            checkpoint_every (int): Number of processed files between two checkpoints.
+            embedding_batch_size (int): Number of chunks sent in a single embedding request.
+            parse_cache (Optional[ParsedDocumentCache]): Cache of parsed PDFs, so that re-chunking a corpus
+                with other splitter settings skips PDF parsing. Defaults to `<directory>/.smallchain/parsed_documents`.
+        """
+        self.directory = Path(directory)
+        state_dir = self.directory / ".smallchain"
+        self.store_path = Path(store_path) if store_path else state_dir / "vectorstore.pt"
+        self.manifest_path = Path(manifest_path) if manifest_path else state_dir / "manifest.json"
+        self.splitter = splitter or CRecursiveTextSplitter(chunk_size=200, chunk_overlap=0)
+        self.embedding_model_name = embedding_model_name
+        self.pattern = pattern
+        self.checkpoint_every = checkpoint_every
+        self.embedding_batch_size = embedding_batch_size
+        self.parse_cache = parse_cache if parse_cache is not None else ParsedDocumentCache(state_dir / "parsed_documents")
+        self.stats = IngestionStats()
+
+    @property
+    def config_fingerprint(self) -> str:
+        """
+        Hash of the settings that shape the chunks and their embeddings; a file chunked with other settings
+        is ingested again.
+        """
+        splitter = {key: getattr(value, "__qualname__", None) or repr(value)
+                    for key, value in sorted(vars(self.splitter).items())}
+        config = {"splitter": type(self.splitter).__qualname__, "settings": splitter,
+                  "embedding_model": self.embedding_model_name}
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def load_manifest(self) -> Dict[str, ManifestEntry]:
+        """
+        Read the manifest from disk.
+
+        Returns:
+            Dict[str, ManifestEntry]: Entries keyed by file path relative to the ingested directory.
+        """
+        if not self.manifest_path.exists():
+            return {}
+        with open(self.manifest_path, mode="r") as fp:
+            raw = json.load(fp)
+        return {path: ManifestEntry(**entry) for path, entry in raw.items()}
+
+    def _write_manifest(self, manifest: Dict[str, ManifestEntry]) -> None:
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with open(tmp_path, mode="w") as fp:
+            json.dump({path: entry.model_dump() for path, entry in manifest.items()}, fp, indent=4)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _checkpoint(self, vectorstore: VectorDatabase, manifest: Dict[str, ManifestEntry]) -> None:
+        # the store goes first: chunks not yet referenced by the manifest are pruned on resume
+        vectorstore.save(self.store_path)
+        self._write_manifest(manifest)
+        logger.info("Ingestion checkpoint written ({n} files in manifest)", n=len(manifest))
+
+    def _load_store(self, manifest: Dict[str, ManifestEntry]) -> VectorDatabase:
+        if not self.store_path.exists():
+            return VectorDatabase(texts=[])
+        vectorstore = VectorDatabase.load(self.store_path)
+        # drop chunks written by an interrupted run after its last manifest checkpoint
+        known_ids = {chunk_id for entry in manifest.values() for chunk_id in entry.chunk_ids}
+        orphans = [doc.id for doc in vectorstore.texts if doc.id not in known_ids]
+        if orphans:
+            logger.info("Pruning {n} orphaned chunks from an interrupted run", n=len(orphans))
+            vectorstore.delete(orphans)
+        return vectorstore
+
+    def _embed_file(self, vectorstore: VectorDatabase, file_path: Path, relative_path: str, content_hash: str) -> List[int]:
+        docs = PDFDocumentLoader(str(file_path), cache=self.parse_cache, content_hash=content_hash).load()
+        chunk_docs: List[Document] = []
+        for doc in docs:
+            metadata = {**doc.metadata, "source": relative_path}
+            for chunk in self.splitter.split_text(text=doc.page_content):
+                chunk_docs.append(Document(page_content=chunk, metadata=metadata))
+
+        for start in range(0, len(chunk_docs), self.embedding_batch_size):
+            batch = chunk_docs[start:start + self.embedding_batch_size]
+            embeddings = vectorstore.acreate_embeddings([doc.page_content for doc in batch], self.embedding_model_name)
+            for doc, embedding in zip(batch, embeddings):
+                doc.embeddings = embedding
+
+        return vectorstore.add_documents(chunk_docs)
+
+    def ingest(self) -> VectorDatabase:
+        """
+        Bring the persisted vector store up to date with the directory tree. Its embedding requests
+        yield to interactive calls in the shared rate limiter.
+
+        Returns:
+            VectorDatabase: The up to date vector store.
+        """
+        with priority(BACKGROUND):
+            return self._ingest()
+
+    def _ingest(self) -> VectorDatabase:
+        self.stats = IngestionStats()
+        manifest = self.load_manifest()
+        vectorstore = self._load_store(manifest)
+
+        current_files = {
+            path.relative_to(self.directory).as_posix(): path
+            for path in sorted(self.directory.glob(self.pattern))
+            if path.is_file()
+        }
+
+        # files removed since the last run
+        for relative_path in [p for p in manifest if p not in current_files]:
+            entry = manifest.pop(relative_path)
+            self.stats.chunks_deleted += vectorstore.delete(entry.chunk_ids)
+            self.stats.deleted += 1
+            logger.info("Removed chunks of deleted file: {p}", p=relative_path)
+
+        dirty = self.stats.deleted > 0
+        processed_since_checkpoint = 0
+        config = self.config_fingerprint
+        for relative_path, file_path in current_files.items():
+            stat = file_path.stat()
+            entry = manifest.get(relative_path)
+            # failed files are retried and files chunked with other settings are ingested again
+            up_to_date = entry is not None and entry.error is None and entry.config == config
+
+            # cheap check first, the content hash is only computed when size or mtime changed
+            if up_to_date and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+                self.stats.unchanged += 1
+                continue
+
+            content_hash = file_sha256(str(file_path))
+            if up_to_date and entry.content_hash == content_hash:
+                entry.size, entry.mtime = stat.st_size, stat.st_mtime
+                self.stats.unchanged += 1
+                dirty = True
+                continue
+
+            if entry is not None:
+                self.stats.chunks_deleted += vectorstore.delete(entry.chunk_ids)
+
+            try:
+                chunk_ids = self._embed_file(vectorstore, file_path, relative_path, content_hash)
+                error = None
+            except Exception as e:
+                logger.error("Failed to ingest {p}: {e}", p=relative_path, e=e)
+                chunk_ids, error = [], str(e)
+                self.stats.failed += 1
+            else:
+                if entry is None:
+                    self.stats.added += 1
+                else:
+                    self.stats.updated += 1
+                self.stats.chunks_added += len(chunk_ids)
+
+            manifest[relative_path] = ManifestEntry(
+                size=stat.st_size, mtime=stat.st_mtime, content_hash=content_hash, chunk_ids=chunk_ids, error=error,
+                config=config
+            )
+            dirty = True
+            processed_since_checkpoint += 1
+            if processed_since_checkpoint >= self.checkpoint_every:
+                self._checkpoint(vectorstore, manifest)
+                processed_since_checkpoint = 0
+                dirty = False
+
+        if dirty:
+            self._checkpoint(vectorstore, manifest)
+
+        logger.info("Ingestion finished: {stats}", stats=self.stats.model_dump())
+        return vectorstore
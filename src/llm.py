@@ -4,25 +4,107 @@ from typing import List, Union, Callable, Optional, Any, Dict, TypeVar, Type, An
 import asyncio
 from src.runnables import Runnable
 from src.settings import settings
-from src.prompts import SYSTEM_PROMPT
+from src.tracing import record_usage
+from src.clients import get_azure_client, get_async_azure_client
+from src.llm_cache import LLMResponseCache, acached_create, cached_create, resolve_cache
 
 class AzureChatOpenAI(Runnable):
+    """
+    Chat model runnable. The asynchronous methods use the native async client; every instance shares
+    the process-wide connection pool of src/clients.py.
+    """
+
     def __init__(self, api_key: Optional[str]=settings.AZURE_OPENAI_GPT_API_KEY, 
                  api_version: Optional[str]=settings.AZURE_OPENAI_GPT_API_VERSION,
-                 endpoint: Optional[str]=settings.AZURE_OPENAI_GPT_ENDPOINT):
-        
+                 endpoint: Optional[str]=settings.AZURE_OPENAI_GPT_ENDPOINT,
+                 model: str="gpt-4o-attention-project",
+                 system_prompt: str="You are a helpful assistant",
+                 timeout: Optional[float]=None,
+                 max_retries: Optional[int]=None,
+                 client: Optional[AzureOpenAI]=None,
+                 async_client: Optional[AsyncAzureOpenAI]=None,
+                 cache: Union[LLMResponseCache, bool, None]=None):
+        """
+        Args:
+            timeout (Optional[float]): Deadline in seconds of each request, the client's default when None.
+                Wrap the runnable in `RunnableHedge` / `RunnableWithFallbacks` (src/resilience.py) for hedging and fallbacks.
+            max_retries (Optional[int]): Retries of a failed request, the client's default when None.
+            client (Optional[AzureOpenAI]): Synchronous client to use instead of the shared one.
+            async_client (Optional[AsyncAzureOpenAI]): Asynchronous client to use instead of the shared one,
+                e.g. an `AsyncResilientClient`.
+            cache (Union[LLMResponseCache, bool, None]): Response cache of this model; None follows
+                the global `set_llm_cache`, False disables caching.
+        """
         super().__init__()
-        
-        self._client = AzureOpenAI(
-            api_key=api_key,
-            api_version=api_version,
-            azure_endpoint=endpoint
-        )
+
+        client_options: Dict[str, Any] = {}
+        if timeout is not None:
+            client_options["timeout"] = timeout
+        if max_retries is not None:
+            client_options["max_retries"] = max_retries
+        self._client = client or get_azure_client(endpoint, api_key, api_version)
+        self._async_client = async_client or get_async_azure_client(endpoint, api_key, api_version)
+        if client_options:
+            # copies with other options keep using the shared connection pool
+            self._client = self._client.with_options(**client_options)
+            if hasattr(self._async_client, "with_options"):
+                self._async_client = self._async_client.with_options(**client_options)
+        self.model = model
+        self.system_prompt = system_prompt
+        self.cache = cache
+
+    def _build_messages(self, data: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": data},
+        ]
 
     def process(self, data):
-        return self.chat.completions.create(model="gpt-4o-attention-project",
-                                            messages=[{"role":"system", "content":"You are a helpful assistant",
-                                                      "role":"user", "content":data}]).choices[0].message.content
+        response = cached_create(self._client.chat.completions, resolve_cache(self.cache),
+                                 model=self.model, messages=self._build_messages(data))
+        record_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def aprocess(self, data):
+        response = await acached_create(self._async_client.chat.completions, resolve_cache(self.cache),
+                                        model=self.model, messages=self._build_messages(data))
+        record_usage(response.usage)
+        return response.choices[0].message.content
+
+    def process_stream(self, data):
+        """
+        Yield the completion token by token as the deployment generates it.
+        """
+        stream = cached_create(self._client.chat.completions, resolve_cache(self.cache),
+                               model=self.model,
+                               messages=self._build_messages(data),
+                               stream=True,
+                               stream_options={"include_usage": True})
+        with stream:
+            for chunk in stream:
+                if chunk.choices and (token := chunk.choices[0].delta.content):
+                    yield token
+                elif chunk.usage is not None:
+                    record_usage(chunk.usage)
+
+    async def aprocess_stream(self, data):
+        """
+        Asynchronous counterpart of `process_stream`, without a worker thread.
+        """
+        stream = await acached_create(self._async_client.chat.completions, resolve_cache(self.cache),
+                                      model=self.model,
+                                      messages=self._build_messages(data),
+                                      stream=True,
+                                      stream_options={"include_usage": True})
+        try:
+            async for chunk in stream:
+                if chunk.choices and (token := chunk.choices[0].delta.content):
+                    yield token
+                elif chunk.usage is not None:
+                    record_usage(chunk.usage)
+        finally:
+            # release the connection when the consumer stops early
+            await stream.close()
 
     def __getattr__(self, name):
         """
@@ -37,7 +119,7 @@ class AzureChatOpenAI(Runnable):
         return getattr(self._client, name)
     
     def __repr__(self):
-        return repr(self.client)
+        return f"AzureChatOpenAI(model={self.model!r})"
     
 if __name__ == "__main__":
     llm = AzureChatOpenAI()
@@ -0,0 +1,371 @@
+import asyncio
+import os
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from src.runnable_cache import SQLiteCacheBackend, stable_hash
+
+# request fields that change how the answer is delivered, not the answer itself
+TRANSPORT_FIELDS = frozenset({"stream", "stream_options", "timeout", "extra_headers", "extra_query", "extra_body", "user"})
+
+
+class LLMResponseCache:
+    """
+    Persistent exact-match cache of chat completions, keyed by a canonical hash of the request
+    (deployment, messages, temperature, tools and every other sampling parameter).
+
+    A streamed answer is stored as its chunks and replayed chunk by chunk; a streaming request can be
+    served from a non-streamed answer and the other way around.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike] = ".cache/llm_cache.sqlite", max_entries: Optional[int] = 50_000,
+                 max_bytes: Optional[int] = 512 * 1024 * 1024, ttl: Optional[float] = None, version: str = ""):
+        """
+        Args:
+            path (Union[str, os.PathLike]): SQLite database file.
+            max_entries (Optional[int]): Maximum number of cached answers.
+            max_bytes (Optional[int]): Maximum total size of the cached answers.
+            ttl (Optional[float]): Seconds an answer stays valid, forever when None.
+            version (str): Tag mixed into every key, bump it to start over.
+        """
+        self.backend = SQLiteCacheBackend(path=path, max_entries=max_entries, max_bytes=max_bytes)
+        self.ttl = ttl
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, request: Dict[str, Any]) -> str:
+        return stable_hash({
+            "version": self.version,
+            "request": {name: value for name, value in request.items() if name not in TRANSPORT_FIELDS},
+        })
+
+    def lookup(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        hit, entry = self.backend.get(self.key(request))
+        if hit:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store_completion(self, request: Dict[str, Any], completion: ChatCompletion) -> None:
+        self.backend.set(self.key(request), {"completion": completion.model_dump()}, ttl=self.ttl)
+
+    def store_chunks(self, request: Dict[str, Any], chunks: List[Dict[str, Any]]) -> None:
+        self.backend.set(self.key(request), {"chunks": chunks}, ttl=self.ttl)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit, miss and eviction counters of this process.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_default_cache: Optional[LLMResponseCache] = None
+
+
+def set_llm_cache(cache: Optional[LLMResponseCache]) -> None:
+    """
+    Set the cache used by every chat model and client wrapper not configured with its own, None to disable it.
+    """
+    global _default_cache
+    _default_cache = cache
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    return _default_cache
+
+
+def resolve_cache(cache: Union[LLMResponseCache, bool, None]) -> Optional[LLMResponseCache]:
+    """
+    Map a `cache` option to a cache: None follows the global setting, False disables caching.
+    """
+    if cache is None or cache is True:
+        return _default_cache
+    if cache is False:
+        return None
+    return cache
+
+
+def _chunks_to_completion(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Assemble the chunks of a streamed answer into the equivalent completion.
+    """
+    choices: Dict[int, Dict[str, Any]] = {}
+    usage = None
+    header = next((chunk for chunk in chunks if chunk.get("choices")), chunks[0])
+    for chunk in chunks:
+        usage = chunk.get("usage") or usage
+        for choice in chunk.get("choices") or []:
+            state = choices.setdefault(choice["index"], {"content": [], "tool_calls": {}, "finish_reason": "stop"})
+            delta = choice.get("delta") or {}
+            if delta.get("content"):
+                state["content"].append(delta["content"])
+            for tool_call in delta.get("tool_calls") or []:
+                merged = state["tool_calls"].setdefault(
+                    tool_call["index"], {"id": None, "type": "function", "function": {"name": "", "arguments": ""}}
+                )
+                merged["id"] = tool_call.get("id") or merged["id"]
+                function = tool_call.get("function") or {}
+                merged["function"]["name"] += function.get("name") or ""
+                merged["function"]["arguments"] += function.get("arguments") or ""
+            if choice.get("finish_reason"):
+                state["finish_reason"] = choice["finish_reason"]
+    return {
+        "id": header["id"],
+        "object": "chat.completion",
+        "created": header["created"],
+        "model": header["model"],
+        "system_fingerprint": header.get("system_fingerprint"),
+        "usage": usage,
+        "choices": [
+            {
+                "index": index,
+                "finish_reason": state["finish_reason"],
+                "message": {
+                    "role": "assistant",
+                    "content": "".join(state["content"]) or None,
+                    "tool_calls": [state["tool_calls"][i] for i in sorted(state["tool_calls"])] or None,
+                },
+            }
+            for index, state in sorted(choices.items())
+        ],
+    }
+
+
+def _completion_to_chunks(completion: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Split a completion into the chunks a streaming request would have received.
+    """
+    header = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+              "model": completion["model"], "system_fingerprint": completion.get("system_fingerprint")}
+    # like Azure, open with a chunk without choices
+    chunks = [dict(header, choices=[])]
+    for choice in completion["choices"]:
+        message = choice["message"]
+        delta: Dict[str, Any] = {"role": "assistant", "content": message.get("content")}
+        if message.get("tool_calls"):
+            delta["tool_calls"] = [dict(tool_call, index=i) for i, tool_call in enumerate(message["tool_calls"])]
+        chunks.append(dict(header, choices=[{"index": choice["index"], "delta": delta, "finish_reason": None}]))
+        chunks.append(dict(header, choices=[{"index": choice["index"], "delta": {},
+                                             "finish_reason": choice.get("finish_reason")}]))
+    if completion.get("usage"):
+        chunks.append(dict(header, choices=[], usage=completion["usage"]))
+    return chunks
+
+
+def _replay(entry: Dict[str, Any], request: Dict[str, Any], is_async: bool):
+    """
+    Turn a cache entry into the response the request expects: a completion or a chunk stream.
+    """
+    if not request.get("stream"):
+        completion = entry.get("completion") or _chunks_to_completion(entry["chunks"])
+        return ChatCompletion.model_validate(completion)
+    chunks = entry.get("chunks") or _completion_to_chunks(entry["completion"])
+    include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+    if not include_usage:
+        chunks = [dict(chunk, usage=None) for chunk in chunks if chunk.get("choices") or not chunk.get("usage")]
+    chunks = [ChatCompletionChunk.model_validate(chunk) for chunk in chunks]
+    return AsyncReplayStream(chunks) if is_async else ReplayStream(chunks)
+
+
+class ReplayStream:
+    """
+    Cached answer replayed like a `Stream` of chunks.
+    """
+
+    def __init__(self, chunks: List[ChatCompletionChunk]):
+        self._chunks = iter(chunks)
+
+    def __iter__(self) -> Iterator[ChatCompletionChunk]:
+        return self
+
+    def __next__(self) -> ChatCompletionChunk:
+        return next(self._chunks)
+
+    def close(self) -> None:
+        self._chunks = iter(())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncReplayStream:
+    """
+    Cached answer replayed like an `AsyncStream` of chunks.
+    """
+
+    def __init__(self, chunks: List[ChatCompletionChunk]):
+        self._chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ChatCompletionChunk:
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+    async def close(self) -> None:
+        self._chunks = iter(())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class _RecordingStream:
+    """
+    Pass the chunks of a live stream through and store them once the stream is complete.
+    """
+
+    def __init__(self, stream, cache: LLMResponseCache, request: Dict[str, Any]):
+        self._stream = stream
+        self._cache = cache
+        self._request = request
+        self._chunks: List[Dict[str, Any]] = []
+
+    def _record(self, chunk) -> None:
+        self._chunks.append(chunk.model_dump())
+
+    def _finish(self) -> None:
+        if self._chunks:
+            self._cache.store_chunks(self._request, self._chunks)
+
+    async def _afinish(self) -> None:
+        if self._chunks:
+            await asyncio.to_thread(self._cache.store_chunks, self._request, self._chunks)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._stream)
+        except StopIteration:
+            self._finish()
+            raise
+        self._record(chunk)
+        return chunk
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            await self._afinish()
+            raise
+        self._record(chunk)
+        return chunk
+
+    def close(self):
+        # an interrupted stream is not stored
+        return self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stream.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._stream.close()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def cached_create(completions, cache: Optional[LLMResponseCache], **request):
+    """
+    `completions.create(**request)` through `cache` (synchronous client).
+    """
+    if cache is None:
+        return completions.create(**request)
+    entry = cache.lookup(request)
+    if entry is not None:
+        return _replay(entry, request, is_async=False)
+    response = completions.create(**request)
+    if request.get("stream"):
+        return _RecordingStream(response, cache, request)
+    cache.store_completion(request, response)
+    return response
+
+
+async def acached_create(completions, cache: Optional[LLMResponseCache], **request):
+    """
+    `await completions.create(**request)` through `cache` (asynchronous client). The SQLite reads and writes
+    run in worker threads, never in the event loop.
+    """
+    if cache is None:
+        return await completions.create(**request)
+    entry = await asyncio.to_thread(cache.lookup, request)
+    if entry is not None:
+        return _replay(entry, request, is_async=True)
+    response = await completions.create(**request)
+    if request.get("stream"):
+        return _RecordingStream(response, cache, request)
+    await asyncio.to_thread(cache.store_completion, request, response)
+    return response
+
+
+class _CachedCompletions:
+    def __init__(self, completions, cache: Union[LLMResponseCache, bool, None], is_async: bool):
+        self._completions = completions
+        self._cache = cache
+        self._is_async = is_async
+
+    def create(self, **request):
+        if self._is_async:
+            return acached_create(self._completions, resolve_cache(self._cache), **request)
+        return cached_create(self._completions, resolve_cache(self._cache), **request)
+
+
+class _CachedChat:
+    def __init__(self, chat, cache: Union[LLMResponseCache, bool, None], is_async: bool):
+        self.completions = _CachedCompletions(chat.completions, cache, is_async)
+
+
+class CachedClient:
+    """
+    Wrap an OpenAI client (sync or async) so that `chat.completions.create` goes through an `LLMResponseCache`.
+
+    Usage:
+        set_llm_cache(LLMResponseCache())
+        client = CachedClient(get_async_gpt_client(), is_async=True)
+    """
+
+    def __init__(self, client, cache: Union[LLMResponseCache, bool, None] = None, is_async: bool = False):
+        """
+        Args:
+            client: The wrapped client.
+            cache: The cache; None follows the global `set_llm_cache`, False disables caching.
+            is_async (bool): Whether `client` is an async client.
+        """
+        self._client = client
+        self.chat = _CachedChat(client.chat, cache, is_async)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional
 
 from pydantic import BaseModel, Field
 
@@ -6,4 +6,17 @@ from pydantic import BaseModel, Field
 class Metadata(BaseModel):
     id: str
     created: int
-    model: str
\ No newline at end of file
+    model: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # prompt tokens served from the provider's prefix cache
+    cached_tokens: Optional[int] = None
+
+    def record_usage(self, usage: Any) -> None:
+        """
+        Copy the token counts of a `CompletionUsage`.
+        """
+        self.prompt_tokens = usage.prompt_tokens
+        self.completion_tokens = usage.completion_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
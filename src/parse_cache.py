@@ -0,0 +1,110 @@
+import os
+import pickle
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from loguru import logger
+
+
+class ParsedDocumentCache:
+    """
+    On-disk cache of parsed PDF content keyed by the file's content hash and the extractor version.
+
+    Entries are pickled and zlib-compressed into one file each. When the total size exceeds `max_bytes`
+    the least recently used entries are evicted; reads refresh an entry's mtime so that it serves as
+    the recency marker.
+    """
+
+    SUFFIX = ".bin"
+
+    def __init__(self, directory: Union[str, os.PathLike] = ".cache/parsed_documents",
+                 max_bytes: int = 512 * 1024 * 1024, compression_level: int = 6):
+        """
+        Args:
+            directory (Union[str, os.PathLike]): Directory holding the cache entries.
+            max_bytes (int): Upper bound for the total size of the entries on disk.
+            compression_level (int): zlib compression level.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(content_hash: str, extractor_version: Union[int, str]) -> str:
+        """
+        Build the cache key of a parsed file.
+
+        Args:
+            content_hash (str): SHA-256 digest of the file's content.
+            extractor_version (Union[int, str]): Version of the extractor that produced the result.
+
+        Returns:
+            str: The cache key.
+        """
+        return f"{content_hash}-v{extractor_version}"
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.SUFFIX}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached payload for `key`, or None when it is missing or unreadable.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning("Dropping unreadable parse cache entry {k}: {e}", k=key, e=e)
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return payload
+
+    def put(self, key: str, payload: Dict[str, Any]) -> None:
+        """
+        Store `payload` under `key` and evict old entries if the cache grew past `max_bytes`.
+        """
+        data = zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), self.compression_level)
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(self.SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        # oldest first
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the cache.
+        """
+        for path in self.directory.glob(f"*{self.SUFFIX}"):
+            path.unlink(missing_ok=True)
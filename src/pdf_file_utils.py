@@ -6,7 +6,11 @@ from PyPDF2 import PdfReader
 import fitz  # PyMuPDF
 import pdfplumber
 import base64
+import hashlib
 from io import BytesIO
+from time import perf_counter
+from typing import Iterable, List
+from loguru import logger
 
 import os
 import sys
@@ -19,19 +23,45 @@ os.chdir(project_root)
 sys.path.append(os.path.join(project_root, 'src'))
 
 from src.document import Document
+from src.parse_cache import ParsedDocumentCache
 
 
+def file_sha256(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 digest of a file's content, reading it in chunks.
+
+    :param file_path: The path to the file.
+    :param chunk_size: Number of bytes read at a time.
+    :return: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 class PDFDocumentLoader:
 
-    def __init__(self, file_path: str):
+    # bump whenever the extraction output changes, so that cached parses are not reused
+    EXTRACTOR_VERSION = 1
+
+    def __init__(self, file_path: str, prescreen_tables: bool = True,
+                 cache: Optional[ParsedDocumentCache] = None, content_hash: Optional[str] = None):
         """
         Setting self.file_path to file_path variable.
 
         :param file_path: The path to the PDF file.
+        :param prescreen_tables: Run table extraction only on pages that could contain a table.
+        :param cache: Cache of parsed results. When given, a file whose content was parsed before is not parsed again.
+        :param content_hash: SHA-256 of the file's content, if the caller already computed it.
         :return: Nothing.
         """
         self.file_path = file_path
+        self.prescreen_tables = prescreen_tables
+        self.cache = cache
+        self.content_hash = content_hash
+        self.stats: Dict[str, Any] = {}
 
 
     def load(self) -> list[Document]:
@@ -42,33 +72,105 @@ class PDFDocumentLoader:
         """
         if not os.path.exists(self.file_path):
             raise FileNotFoundError(f"The file '{self.file_path }' does not exist.")
-        
+
+        if self.cache is None:
+            return self._to_documents(self._parse())
+
+        _now = perf_counter()
+        content_hash = self.content_hash or file_sha256(self.file_path)
+        key = ParsedDocumentCache.make_key(content_hash, self.EXTRACTOR_VERSION)
+        parsed = self.cache.get(key)
+        lookup_time = perf_counter() - _now
+
+        if parsed is not None:
+            self.stats = {"timings": {"cache_lookup": lookup_time}, "cache_hit": True}
+            logger.info("Loaded {f} from the parse cache in {t:.3f}s", f=self.file_path, t=lookup_time)
+            return self._to_documents(parsed)
+
+        parsed = self._parse()
+        self.stats["timings"]["cache_lookup"] = lookup_time
+        self.stats["cache_hit"] = False
+        self.cache.put(key, parsed)
+        return self._to_documents(parsed)
+
+    def _to_documents(self, parsed: Dict[str, Any]) -> list[Document]:
+        # the same content may be cached under another name
+        metadata = {**parsed["metadata"], "file_name": os.path.basename(self.file_path)}
+        return [Document(
+            page_content="\n".join(parsed["pages"]),
+            metadata=metadata
+        )]
+
+    def _parse(self) -> Dict[str, Any]:
+        """
+        Run every extractor on the file.
+
+        :return: A dict with the text of each page under "pages" and the metadata, images, tables and annotations under "metadata".
+        """
         metadata = {}
+        timings: Dict[str, float] = {}
 
-        page_content = self.extract_text(self.file_path )
-        
+        _now = perf_counter()
+        pages = self.extract_pages(self.file_path )
+        if not "".join(pages).strip():
+            raise ValueError("No text content found in the PDF.")
+        timings["text"] = perf_counter() - _now
+
+        _now = perf_counter()
         metadata = self.extract_metadata(self.file_path )
+        timings["metadata"] = perf_counter() - _now
 
+        _now = perf_counter()
         images = self.extract_images(self.file_path )
         metadata["images"] = images if images else []
+        timings["images"] = perf_counter() - _now
 
-        tables = self.extract_tables(self.file_path )
+        table_pages = None
+        if self.prescreen_tables:
+            _now = perf_counter()
+            table_pages = self.find_table_candidate_pages(self.file_path)
+            timings["table_prescreen"] = perf_counter() - _now
+
+        _now = perf_counter()
+        tables = self.extract_tables(self.file_path, pages=table_pages)
         metadata["tables"] = tables if tables else []
+        timings["tables"] = perf_counter() - _now
 
+        _now = perf_counter()
         annotations = self.extract_annotations(self.file_path )
         metadata["annotations"] = annotations if annotations else []
-        return [Document(
-            page_content=page_content,
-            metadata=metadata
-        )]
+        timings["annotations"] = perf_counter() - _now
+
+        num_pages = metadata["num_pages"]
+        table_pages_scanned = num_pages if table_pages is None else len(table_pages)
+        self.stats = {
+            "timings": timings,
+            "table_pages_scanned": table_pages_scanned,
+            "table_pages_skipped": num_pages - table_pages_scanned,
+        }
+        logger.info(
+            "Loaded {f}: {t}, table extraction skipped {s}/{n} pages",
+            f=metadata["file_name"],
+            t=", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in timings.items()),
+            s=self.stats["table_pages_skipped"],
+            n=num_pages,
+        )
+        return {"pages": pages, "metadata": metadata}
+
+    @staticmethod
+    def extract_pages(file_path: str) -> List[str]:
+        """
+        Extract the text of each page of the PDF.
+        """
+        reader = PdfReader(file_path)
+        return [page.extract_text() for page in reader.pages]
 
     @staticmethod
     def extract_text(file_path: str) -> str:
         """
         Extract text from the PDF. Raise an error if text is not found.
         """
-        reader = PdfReader(file_path)
-        page_content = "\n".join(page.extract_text() for page in reader.pages)
+        page_content = "\n".join(PDFDocumentLoader.extract_pages(file_path))
         
         if not page_content.strip():
             raise ValueError("No text content found in the PDF.")
@@ -119,13 +221,57 @@ class PDFDocumentLoader:
         return images
 
     @staticmethod
-    def extract_tables(file_path: str) -> list:
+    def find_table_candidate_pages(file_path: str, min_rules: int = 2, tolerance: float = 1.0) -> List[int]:
+        """
+        Cheap pre-screen for `extract_tables` using PyMuPDF drawing primitives.
+
+        pdfplumber's default table settings build cells from ruling lines only (the edges of lines,
+        rects and curves), so a page without at least `min_rules` horizontal and `min_rules` vertical
+        rules cannot yield a table.
+
+        :param file_path: The path to the PDF file.
+        :param min_rules: Minimum number of horizontal and of vertical rules a table needs.
+        :param tolerance: Maximum deviation, in points, for a segment to count as axis-aligned.
+        :return: Zero-based indices of the pages that could contain a table.
+        """
+        candidates = []
+        with fitz.open(file_path) as doc:
+            for page_num in range(len(doc)):
+                page = doc.load_page(page_num)
+                horizontal = vertical = 0
+                for path in page.get_drawings():
+                    for item in path["items"]:
+                        kind = item[0]
+                        if kind in ("re", "qu"):
+                            # every rectangle or quad contributes two edges of each orientation
+                            horizontal += 2
+                            vertical += 2
+                            continue
+                        # lines are (p1, p2), curves (p1, c1, c2, p2); pdfplumber takes edges between all points
+                        points = item[1:3] if kind == "l" else item[1:5]
+                        for start, end in zip(points, points[1:]):
+                            if abs(start.y - end.y) <= tolerance:
+                                horizontal += 1
+                            elif abs(start.x - end.x) <= tolerance:
+                                vertical += 1
+                    if horizontal >= min_rules and vertical >= min_rules:
+                        candidates.append(page_num)
+                        break
+
+        return candidates
+
+    @staticmethod
+    def extract_tables(file_path: str, pages: Optional[Iterable[int]] = None) -> list:
         """
         Extract tables from the PDF. Return an empty list if no tables are found.
+
+        :param file_path: The path to the PDF file.
+        :param pages: Zero-based indices of the pages to scan. All pages are scanned when None.
         """
         tables = []
         with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
+            selected_pages = pdf.pages if pages is None else [pdf.pages[i] for i in pages]
+            for page in selected_pages:
                 page_tables = page.extract_tables()
                 for table in page_tables:
                     tables.append(table)
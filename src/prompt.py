@@ -18,6 +18,10 @@ class BasePromptTemplate(Runnable):
     def process(self, data):
         #print("FROM PROMPT CLASS:      ", self._format_prompt(**data))
         return self._format_prompt(**data)
+
+    async def aprocess(self, data):
+        # formatting is cheap, a thread hop would cost more than it saves
+        return self.process(data)
     
     def get_template_variables(self, ):
         return sorted({
@@ -1,12 +1,23 @@
+import hashlib
 from datetime import datetime
+from typing import Any, Dict, List, Optional
 
-def generate_prompt(function_schemas: str) -> str:
-    return f"""
-    Today Date: {datetime.now().strftime('%Y-%m-%d')}
 
+_INSTRUCTIONS = """
     You are Dogan's helpful personal assistant. Your only goal is to fulfill his wishes in the best way possible.
     Beside the abilities you have, you also have the ability to call functions.
 
+    Important rules to follow:
+    - Required parameters MUST be specified
+    - If there is no function call available, answer the question in chatting way with your current knowledge and do not tell anything about function calls to the user
+    - Only call a function if you have all the required information to call it, otherwise ask a follow up question; follow up questions must not be accompanied by a function call
+"""
+
+# native function calling: the schemas go in the `tools` parameter of the request
+_NATIVE_TOOL_RULES = """    - When a request needs several independent functions, call all of them at once in the same reply
+"""
+
+_TEXT_TOOL_PROTOCOL = """
     The schemas of the functions you have is as follows:
 
     {function_schemas}
@@ -18,12 +29,88 @@ def generate_prompt(function_schemas: str) -> str:
 
     2. If no function call is needed, respond in conversational way.
 
-    Important rules to follow:
+    Rules of the function call format:
     - Choose only ONE response format - either a function call OR a text message
     - Function calls MUST follow the specified format, start with <tool> and end with </tool>
-    - Required parameters MUST be specified
     - Only call one function at a time
     - Put the entire function call reply on one line
-    - If there is no function call available, answer the question in chatting way with your current knowledge and do not tell anything about function calls to the user
-    - Only respond with a function call if you have all the required information to call the function, follow up questions must not be accompanied by a function call
-    """
\ No newline at end of file
+"""
+
+
+def generate_prompt(function_schemas: Optional[str] = None) -> str:
+    """
+    Static part of the system prompt: instructions and tool schemas only.
+
+    Nothing in here may change between requests, so that the provider can reuse the cached prefix;
+    the date and other volatile context go in `generate_context` instead.
+
+    Args:
+        function_schemas (Optional[str]): Schemas of the `<tool>` text protocol, see `prepare_schemas`.
+            None when the tools are passed with native function calling (`prepare_tools`).
+
+    Returns:
+        str: The system prompt.
+    """
+    if function_schemas is None:
+        return _INSTRUCTIONS + _NATIVE_TOOL_RULES
+    return _INSTRUCTIONS + _TEXT_TOOL_PROTOCOL.format(function_schemas=function_schemas)
+
+
+def generate_context(now: Optional[datetime] = None, user_context: Optional[str] = None) -> str:
+    """
+    Volatile part of the system prompt, sent after the conversation.
+
+    Args:
+        now (Optional[datetime]): Current time, `datetime.now()` when None.
+        user_context (Optional[str]): Extra facts about the user or the session.
+
+    Returns:
+        str: The context message.
+    """
+    lines = [f"Today Date: {(now or datetime.now()).strftime('%Y-%m-%d')}"]
+    if user_context:
+        lines.append(user_context)
+    return "\n".join(lines)
+
+
+class PromptAssembler:
+    """
+    Build the messages of a request as a byte-stable prefix (static system prompt, then the conversation so far)
+    followed by the volatile context, so that provider-side prompt caching covers everything but the last turn.
+
+    Usage:
+        assembler = PromptAssembler(generate_prompt(prepare_schemas(models=tools)))
+        messages = assembler.messages(history)
+    """
+
+    def __init__(self, system_prompt: str):
+        """
+        Args:
+            system_prompt (str): The static system prompt.
+        """
+        self.system_prompt = system_prompt
+        self.system_message: Dict[str, str] = {"role": "system", "content": system_prompt}
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Short hash of the static prefix, it only changes when the instructions or the tools do.
+        """
+        return hashlib.sha256(self.system_prompt.encode("utf-8")).hexdigest()[:12]
+
+    def messages(self, history: List[Dict[str, Any]], now: Optional[datetime] = None,
+                 user_context: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Args:
+            history (List[Dict[str, Any]]): The conversation, without system prompt.
+            now (Optional[datetime]): Current time, `datetime.now()` when None.
+            user_context (Optional[str]): Extra facts about the user or the session.
+
+        Returns:
+            List[Dict[str, Any]]: The messages to send.
+        """
+        return [
+            self.system_message,
+            *history,
+            {"role": "system", "content": generate_context(now=now, user_context=user_context)},
+        ]
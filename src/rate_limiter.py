@@ -0,0 +1,520 @@
+import asyncio
+import heapq
+import itertools
+import json
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from loguru import logger
+from pydantic import BaseModel
+
+from src.settings import settings
+
+# lower runs first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+_priority: ContextVar[int] = ContextVar("smallchain_priority", default=INTERACTIVE)
+
+_DEPLOYMENT_PATTERN = re.compile(r"/deployments/([^/]+)/")
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """
+    Run the enclosed block's Azure OpenAI calls at the given priority (`INTERACTIVE`, `BACKGROUND`, ...).
+    Tasks and worker threads started inside inherit it.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class QuotaLimits(BaseModel):
+    """
+    Quota of a deployment; None means unlimited.
+    """
+    rpm: Optional[int] = None
+    tpm: Optional[int] = None
+
+
+class TokenBucket:
+    """
+    Bucket holding up to `capacity` units, refilled continuously over a minute.
+    The level may go negative when usage turns out higher than estimated.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` units are available.
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "tokens", "enqueued", "granted", "cancelled", "event", "future", "loop")
+
+    def __init__(self, priority: int, seq: int, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.enqueued = monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.event: Optional[threading.Event] = None
+        self.future: Optional[asyncio.Future] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class DeploymentScheduler:
+    """
+    Admission control of one deployment: requests wait in priority order until both the request and the
+    token bucket can pay for them, and everything pauses while the service asks to retry later.
+    """
+
+    def __init__(self, name: str, limits: QuotaLimits):
+        self.name = name
+        self.requests = TokenBucket(limits.rpm) if limits.rpm else None
+        self.tokens = TokenBucket(limits.tpm) if limits.tpm else None
+        self.paused_until = 0.0
+        self._queue: List[_Ticket] = []
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        # wakes the queue up when its head may be granted
+        self._timer: Optional[threading.Timer] = None
+        self._timer_deadline = 0.0
+        self.granted = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.estimated_tokens = 0
+        self.used_tokens = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for ticket in self._queue if not ticket.cancelled)
+
+    def _pump(self) -> None:
+        """
+        Grant the head of the queue while the buckets allow it. Must hold the lock.
+        """
+        while self._queue:
+            ticket = self._queue[0]
+            if ticket.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            now = monotonic()
+            wait = max(
+                self.paused_until - now,
+                self.requests.wait_time(1, now) if self.requests else 0.0,
+                self.tokens.wait_time(ticket.tokens, now) if self.tokens else 0.0,
+            )
+            if wait > 0:
+                # strict priority: lower priorities wait behind the head
+                self._wake_at(now + wait)
+                return
+            heapq.heappop(self._queue)
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(ticket.tokens)
+            waited = now - ticket.enqueued
+            self.granted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.estimated_tokens += ticket.tokens
+            ticket.granted = True
+            if ticket.event is not None:
+                ticket.event.set()
+            elif not ticket.future.done():
+                ticket.loop.call_soon_threadsafe(self._resolve, ticket.future)
+
+    def _wake_at(self, deadline: float) -> None:
+        """
+        Pump the queue again at `deadline`. Must hold the lock.
+        """
+        if self._timer is not None:
+            if self._timer_deadline <= deadline:
+                return
+            self._timer.cancel()
+        self._timer_deadline = deadline
+        self._timer = threading.Timer(max(0.0, deadline - monotonic()), self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._pump()
+
+    @staticmethod
+    def _resolve(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(None)
+
+    def _enqueue(self, tokens: int) -> _Ticket:
+        ticket = _Ticket(_priority.get(), next(self._seq), tokens)
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _withdraw(self, ticket: _Ticket) -> None:
+        """
+        Remove the ticket of a caller interrupted while waiting; a grant it could not use goes back to the buckets.
+        """
+        with self._lock:
+            ticket.cancelled = True
+            if ticket.granted:
+                if self.requests:
+                    self.requests.adjust(1)
+                if self.tokens:
+                    self.tokens.adjust(ticket.tokens)
+                self.estimated_tokens -= ticket.tokens
+            # the tickets behind it may go now
+            self._pump()
+
+    def acquire(self, tokens: int) -> None:
+        """
+        Block until a request of an estimated `tokens` may be sent.
+        """
+        with self._lock:
+            ticket = self._enqueue(tokens)
+            ticket.event = threading.Event()
+            self._pump()
+        try:
+            ticket.event.wait()
+        except BaseException:
+            self._withdraw(ticket)
+            raise
+
+    async def aacquire(self, tokens: int) -> None:
+        """
+        Asynchronous counterpart of `acquire`.
+        """
+        with self._lock:
+            ticket = self._enqueue(tokens)
+            ticket.loop = asyncio.get_running_loop()
+            ticket.future = ticket.loop.create_future()
+            self._pump()
+        try:
+            await ticket.future
+        except BaseException:
+            self._withdraw(ticket)
+            raise
+
+    def record_usage(self, estimated: int, used: int) -> None:
+        """
+        Correct the token bucket once the actual usage of a request is known.
+        """
+        with self._lock:
+            self.used_tokens += used
+            if self.tokens:
+                self.tokens.adjust(estimated - used)
+                # an overestimate frees budget for the queue
+                self._pump()
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "mean_wait": self.total_wait / self.granted if self.granted else 0.0,
+                "max_wait": self.max_wait,
+                "estimated_tokens": self.estimated_tokens,
+                "used_tokens": self.used_tokens,
+            }
+
+
+def estimate_tokens(payload: Dict[str, Any], default_completion_tokens: int = 512) -> int:
+    """
+    Rough token count of a request before it is sent (about four characters per token), counting the
+    completion budget as Azure does.
+    """
+    if "messages" in payload:
+        prompt_chars = len(json.dumps(payload["messages"], ensure_ascii=False))
+        prompt_chars += len(json.dumps(payload.get("tools") or [], ensure_ascii=False))
+        completion = payload.get("max_tokens") or payload.get("max_completion_tokens") or default_completion_tokens
+        return prompt_chars // 4 + completion
+    if "input" in payload and "voice" not in payload:
+        texts = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+        return sum(len(text) if isinstance(text, str) else len(text or []) * 4 for text in texts) // 4 + 1
+    # speech and transcription quotas count requests only
+    return 0
+
+
+def _retry_after(response: httpx.Response) -> float:
+    for header, scale in (("retry-after-ms", 1e-3), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+    return 1.0
+
+
+def _usage_total(usage: Any) -> Optional[int]:
+    if isinstance(usage, dict) and isinstance(usage.get("total_tokens"), int):
+        return usage["total_tokens"]
+    return None
+
+
+class RateLimiter:
+    """
+    Shared client-side scheduler of every Azure OpenAI call, installed as the transport of the shared
+    HTTP clients (src/clients.py).
+
+    Each deployment has a request and a token bucket refilled per minute. A request waits in priority
+    order until both buckets can pay for it; its token cost is estimated from the request body and
+    corrected from the `usage` of the response, streamed or not. A 429 pauses the deployment for the
+    `retry-after` the service asked for.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, QuotaLimits]] = None, default: Optional[QuotaLimits] = None):
+        """
+        Args:
+            limits (Optional[Dict[str, QuotaLimits]]): Quota per deployment name.
+            default (Optional[QuotaLimits]): Quota of deployments without one, unlimited when None.
+        """
+        self.limits = {name: QuotaLimits.model_validate(limit) for name, limit in (limits or {}).items()}
+        self.default = default or QuotaLimits()
+        self._schedulers: Dict[str, DeploymentScheduler] = {}
+        self._lock = threading.Lock()
+
+    def scheduler(self, deployment: str) -> DeploymentScheduler:
+        with self._lock:
+            if deployment not in self._schedulers:
+                self._schedulers[deployment] = DeploymentScheduler(deployment, self.limits.get(deployment, self.default))
+            return self._schedulers[deployment]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Queue depth, wait times, throttling and token accounting per deployment.
+        """
+        with self._lock:
+            schedulers = list(self._schedulers.values())
+        return {scheduler.name: scheduler.stats() for scheduler in schedulers}
+
+    @staticmethod
+    def describe(request: httpx.Request) -> Tuple[str, int]:
+        """
+        Deployment and estimated token cost of a request.
+        """
+        payload: Dict[str, Any] = {}
+        if request.headers.get("content-type", "").startswith("application/json"):
+            try:
+                payload = json.loads(request.content or b"{}")
+            except (httpx.RequestNotRead, ValueError):
+                payload = {}
+        match = _DEPLOYMENT_PATTERN.search(request.url.path)
+        deployment = match.group(1) if match else str(payload.get("model") or request.url.host)
+        return deployment, estimate_tokens(payload)
+
+
+class _UsageScanner:
+    """
+    Find the `usage` of a server-sent event stream without holding on to the stream.
+    """
+
+    def __init__(self):
+        self._partial = b""
+        self.total: Optional[int] = None
+
+    def feed(self, data: bytes) -> None:
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            if b'"usage"' in line and line.startswith(b"data:"):
+                try:
+                    total = _usage_total(json.loads(line[5:]).get("usage"))
+                except ValueError:
+                    continue
+                if total is not None:
+                    self.total = total
+
+
+class _AsyncUsageStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, scanner: _UsageScanner, on_close):
+        self._stream = stream
+        self._scanner = scanner
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for data in self._stream:
+            self._scanner.feed(data)
+            yield data
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class _SyncUsageStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, scanner: _UsageScanner, on_close):
+        self._stream = stream
+        self._scanner = scanner
+        self._on_close = on_close
+
+    def __iter__(self):
+        for data in self._stream:
+            self._scanner.feed(data)
+            yield data
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._on_close()
+
+
+def _after_response(scheduler: DeploymentScheduler, estimated: int, response: httpx.Response, stream_cls):
+    if response.status_code == 429:
+        seconds = _retry_after(response)
+        logger.warning("Deployment {d} throttled, pausing it for {s:.1f}s", d=scheduler.name, s=seconds)
+        scheduler.pause(seconds)
+        scheduler.record_usage(estimated, 0)
+        return response
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        scanner = _UsageScanner()
+        done = []
+
+        def on_close():
+            if not done:
+                done.append(True)
+                # streams without a usage chunk keep their estimate
+                scheduler.record_usage(estimated, scanner.total if scanner.total is not None else estimated)
+
+        return httpx.Response(status_code=response.status_code, headers=response.headers,
+                              stream=stream_cls(response.stream, scanner, on_close),
+                              extensions=response.extensions)
+    return None
+
+
+class RateLimitedAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport sending each request through a `RateLimiter`.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: RateLimiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        deployment, estimated = self.limiter.describe(request)
+        scheduler = self.limiter.scheduler(deployment)
+        await scheduler.aacquire(estimated)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            scheduler.record_usage(estimated, 0)
+            raise
+        wrapped = _after_response(scheduler, estimated, response, _AsyncUsageStream)
+        if wrapped is not None:
+            return wrapped
+        if response.status_code != 429:
+            if response.headers.get("content-type", "").startswith("application/json"):
+                await response.aread()
+                scheduler.record_usage(estimated, self._json_usage(response, estimated))
+            else:
+                scheduler.record_usage(estimated, estimated)
+        return response
+
+    @staticmethod
+    def _json_usage(response: httpx.Response, estimated: int) -> int:
+        try:
+            total = _usage_total(response.json().get("usage"))
+        except (ValueError, AttributeError):
+            total = None
+        return total if total is not None else estimated
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """
+    Synchronous counterpart of `RateLimitedAsyncTransport`.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, limiter: RateLimiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        deployment, estimated = self.limiter.describe(request)
+        scheduler = self.limiter.scheduler(deployment)
+        scheduler.acquire(estimated)
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            scheduler.record_usage(estimated, 0)
+            raise
+        wrapped = _after_response(scheduler, estimated, response, _SyncUsageStream)
+        if wrapped is not None:
+            return wrapped
+        if response.status_code != 429:
+            if response.headers.get("content-type", "").startswith("application/json"):
+                response.read()
+                scheduler.record_usage(estimated, RateLimitedAsyncTransport._json_usage(response, estimated))
+            else:
+                scheduler.record_usage(estimated, estimated)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Return the process-wide rate limiter, configured from `settings.RATE_LIMITS` on first use.
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter({name: QuotaLimits.model_validate(limit) for name, limit in settings.RATE_LIMITS.items()})
+        return _limiter
+
+
+def set_rate_limiter(limiter: RateLimiter) -> None:
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
@@ -0,0 +1,141 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from loguru import logger
+from pydantic import BaseModel
+
+from src.agent import Agent, TurnTimings
+
+# stages reported by `summarize_timings`
+STAGES = ("first_text", "llm", "tools", "total")
+
+
+class Conversation(BaseModel):
+    name: str
+    turns: List[str]
+
+
+class TurnResult(BaseModel):
+    conversation: str
+    turn: int
+    prompt: str
+    answer: Optional[str] = None
+    error: Optional[str] = None
+    timings: TurnTimings
+
+
+def _history_turns(chat_history: Dict[str, Any]) -> List[str]:
+    # the last entry of a saved conversation holds the whole transcript
+    content = chat_history.get("content") or []
+    if not content:
+        return []
+    return [
+        message["content"] for message in content[-1].get("messages", [])
+        # app_rag.py sends the prompt a second time with the retrieved context appended
+        if message.get("role") == "user" and message.get("content") and "\n\nContext: " not in message["content"]
+    ]
+
+
+def load_conversation(path: Union[str, Path]) -> Conversation:
+    """
+    Read the user turns of a conversation.
+
+    Args:
+        path (Union[str, Path]): A text file with one user turn per line, or a conversation saved by
+            `save_json_chat_history`.
+
+    Returns:
+        Conversation: The conversation, named after the file.
+    """
+    path = Path(path)
+    if path.suffix == ".json":
+        turns = _history_turns(json.loads(path.read_text(encoding="utf-8")))
+    else:
+        turns = [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    return Conversation(name=path.stem, turns=turns)
+
+
+def load_conversations(paths: Iterable[Union[str, Path]]) -> List[Conversation]:
+    """
+    Read the conversations of the given files; a directory stands for its `.txt` and `.json` files.
+    """
+    files: List[Path] = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(file for file in path.iterdir() if file.suffix in (".txt", ".json")))
+        else:
+            files.append(path)
+    conversations = [load_conversation(file) for file in files]
+    return [conversation for conversation in conversations if conversation.turns]
+
+
+async def replay_conversation(agent: Agent, conversation: Conversation) -> List[TurnResult]:
+    """
+    Send the turns of a conversation one after the other to `agent`, recording the stage timings of each.
+    A failed turn is recorded with its error and the conversation goes on.
+    """
+    results: List[TurnResult] = []
+    for turn, prompt in enumerate(conversation.turns):
+        answer, error = None, None
+        try:
+            answer, _ = await agent.arun(prompt)
+        except Exception as exc:
+            logger.warning("Turn {t} of {c} failed: {e}", t=turn, c=conversation.name, e=exc)
+            error = f"{type(exc).__name__}: {exc}"
+        results.append(TurnResult(conversation=conversation.name, turn=turn, prompt=prompt, answer=answer,
+                                  error=error, timings=agent.last_timings or TurnTimings()))
+    return results
+
+
+async def replay_conversations(make_agent: Callable[[], Agent], conversations: List[Conversation],
+                               concurrency: int = 4) -> List[TurnResult]:
+    """
+    Replay conversations without microphone, speaker or window, `concurrency` of them at a time.
+
+    Every conversation gets its own agent, hence its own context; the clients given to `make_agent` (and
+    their connection pools and caches) are shared.
+
+    Args:
+        make_agent (Callable[[], Agent]): Build an agent with a fresh `ConversationContext`.
+        conversations (List[Conversation]): The conversations to replay.
+        concurrency (int): Maximum number of conversations running at the same time.
+
+    Returns:
+        List[TurnResult]: One result per turn, in the order of the conversations.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def replay(conversation: Conversation) -> List[TurnResult]:
+        async with semaphore:
+            agent = make_agent()
+            try:
+                return await replay_conversation(agent, conversation)
+            finally:
+                await agent.context.aclose()
+
+    replayed = await asyncio.gather(*(replay(conversation) for conversation in conversations))
+    return [result for results in replayed for result in results]
+
+
+def _percentile(samples: List[float], percentile: float) -> float:
+    samples = sorted(samples)
+    rank = percentile / 100 * (len(samples) - 1)
+    low = int(rank)
+    high = min(low + 1, len(samples) - 1)
+    return samples[low] + (samples[high] - samples[low]) * (rank - low)
+
+
+def summarize_timings(results: List[TurnResult]) -> Dict[str, Any]:
+    """
+    Median, p95 and maximum of every stage over the turns, in seconds, with the total token usage.
+    """
+    summary: Dict[str, Any] = {"turns": len(results), "errors": sum(result.error is not None for result in results)}
+    for stage in STAGES:
+        samples = [value for result in results if (value := getattr(result.timings, stage)) is not None]
+        if samples:
+            summary[stage] = {"p50": _percentile(samples, 50), "p95": _percentile(samples, 95), "max": max(samples)}
+    for usage in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+        summary[usage] = sum(getattr(result.timings, usage) for result in results)
+    return summary
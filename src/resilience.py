@@ -0,0 +1,490 @@
+import asyncio
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Type, TypeVar, Union
+
+import openai
+from loguru import logger
+
+from src.executors import get_executor
+from src.runnables import Runnable
+
+T = TypeVar("T")
+
+# errors worth sending the same request elsewhere; a 400 would fail on every deployment
+RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    TimeoutError,
+)
+
+
+class LatencyTracker:
+    """
+    Rolling window of observed latencies, used to derive an adaptive hedging delay.
+    """
+
+    def __init__(self, window: int = 200, percentile: float = 95.0, initial_delay: float = 2.0,
+                 min_delay: float = 0.05, min_samples: int = 20):
+        """
+        Args:
+            window (int): Number of most recent latencies kept.
+            percentile (float): Percentile of the window used as hedging delay.
+            initial_delay (float): Delay used until `min_samples` latencies were observed.
+            min_delay (float): Lower bound of the delay, so that a fast streak does not duplicate every call.
+            min_samples (int): Number of observations needed before the percentile is trusted.
+        """
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def value(self, percentile: Optional[float] = None) -> Optional[float]:
+        """
+        Return the given percentile (the tracker's by default) of the window, None while it is empty.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = (percentile if percentile is not None else self.percentile) / 100 * (len(samples) - 1)
+        low = int(rank)
+        high = min(low + 1, len(samples) - 1)
+        return samples[low] + (samples[high] - samples[low]) * (rank - low)
+
+    def delay(self) -> float:
+        """
+        Seconds after which a duplicate request is sent.
+        """
+        if len(self._samples) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.value())
+
+
+async def _discard(result: Any) -> None:
+    # a losing streaming response holds a connection open until it is closed
+    close = getattr(result, "aclose", None) or getattr(result, "close", None)
+    if close is not None:
+        outcome = close()
+        if asyncio.iscoroutine(outcome):
+            await outcome
+
+
+async def hedged(factory: Callable[[], Awaitable[T]], delay: float, max_hedges: int = 1,
+                 tracker: Optional[LatencyTracker] = None,
+                 discard: Callable[[Any], Awaitable[None]] = _discard) -> Tuple[T, int]:
+    """
+    Await `factory()`; each time `delay` seconds pass without an answer, start a duplicate attempt,
+    up to `max_hedges` duplicates. The first attempt to succeed wins, the others are cancelled.
+
+    Args:
+        factory (Callable[[], Awaitable[T]]): Starts one attempt.
+        delay (float): Seconds to wait before each duplicate.
+        max_hedges (int): Maximum number of duplicates.
+        tracker (Optional[LatencyTracker]): Receives the latency of the winning attempt.
+        discard (Callable[[Any], Awaitable[None]]): Releases the result of an attempt that succeeded too late.
+
+    Returns:
+        Tuple[T, int]: The winning result and the number of attempts started.
+
+    Raises:
+        Exception: The error of the first attempt, once no attempt is left running.
+    """
+    started: Dict[asyncio.Future, float] = {}
+
+    def launch() -> None:
+        started[asyncio.ensure_future(factory())] = perf_counter()
+
+    launch()
+    pending = set(started)
+    winner: Optional[asyncio.Future] = None
+    errors: List[BaseException] = []
+    try:
+        while pending:
+            can_hedge = len(started) <= max_hedges
+            done, pending = await asyncio.wait(pending, timeout=delay if can_hedge else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    break
+                errors.append(task.exception())
+            if winner is not None:
+                if tracker is not None:
+                    tracker.observe(perf_counter() - started[winner])
+                return winner.result(), len(started)
+            if not done:
+                launch()
+                pending = {task for task in started if not task.done()}
+        raise errors[0]
+    finally:
+        losers = [task for task in started if task is not winner]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+        for task in losers:
+            # finished between the winner and the cancellation
+            if not task.cancelled() and task.exception() is None:
+                await discard(task.result())
+
+
+class _PrefetchedStream:
+    """
+    Streaming response whose first chunk was already received.
+    """
+
+    def __init__(self, stream, first_chunk):
+        self._stream = stream
+        self._first_chunk = first_chunk
+        self._first_pending = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._first_pending:
+            self._first_pending = False
+            return self._first_chunk
+        return await self._stream.__anext__()
+
+    async def close(self) -> None:
+        await _discard(self._stream)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+async def _first_chunk(stream) -> _PrefetchedStream:
+    try:
+        first_chunk = await stream.__anext__()
+    except StopAsyncIteration:
+        return stream
+    except BaseException:
+        await _discard(stream)
+        raise
+    return _PrefetchedStream(stream, first_chunk)
+
+
+class _Operation:
+    def __init__(self, owner: "AsyncResilientClient", path: Tuple[str, ...]):
+        self._owner = owner
+        self._path = path
+
+    async def create(self, **kwargs):
+        return await self._owner.call(self._path, **kwargs)
+
+
+class _Namespace:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class AsyncResilientClient:
+    """
+    Wrap an async OpenAI client (and fallback deployments) with per-call deadlines, hedged requests
+    and fallbacks, behind the usual `client.chat.completions.create` and `client.embeddings.create`.
+
+    A request that has not answered after the adaptive p95 latency of its operation is duplicated; the
+    first answer wins and the other request is cancelled. For streaming requests the answer is the first
+    chunk, so hedging targets the time to first token. When the primary deployment fails with a
+    retryable error or misses its deadline, the request goes to the next fallback.
+
+    Usage:
+        client = AsyncResilientClient(primary_client, fallbacks=[(secondary_client, "gpt-4o-secondary")], timeout=20)
+        stream = await client.chat.completions.create(model="gpt-4o-attention-project", messages=messages, stream=True)
+    """
+
+    def __init__(self, client, fallbacks: Sequence[Union[Any, Tuple[Any, Optional[str]]]] = (),
+                 timeout: Optional[float] = 30.0, hedge: bool = True, max_hedges: int = 1,
+                 retry_on: Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS,
+                 tracker_factory: Callable[[], LatencyTracker] = LatencyTracker):
+        """
+        Args:
+            client: The primary AsyncOpenAI / AsyncAzureOpenAI client.
+            fallbacks: Clients tried in order after the primary one, optionally paired with the deployment
+                (model) name to use on them.
+            timeout (Optional[float]): Deadline in seconds of each deployment's attempt, until the first chunk
+                for streaming requests.
+            hedge (bool): Duplicate slow requests.
+            max_hedges (int): Maximum number of duplicates of one request.
+            retry_on (Tuple[Type[BaseException], ...]): Errors that move the request to the next fallback.
+            tracker_factory (Callable[[], LatencyTracker]): Creates the latency tracker of an operation and deployment.
+        """
+        self.deployments: List[Tuple[Any, Optional[str]]] = [(client, None)] + [
+            fallback if isinstance(fallback, tuple) else (fallback, None) for fallback in fallbacks
+        ]
+        self.timeout = timeout
+        self.hedge = hedge
+        self.max_hedges = max_hedges
+        self.retry_on = retry_on
+        self.tracker_factory = tracker_factory
+        self.trackers: Dict[Tuple[str, int], LatencyTracker] = {}
+        self.stats: Dict[str, int] = {"calls": 0, "hedged": 0, "timeouts": 0, "fallbacks": 0}
+
+        self.chat = _Namespace(completions=_Operation(self, ("chat", "completions")))
+        self.embeddings = _Operation(self, ("embeddings",))
+
+    def tracker(self, operation: str, deployment: int = 0) -> LatencyTracker:
+        key = (operation, deployment)
+        if key not in self.trackers:
+            self.trackers[key] = self.tracker_factory()
+        return self.trackers[key]
+
+    async def call(self, path: Tuple[str, ...], **kwargs):
+        """
+        Send a request to the resource at `path` of the clients (e.g. ("chat", "completions")).
+        """
+        operation = ".".join(path)
+        self.stats["calls"] += 1
+        last_error: Optional[BaseException] = None
+        for index, (client, model) in enumerate(self.deployments):
+            if index:
+                self.stats["fallbacks"] += 1
+                logger.warning("{op} falling back to deployment {i} after: {e!r}", op=operation, i=index, e=last_error)
+            resource = client
+            for name in path:
+                resource = getattr(resource, name)
+            request = dict(kwargs, model=model) if model is not None else kwargs
+            try:
+                return await self._attempt(resource, request, self.tracker(operation, index))
+            except self.retry_on as e:
+                last_error = e
+        raise last_error
+
+    async def _attempt(self, resource, request: Dict[str, Any], tracker: LatencyTracker):
+        async def once():
+            response = await resource.create(**request)
+            if request.get("stream"):
+                response = await _first_chunk(response)
+            return response
+
+        async def hedged_once():
+            if not self.hedge:
+                started = perf_counter()
+                response = await once()
+                tracker.observe(perf_counter() - started)
+                return response
+            response, attempts = await hedged(once, tracker.delay(), self.max_hedges, tracker)
+            self.stats["hedged"] += attempts - 1
+            return response
+
+        try:
+            return await asyncio.wait_for(hedged_once(), self.timeout)
+        except asyncio.TimeoutError as e:
+            self.stats["timeouts"] += 1
+            raise TimeoutError(f"No answer within {self.timeout} seconds.") from e
+
+    def __getattr__(self, name):
+        # everything else (audio, models, ...) goes to the primary client untouched
+        return getattr(self.deployments[0][0], name)
+
+
+class RunnableTimeout(Runnable):
+    """
+    Fail a runnable with `TimeoutError` when it takes longer than `timeout` seconds.
+
+    On the synchronous path the wrapped runnable runs in the shared thread pool; a thread cannot be
+    interrupted, so a timed out call keeps running there in the background and its result is dropped.
+    """
+
+    def __init__(self, runnable: Runnable, timeout: float):
+        """
+        Args:
+            runnable (Runnable): The runnable to bound.
+            timeout (float): Deadline in seconds.
+        """
+        super().__init__()
+        self.runnable = runnable
+        self.timeout = timeout
+        self.name = f"RunnableTimeout({runnable.step_name})"
+
+    def process(self, data, *args, **kwargs):
+        context = contextvars.copy_context()
+        future = get_executor("thread").submit(context.run, self.runnable.invoke, data, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError as e:
+            future.cancel()
+            raise TimeoutError(f"{self.runnable.step_name} did not finish within {self.timeout} seconds.") from e
+
+    async def aprocess(self, data, *args, **kwargs):
+        try:
+            return await asyncio.wait_for(self.runnable.ainvoke(data, *args, **kwargs), self.timeout)
+        except asyncio.TimeoutError as e:
+            raise TimeoutError(f"{self.runnable.step_name} did not finish within {self.timeout} seconds.") from e
+
+
+class RunnableHedge(Runnable):
+    """
+    Duplicate a slow call of a runnable and keep whichever copy answers first.
+
+    The duplicate is started once the call has been running for longer than the p95 latency seen so far
+    (or a fixed `delay`). Only wrap runnables without side effects: both copies may run to completion on
+    the synchronous path, and a cancelled asynchronous copy may already have reached the server.
+    """
+
+    def __init__(self, runnable: Runnable, delay: Optional[float] = None, max_hedges: int = 1,
+                 tracker: Optional[LatencyTracker] = None):
+        """
+        Args:
+            runnable (Runnable): The runnable to hedge.
+            delay (Optional[float]): Fixed delay before a duplicate; adaptive when None.
+            max_hedges (int): Maximum number of duplicates of one call.
+            tracker (Optional[LatencyTracker]): Latency tracker driving the adaptive delay.
+        """
+        super().__init__()
+        self.runnable = runnable
+        self.delay = delay
+        self.max_hedges = max_hedges
+        self.tracker = tracker or LatencyTracker()
+        self.hedged_calls = 0
+        self.name = f"RunnableHedge({runnable.step_name})"
+
+    def _delay(self) -> float:
+        return self.delay if self.delay is not None else self.tracker.delay()
+
+    def process(self, data, *args, **kwargs):
+        executor = get_executor("thread")
+        started: Dict[Any, float] = {}
+
+        def launch():
+            context = contextvars.copy_context()
+            started[executor.submit(context.run, self.runnable.invoke, data, *args, **kwargs)] = perf_counter()
+
+        launch()
+        pending = set(started)
+        errors = []
+        while pending:
+            can_hedge = len(started) <= self.max_hedges
+            done, pending = wait(pending, timeout=self._delay() if can_hedge else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self.tracker.observe(perf_counter() - started[future])
+                    self.hedged_calls += len(started) > 1
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result()
+                errors.append(future.exception())
+            if not done:
+                launch()
+                pending = {future for future in started if not future.done()}
+        raise errors[0]
+
+    async def aprocess(self, data, *args, **kwargs):
+        result, attempts = await hedged(lambda: self.runnable.ainvoke(data, *args, **kwargs),
+                                        self._delay(), self.max_hedges, self.tracker)
+        self.hedged_calls += attempts > 1
+        return result
+
+    async def aprocess_stream(self, data, *args, **kwargs):
+        """
+        Hedge on the time to the first chunk, then stream the winning copy.
+        """
+        async def first_chunk():
+            stream = self.runnable.astream(data, *args, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        async def discard(result):
+            await result[0].aclose()
+
+        (stream, chunk), attempts = await hedged(first_chunk, self._delay(), self.max_hedges, self.tracker, discard)
+        self.hedged_calls += attempts > 1
+        try:
+            if chunk is None:
+                return
+            yield chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+
+class RunnableWithFallbacks(Runnable):
+    """
+    Run a runnable and, when it fails, the fallbacks in order until one succeeds.
+
+    When streaming, a fallback only takes over while no chunk has been yielded yet.
+    """
+
+    def __init__(self, runnable: Runnable, fallbacks: Sequence[Runnable],
+                 exceptions: Tuple[Type[BaseException], ...] = (Exception,)):
+        """
+        Args:
+            runnable (Runnable): The runnable tried first.
+            fallbacks (Sequence[Runnable]): Runnables tried next, in order.
+            exceptions (Tuple[Type[BaseException], ...]): Errors handled by falling back; others propagate.
+        """
+        super().__init__()
+        self.runnable = runnable
+        self.fallbacks = list(fallbacks)
+        self.exceptions = exceptions
+        self.name = f"RunnableWithFallbacks({runnable.step_name})"
+
+    @property
+    def runnables(self) -> List[Runnable]:
+        return [self.runnable, *self.fallbacks]
+
+    def _log(self, runnable: Runnable, error: BaseException) -> None:
+        logger.warning("{step} failed, falling back: {e!r}", step=runnable.step_name, e=error)
+
+    def process(self, data, *args, **kwargs):
+        for runnable in self.runnables[:-1]:
+            try:
+                return runnable.invoke(data, *args, **kwargs)
+            except self.exceptions as e:
+                self._log(runnable, e)
+        return self.runnables[-1].invoke(data, *args, **kwargs)
+
+    async def aprocess(self, data, *args, **kwargs):
+        for runnable in self.runnables[:-1]:
+            try:
+                return await runnable.ainvoke(data, *args, **kwargs)
+            except self.exceptions as e:
+                self._log(runnable, e)
+        return await self.runnables[-1].ainvoke(data, *args, **kwargs)
+
+    def process_stream(self, data, *args, **kwargs):
+        for runnable in self.runnables[:-1]:
+            started = False
+            try:
+                for chunk in runnable.stream(data, *args, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except self.exceptions as e:
+                if started:
+                    raise
+                self._log(runnable, e)
+        yield from self.runnables[-1].stream(data, *args, **kwargs)
+
+    async def aprocess_stream(self, data, *args, **kwargs):
+        for runnable in self.runnables[:-1]:
+            started = False
+            try:
+                async for chunk in runnable.astream(data, *args, **kwargs):
+                    started = True
+                    yield chunk
+                return
+            except self.exceptions as e:
+                if started:
+                    raise
+                self._log(runnable, e)
+        async for chunk in self.runnables[-1].astream(data, *args, **kwargs):
+            yield chunk
@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Any, Dict, Literal, Optional, Tuple, Union
+
+from src.runnables import Runnable
+
+
+def _canonical(obj: Any) -> Any:
+    """
+    Convert `obj` into JSON-serializable data that only depends on its value.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, bytes):
+        return {"__bytes__": hashlib.sha256(obj).hexdigest()}
+    if isinstance(obj, dict):
+        items = [(json.dumps(_canonical(key), sort_keys=True), _canonical(value)) for key, value in obj.items()]
+        return {"__dict__": sorted(items, key=lambda item: item[0])}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(value) for value in obj]
+    if isinstance(obj, (set, frozenset)):
+        return {"__set__": sorted(json.dumps(_canonical(value), sort_keys=True) for value in obj)}
+    if hasattr(obj, "model_dump"):
+        return {"__model__": type(obj).__qualname__, "fields": _canonical(obj.model_dump())}
+    if hasattr(obj, "detach") and hasattr(obj, "numpy"):
+        obj = obj.detach().cpu().numpy()
+    if hasattr(obj, "tobytes") and hasattr(obj, "dtype") and hasattr(obj, "shape"):
+        return {"__array__": [str(obj.dtype), list(obj.shape), hashlib.sha256(obj.tobytes()).hexdigest()]}
+    raise TypeError(f"Cannot build a stable cache key for an object of type {type(obj).__name__}.")
+
+
+def stable_hash(obj: Any) -> str:
+    """
+    SHA-256 of a canonical encoding of `obj`. Equal values hash equally across processes and runs.
+
+    Args:
+        obj (Any): JSON-like data, pydantic models, NumPy arrays or torch tensors, arbitrarily nested.
+
+    Returns:
+        str: The hex digest.
+    """
+    encoded = json.dumps(_canonical(obj), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU cache with optional per-entry expiry.
+    """
+
+    def __init__(self, max_entries: Optional[int] = 1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, time() + ttl if ttl is not None else None)
+            self._entries.move_to_end(key)
+            while self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """
+    Persistent cache in a SQLite file. Values are pickled; the least recently used entries
+    are evicted once `max_entries` or `max_bytes` is exceeded.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike] = ".cache/runnable_cache.sqlite",
+                 max_entries: Optional[int] = 100_000, max_bytes: Optional[int] = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        now = time()
+        with self._lock:
+            row = self._connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return False, None
+            self._connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return True, pickle.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now + ttl if ttl is not None else None, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        count, total = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        excess_entries = count - self.max_entries if self.max_entries is not None else 0
+        excess_bytes = total - self.max_bytes if self.max_bytes is not None else 0
+        if excess_entries <= 0 and excess_bytes <= 0:
+            return
+
+        # expired entries go first, then least recently used ones
+        expired = self._connection.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time(),))
+        self.evictions += expired.rowcount
+        to_delete = []
+        count, total = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        for key, size in self._connection.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            if (self.max_entries is None or count <= self.max_entries) and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            to_delete.append((key,))
+            count -= 1
+            total -= size
+        self._connection.executemany("DELETE FROM cache WHERE key = ?", to_delete)
+        self.evictions += len(to_delete)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncFlight:
+    def __init__(self, task: asyncio.Task):
+        # the call itself, shared by every caller of the key
+        self.task = task
+        self.waiters = 0
+
+
+class RunnableCache(Runnable):
+    """
+    Memoize a runnable that is a pure function of its input.
+
+    Entries are keyed on a stable hash of the input and `version`; bump `version` whenever the result
+    for the same input changes (a new index, another prompt, ...). Concurrent calls with the same key
+    are coalesced into a single call of the wrapped runnable.
+    """
+
+    def __init__(self, runnable: Runnable,
+                 backend: Union[Literal["memory", "sqlite"], MemoryCacheBackend, SQLiteCacheBackend] = "memory",
+                 ttl: Optional[float] = None, max_entries: Optional[int] = 1024, version: str = "",
+                 path: Union[str, os.PathLike] = ".cache/runnable_cache.sqlite"):
+        """
+        Args:
+            runnable (Runnable): The runnable to memoize.
+            backend: "memory", "sqlite" or a backend instance, which may be shared between caches.
+            ttl (Optional[float]): Seconds an entry stays valid, forever when None.
+            max_entries (Optional[int]): Maximum number of entries kept by a backend created here.
+            version (str): Tag mixed into every key.
+            path (Union[str, os.PathLike]): Database file of a "sqlite" backend created here.
+        """
+        super().__init__()
+        if backend == "memory":
+            backend = MemoryCacheBackend(max_entries=max_entries)
+        elif backend == "sqlite":
+            backend = SQLiteCacheBackend(path=path, max_entries=max_entries)
+        elif isinstance(backend, str):
+            raise ValueError(f"Cache backend must be 'memory' or 'sqlite', got '{backend}'.")
+        self.runnable = runnable
+        self.backend = backend
+        self.ttl = ttl
+        self.version = version
+        self.name = f"RunnableCache({runnable.step_name})"
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[str, _AsyncFlight] = {}
+
+    def _key(self, data, args, kwargs) -> str:
+        return stable_hash({
+            "step": self.runnable.step_name,
+            "version": self.version,
+            "input": data,
+            "args": list(args),
+            "kwargs": kwargs,
+        })
+
+    def process(self, data, *args, **kwargs):
+        key = self._key(data, args, kwargs)
+        hit, value = self.backend.get(key)
+        if hit:
+            self.hits += 1
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            self.coalesced += 1
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        self.misses += 1
+        try:
+            flight.value = self.runnable.invoke(data, *args, **kwargs)
+            self.backend.set(key, flight.value, ttl=self.ttl)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def _abackend(self, method, *args, **kwargs):
+        # the SQLite backend does disk I/O and waits for its lock, off the event loop; memory lookups are cheap
+        if isinstance(self.backend, MemoryCacheBackend):
+            return method(*args, **kwargs)
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def aprocess(self, data, *args, **kwargs):
+        key = self._key(data, args, kwargs)
+        hit, value = await self._abackend(self.backend.get, key)
+        if hit:
+            self.hits += 1
+            return value
+
+        flight = self._async_flights.get(key)
+        if flight is None:
+            self.misses += 1
+            flight = self._async_flights[key] = _AsyncFlight(
+                asyncio.ensure_future(self._afill(key, data, args, kwargs)))
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        try:
+            # shield: a caller being cancelled, the first one included, does not cancel the call the others wait for
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # nobody is left to wait for the result
+            if flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def _afill(self, key: str, data, args, kwargs):
+        try:
+            value = await self.runnable.ainvoke(data, *args, **kwargs)
+            await self._abackend(self.backend.set, key, value, ttl=self.ttl)
+            return value
+        finally:
+            del self._async_flights[key]
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit, miss, coalesced-call and eviction counters.
+        """
+        # a coalesced call is served without running the wrapped runnable, like a hit
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.backend.evictions,
+            "entries": len(self.backend),
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
@@ -1,4 +1,103 @@
+import asyncio
 from abc import ABC, abstractmethod
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from src.tracing import get_tracer
+
+
+def _apply_to_valid(inputs, fn):
+    """
+    Call `fn` with the items of `inputs` that are not exceptions and merge its
+    outputs back in place. Items that failed upstream are carried along untouched;
+    if `fn` raises, every item it was given holds the exception.
+    """
+    valid_indices = [i for i, item in enumerate(inputs) if not isinstance(item, BaseException)]
+    outputs = list(inputs)
+    if not valid_indices:
+        return outputs
+    try:
+        results = fn([inputs[i] for i in valid_indices])
+    except Exception as e:
+        results = [e] * len(valid_indices)
+    for i, result in zip(valid_indices, results):
+        outputs[i] = result
+    return outputs
+
+
+async def _aapply_to_valid(inputs, fn):
+    valid_indices = [i for i, item in enumerate(inputs) if not isinstance(item, BaseException)]
+    outputs = list(inputs)
+    if not valid_indices:
+        return outputs
+    try:
+        results = await fn([inputs[i] for i in valid_indices])
+    except Exception as e:
+        results = [e] * len(valid_indices)
+    for i, result in zip(valid_indices, results):
+        outputs[i] = result
+    return outputs
+
+
+def _combine_chunks(chunks):
+    """
+    Buffer the chunks of a streamed value back into the complete value.
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return None
+    if len(chunks) == 1:
+        return chunks[0]
+    if all(isinstance(chunk, str) for chunk in chunks):
+        return "".join(chunks)
+    if all(isinstance(chunk, dict) for chunk in chunks):
+        combined = {}
+        for chunk in chunks:
+            combined.update(chunk)
+        return combined
+    if all(isinstance(chunk, list) for chunk in chunks):
+        return [item for chunk in chunks for item in chunk]
+    return chunks[-1]
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+async def _aiter_in_thread(iterator):
+    """
+    Drain a synchronous iterator in a worker thread, yielding its items as they arrive.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+
+    def drain():
+        try:
+            for item in iterator:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+    worker = asyncio.ensure_future(asyncio.to_thread(drain))
+    while True:
+        item, error = await queue.get()
+        if item is done:
+            await worker
+            if error is not None:
+                raise error
+            return
+        yield item
+
+
+def _raise_first_error(outputs):
+    for output in outputs:
+        if isinstance(output, BaseException):
+            raise output
+    return outputs
 
 class Runnable(ABC):
     def __init__(self, next=None):
@@ -12,12 +111,206 @@ class Runnable(ABC):
         """
         pass
 
+    async def aprocess(self, data, *args, **kwargs):
+        """
+        Asynchronous counterpart of `process`. Subclasses doing native async I/O
+        override it, otherwise the synchronous `process` is offloaded to a worker
+        thread so that it does not block the event loop.
+        """
+        return await asyncio.to_thread(self.process, data, *args, **kwargs)
+
+    def process_batch(self, inputs, *args, max_concurrency=None, **kwargs):
+        """
+        Process several inputs at once and return one output per input, in order.
+        An item that failed holds its exception instead of an output. By default
+        `process` runs on each item in a thread pool; steps that can batch natively
+        (one embedding request for all queries, ...) override this.
+        """
+        def run(item):
+            try:
+                return self.process(item, *args, **kwargs)
+            except Exception as e:
+                return e
+
+        if len(inputs) <= 1:
+            return [run(item) for item in inputs]
+        with ThreadPoolExecutor(max_workers=max_concurrency or min(32, len(inputs))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, run, item) for item in inputs]
+            return [future.result() for future in futures]
+
+    async def aprocess_batch(self, inputs, *args, max_concurrency=None, **kwargs):
+        """
+        Asynchronous counterpart of `process_batch`, running `aprocess` on each item
+        with at most `max_concurrency` items in flight.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def run(item):
+            try:
+                if semaphore is None:
+                    return await self.aprocess(item, *args, **kwargs)
+                async with semaphore:
+                    return await self.aprocess(item, *args, **kwargs)
+            except Exception as e:
+                return e
+
+        return list(await asyncio.gather(*(run(item) for item in inputs)))
+
+    @property
+    def step_name(self):
+        """
+        Name of the step in traces.
+        """
+        return getattr(self, "name", None) or type(self).__name__
+
+    def _run_process(self, data, *args, **kwargs):
+        tracer = get_tracer()
+        if tracer is None:
+            return self.process(data, *args, **kwargs)
+        with tracer.span(self.step_name, data) as span:
+            output = self.process(data, *args, **kwargs)
+            tracer.end_span(span, output)
+            return output
+
+    async def _arun_process(self, data, *args, **kwargs):
+        tracer = get_tracer()
+        if tracer is None:
+            return await self.aprocess(data, *args, **kwargs)
+        with tracer.span(self.step_name, data) as span:
+            output = await self.aprocess(data, *args, **kwargs)
+            tracer.end_span(span, output)
+            return output
+
     def invoke(self, data, *args, **kwargs):
-        processed_data = self.process(data, *args, **kwargs)
+        processed_data = self._run_process(data, *args, **kwargs)
         if self.next is not None:
             return self.next.invoke(processed_data)
         return processed_data
 
+    async def ainvoke(self, data, *args, **kwargs):
+        processed_data = await self._arun_process(data, *args, **kwargs)
+        if self.next is not None:
+            return await self.next.ainvoke(processed_data)
+        return processed_data
+
+    def batch(self, inputs, *args, max_concurrency=None, return_exceptions=False, **kwargs):
+        """
+        Run many inputs through the runnable. Each step receives the whole batch, so
+        steps that batch natively make one call instead of one per input.
+
+        Args:
+            inputs (Iterable): The inputs.
+            max_concurrency (Optional[int]): Maximum number of items processed at the same time by a step.
+            return_exceptions (bool): Return the exception of a failed item in its slot instead of raising it.
+
+        Returns:
+            list: The outputs, in the order of the inputs.
+        """
+        outputs = self._batch(list(inputs), max_concurrency, *args, **kwargs)
+        return outputs if return_exceptions else _raise_first_error(outputs)
+
+    async def abatch(self, inputs, *args, max_concurrency=None, return_exceptions=False, **kwargs):
+        """
+        Asynchronous counterpart of `batch`.
+        """
+        outputs = await self._abatch(list(inputs), max_concurrency, *args, **kwargs)
+        return outputs if return_exceptions else _raise_first_error(outputs)
+
+    def _run_process_batch(self, items, max_concurrency, *args, **kwargs):
+        tracer = get_tracer()
+        if tracer is None:
+            return self.process_batch(items, *args, max_concurrency=max_concurrency, **kwargs)
+        with tracer.span(f"{self.step_name}.batch", items) as span:
+            outputs = self.process_batch(items, *args, max_concurrency=max_concurrency, **kwargs)
+            tracer.end_span(span, outputs)
+            return outputs
+
+    async def _arun_process_batch(self, items, max_concurrency, *args, **kwargs):
+        tracer = get_tracer()
+        if tracer is None:
+            return await self.aprocess_batch(items, *args, max_concurrency=max_concurrency, **kwargs)
+        with tracer.span(f"{self.step_name}.batch", items) as span:
+            outputs = await self.aprocess_batch(items, *args, max_concurrency=max_concurrency, **kwargs)
+            tracer.end_span(span, outputs)
+            return outputs
+
+    def _batch(self, inputs, max_concurrency, *args, **kwargs):
+        outputs = _apply_to_valid(
+            inputs, lambda items: self._run_process_batch(items, max_concurrency, *args, **kwargs)
+        )
+        if self.next is not None:
+            return self.next._batch(outputs, max_concurrency)
+        return outputs
+
+    async def _abatch(self, inputs, max_concurrency, *args, **kwargs):
+        outputs = await _aapply_to_valid(
+            inputs, lambda items: self._arun_process_batch(items, max_concurrency, *args, **kwargs)
+        )
+        if self.next is not None:
+            return await self.next._abatch(outputs, max_concurrency)
+        return outputs
+
+    def process_stream(self, data, *args, **kwargs):
+        """
+        Yield the output incrementally. Runnables without incremental output,
+        which is the default, yield their final value once.
+        """
+        yield self.process(data, *args, **kwargs)
+
+    async def aprocess_stream(self, data, *args, **kwargs):
+        """
+        Asynchronous counterpart of `process_stream`.
+        """
+        if type(self).process_stream is not Runnable.process_stream:
+            # only a synchronous streaming implementation exists, drain it in a thread
+            async for chunk in _aiter_in_thread(self.process_stream(data, *args, **kwargs)):
+                yield chunk
+        else:
+            yield await self.aprocess(data, *args, **kwargs)
+
+    def stream(self, data, *args, **kwargs):
+        """
+        Yield the output of the runnable as it is produced. Steps that do not stream
+        buffer their input until it is complete; streaming steps, such as the final
+        LLM call, yield their chunks as they arrive.
+        """
+        yield from self.transform(iter([data]), *args, **kwargs)
+
+    async def astream(self, data, *args, **kwargs):
+        """
+        Asynchronous counterpart of `stream`.
+        """
+        async for chunk in self.atransform(_aiter([data]), *args, **kwargs):
+            yield chunk
+
+    def transform(self, chunks, *args, **kwargs):
+        """
+        Consume the chunks of the upstream step and yield the chunks of this one.
+        """
+        data = _combine_chunks(chunks)
+        output = self.process_stream(data, *args, **kwargs)
+        tracer = get_tracer()
+        if tracer is not None:
+            output = tracer.trace_iterator(self.step_name, data, output)
+        if self.next is not None:
+            yield from self.next.transform(output)
+        else:
+            yield from output
+
+    async def atransform(self, chunks, *args, **kwargs):
+        """
+        Asynchronous counterpart of `transform`.
+        """
+        data = _combine_chunks([chunk async for chunk in chunks])
+        output = self.aprocess_stream(data, *args, **kwargs)
+        tracer = get_tracer()
+        if tracer is not None:
+            output = tracer.atrace_iterator(self.step_name, data, output)
+        if self.next is not None:
+            output = self.next.atransform(output)
+        async for chunk in output:
+            yield chunk
+
     def __or__(self, other):
         return RunnableSequence(self, other)
 
@@ -30,10 +323,45 @@ class RunnableSequence(Runnable):
     def process(self, data):
         return data
 
+    async def aprocess(self, data):
+        return data
+
     def invoke(self, data=None, *args, **kwargs):
-        first_result = self.first.invoke(data, *args, **kwargs)
-        return self.second.invoke(first_result, *args, **kwargs)
-    
+        tracer = get_tracer()
+        if tracer is None:
+            first_result = self.first.invoke(data, *args, **kwargs)
+            return self.second.invoke(first_result, *args, **kwargs)
+        with tracer.span(self.step_name, data) as span:
+            first_result = self.first.invoke(data, *args, **kwargs)
+            output = self.second.invoke(first_result, *args, **kwargs)
+            tracer.end_span(span, output)
+            return output
+
+    async def ainvoke(self, data=None, *args, **kwargs):
+        tracer = get_tracer()
+        if tracer is None:
+            first_result = await self.first.ainvoke(data, *args, **kwargs)
+            return await self.second.ainvoke(first_result, *args, **kwargs)
+        with tracer.span(self.step_name, data) as span:
+            first_result = await self.first.ainvoke(data, *args, **kwargs)
+            output = await self.second.ainvoke(first_result, *args, **kwargs)
+            tracer.end_span(span, output)
+            return output
+
+    def _batch(self, inputs, max_concurrency, *args, **kwargs):
+        first_results = self.first._batch(inputs, max_concurrency, *args, **kwargs)
+        return self.second._batch(first_results, max_concurrency, *args, **kwargs)
+
+    async def _abatch(self, inputs, max_concurrency, *args, **kwargs):
+        first_results = await self.first._abatch(inputs, max_concurrency, *args, **kwargs)
+        return await self.second._abatch(first_results, max_concurrency, *args, **kwargs)
+
+    def transform(self, chunks, *args, **kwargs):
+        return self.second.transform(self.first.transform(chunks, *args, **kwargs), *args, **kwargs)
+
+    def atransform(self, chunks, *args, **kwargs):
+        return self.second.atransform(self.first.atransform(chunks, *args, **kwargs), *args, **kwargs)
+
 
 class DictTransformer(Runnable):
     def __init__(self, mapping):
@@ -41,11 +369,62 @@ class DictTransformer(Runnable):
         self.mapping = mapping
 
     def process(self, data):
+        # pool-backed branches (RunnableExecutor) are submitted first so that they run in parallel
+        futures = {
+            key: runnable.submit(data)
+            for key, runnable in self.mapping.items()
+            if hasattr(runnable, "submit") and runnable.next is None
+        }
         result = {}
         for key, runnable in self.mapping.items():
-            result[key] = runnable.invoke(data)
+            result[key] = futures[key].result() if key in futures else runnable.invoke(data)
         return result
 
+    async def aprocess(self, data):
+        # branches are independent of each other, so they run concurrently
+        outputs = await asyncio.gather(*(runnable.ainvoke(data) for runnable in self.mapping.values()))
+        return dict(zip(self.mapping.keys(), outputs))
+
+    def process_batch(self, inputs, max_concurrency=None):
+        branch_outputs = [runnable._batch(inputs, max_concurrency) for runnable in self.mapping.values()]
+        return self._merge_branches(branch_outputs)
+
+    async def aprocess_batch(self, inputs, max_concurrency=None):
+        branch_outputs = await asyncio.gather(
+            *(runnable._abatch(inputs, max_concurrency) for runnable in self.mapping.values())
+        )
+        return self._merge_branches(branch_outputs)
+
+    def _merge_branches(self, branch_outputs):
+        results = []
+        for item_outputs in zip(*branch_outputs):
+            # an item fails as a whole if any of its branches failed
+            error = next((output for output in item_outputs if isinstance(output, BaseException)), None)
+            results.append(error if error is not None else dict(zip(self.mapping.keys(), item_outputs)))
+        return results
+
 class RunnablePassthrough(Runnable):
     def process(self, data):
-        return data
\ No newline at end of file
+        return data
+
+    async def aprocess(self, data):
+        return data
+
+    def process_batch(self, inputs, max_concurrency=None):
+        return list(inputs)
+
+    async def aprocess_batch(self, inputs, max_concurrency=None):
+        return list(inputs)
+
+    def transform(self, chunks, *args, **kwargs):
+        # nothing to compute, chunks flow through without being buffered
+        if self.next is not None:
+            yield from self.next.transform(chunks)
+        else:
+            yield from chunks
+
+    async def atransform(self, chunks, *args, **kwargs):
+        if self.next is not None:
+            chunks = self.next.atransform(chunks)
+        async for chunk in chunks:
+            yield chunk
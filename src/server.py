@@ -0,0 +1,327 @@
+import asyncio
+import hmac
+import json
+from collections import deque
+from pathlib import Path
+from time import monotonic
+from typing import Any, Callable, Deque, Dict, Optional, Type
+from uuid import uuid4
+
+from aiohttp import WSCloseCode, WSMsgType, web
+from loguru import logger
+
+from src.agent import Agent
+from src.tools.base import AsyncBaseTool
+from src.tools.get_weather import WeatherTool
+from src.tools.google_tools.credentials import GoogleCredsManager
+from src.tools.google_tools.google_tools_executors import (CalendarInsertTool, CalendarReadTool, GmailReadTool,
+                                                           GmailSendTool)
+
+# tools of every session: they run in the server for all its users, so none may block the event loop or act on
+# the server host (GoogleMapsTool geolocates the host and opens a window on it)
+SESSION_TOOLS: Dict[str, Type[AsyncBaseTool]] = {
+    "get_weather_data": WeatherTool,
+}
+# added for the users with their own Google credentials
+SESSION_GOOGLE_TOOLS: Dict[str, Type[AsyncBaseTool]] = {
+    "read_gmail_emails": GmailReadTool,
+    "send_gmail_email": GmailSendTool,
+    "get_calendar_appointments": CalendarReadTool,
+    "insert_calendar_appointment": CalendarInsertTool,
+}
+
+
+def session_tools(google: bool) -> Dict[str, Type[AsyncBaseTool]]:
+    """
+    Tools offered to a session, with the Gmail and Calendar tools when its user has Google credentials.
+    """
+    return {**SESSION_TOOLS, **SESSION_GOOGLE_TOOLS} if google else dict(SESSION_TOOLS)
+
+
+def session_credentials(user: str, google_tokens: Dict[str, str]) -> Optional[GoogleCredsManager]:
+    """
+    Google credentials of a server user, from their token file in `google_tokens`; None without one, since the
+    credentials manager would start an interactive OAuth flow on the server.
+    """
+    token_file = google_tokens.get(user)
+    if token_file is None or not Path(token_file).is_file():
+        return None
+    return GoogleCredsManager(token_file_path=Path(token_file))
+
+
+class Session:
+    """
+    Conversation of one user: its agent (hence its context) and the turn running in it, if any.
+    """
+
+    def __init__(self, session_id: str, user: str, agent: Agent):
+        self.id = session_id
+        self.user = user
+        self.agent = agent
+        self.turn: Optional[asyncio.Task] = None
+        self.connection: Optional[web.WebSocketResponse] = None
+        self.turns = 0
+        self.last_active = monotonic()
+
+    @property
+    def busy(self) -> bool:
+        return self.turn is not None and not self.turn.done()
+
+    def cancel(self) -> bool:
+        """
+        Cancel the running turn; returns whether there was one.
+        """
+        if not self.busy:
+            return False
+        self.turn.cancel()
+        return True
+
+    async def aclose(self) -> None:
+        if self.cancel():
+            try:
+                await self.turn
+            except (asyncio.CancelledError, Exception):
+                pass
+        await self.agent.context.aclose()
+
+
+class _Outbox:
+    """
+    Messages to one client, written by a single task.
+
+    The model is never made to wait for a slow client: text waiting behind it is merged into the last queued
+    message, so the queue grows by control messages only. A client that does not read a message within
+    `send_timeout`, or lets more than `max_pending` messages pile up, is disconnected.
+    """
+
+    def __init__(self, ws: web.WebSocketResponse, send_timeout: float, max_pending: int = 256):
+        self.ws = ws
+        self.send_timeout = send_timeout
+        self.max_pending = max_pending
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._ready = asyncio.Event()
+        self._overflow = False
+
+    def put(self, message: Dict[str, Any]) -> None:
+        if message["type"] == "text" and self._queue and self._queue[-1]["type"] == "text":
+            self._queue[-1]["text"] += message["text"]
+        elif len(self._queue) >= self.max_pending:
+            self._overflow = True
+        else:
+            self._queue.append(message)
+        self._ready.set()
+
+    async def run(self) -> None:
+        while not self.ws.closed:
+            await self._ready.wait()
+            self._ready.clear()
+            if self._overflow:
+                logger.warning("Disconnecting a client with {n} unread messages", n=len(self._queue))
+                await self.ws.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b"too many unread messages")
+                return
+            while self._queue:
+                try:
+                    await asyncio.wait_for(self.ws.send_json(self._queue.popleft()), self.send_timeout)
+                except (asyncio.TimeoutError, ConnectionError) as exc:
+                    logger.warning("Disconnecting a slow client: {e}", e=exc or "send timeout")
+                    await self.ws.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b"slow client")
+                    return
+
+
+class AssistantServer:
+    """
+    WebSocket server hosting many conversations in one event loop.
+
+    Every session has its own agent and `ConversationContext`, built by `make_agent` for the user who opened it,
+    with that user's credentials for the tools; only the OpenAI clients, their connection pool and the caches are
+    shared. At most `max_active_turns` turns run at the same time, the others wait for their turn in arrival order.
+
+    Clients authenticate in the handshake with one of `tokens`, in an `Authorization: Bearer <token>` header or,
+    for browsers, which cannot set headers on a WebSocket, a `token` query parameter; other connections are
+    refused with 401.
+
+    Protocol, JSON messages over `GET /ws` (`GET /ws?session=<id>` resumes a session of the same user after a
+    disconnection):
+        client: {"type": "prompt", "text": "..."} | {"type": "cancel"}
+        server: {"type": "session", "session": id} | {"type": "text", "text": "..."}
+                | {"type": "done", "answer": "...", "timings": {...}} | {"type": "cancelled"}
+                | {"type": "error", "error": "..."}
+
+    Closing the connection cancels the running turn; the session itself is kept for `idle_timeout` seconds.
+
+    Usage:
+        server = AssistantServer(make_agent=lambda user: Agent(client, model, tools, assembler, ConversationContext(),
+                                                               verbose=False),
+                                 tokens={"<secret>": "alice"})
+        web.run_app(server.app(), port=8080)
+    """
+
+    def __init__(self, make_agent: Callable[[str], Agent], tokens: Dict[str, str], max_sessions: int = 500,
+                 max_active_turns: int = 200, idle_timeout: float = 900.0, send_timeout: float = 10.0,
+                 max_prompt_chars: int = 8000):
+        """
+        Args:
+            make_agent (Callable[[str], Agent]): Build the agent of a new session of the given user, with a fresh
+                `ConversationContext`.
+            tokens (Dict[str, str]): Users by access token; every connection is refused when empty.
+            max_sessions (int): Maximum number of sessions kept; new connections are refused beyond it.
+            max_active_turns (int): Maximum number of turns running at the same time.
+            idle_timeout (float): Seconds after which a disconnected session is closed.
+            send_timeout (float): Seconds a client may take to read a message before it is disconnected.
+            max_prompt_chars (int): Maximum length of a prompt.
+        """
+        self.make_agent = make_agent
+        self.tokens = tokens
+        self.max_sessions = max_sessions
+        self.max_active_turns = max_active_turns
+        self.idle_timeout = idle_timeout
+        self.send_timeout = send_timeout
+        self.max_prompt_chars = max_prompt_chars
+        self.sessions: Dict[str, Session] = {}
+        self.turns_served = 0
+        self._turn_slots: Optional[asyncio.Semaphore] = None
+        self._active_turns = 0
+        self._reaper: Optional[asyncio.Task] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/ws", self.websocket)
+        app.router.add_get("/stats", self.stats)
+        app.on_startup.append(self._on_startup)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "sessions": len(self.sessions),
+            "connected": sum(session.connection is not None for session in self.sessions.values()),
+            "active_turns": self._active_turns,
+            "waiting_turns": sum(session.busy for session in self.sessions.values()) - self._active_turns,
+            "turns_served": self.turns_served,
+        })
+
+    def authenticate(self, request: web.Request) -> Optional[str]:
+        """
+        The user of the request's token, None without a valid one.
+        """
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer":
+            token = request.query.get("token", "")
+        if not token:
+            return None
+        user = None
+        # every token is compared, in constant time, so the timing tells nothing about them
+        for candidate, name in self.tokens.items():
+            if hmac.compare_digest(candidate.encode(), token.encode()):
+                user = name
+        return user
+
+    def _session(self, session_id: Optional[str], user: str) -> Optional[Session]:
+        session = self.sessions.get(session_id) if session_id else None
+        if session is not None and session.user != user:
+            # another user's session: theirs stays untouched, and its existence is not revealed
+            session = None
+        if session is None and len(self.sessions) < self.max_sessions:
+            # ids are always the server's, a client cannot pick one
+            session = Session(str(uuid4()), user, self.make_agent(user))
+            self.sessions[session.id] = session
+            logger.info("Session {id} of {user} opened, {n} sessions", id=session.id, user=user,
+                        n=len(self.sessions))
+        return session
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        user = self.authenticate(request)
+        if user is None:
+            raise web.HTTPUnauthorized(text="Missing or invalid token.", headers={"WWW-Authenticate": "Bearer"})
+        session = self._session(request.query.get("session"), user)
+        if session is None:
+            raise web.HTTPServiceUnavailable(text="Too many sessions, try again later.")
+        if session.connection is not None:
+            # the same user reconnected before the old connection was found dead
+            session.cancel()
+            await session.connection.close(code=WSCloseCode.POLICY_VIOLATION, message=b"session resumed elsewhere")
+
+        ws = web.WebSocketResponse(heartbeat=30.0, max_msg_size=4 * self.max_prompt_chars)
+        await ws.prepare(request)
+        session.connection = ws
+        outbox = _Outbox(ws, send_timeout=self.send_timeout)
+        writer = asyncio.create_task(outbox.run())
+        outbox.put({"type": "session", "session": session.id})
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    data = json.loads(message.data)
+                    kind = data["type"]
+                except (ValueError, KeyError, TypeError):
+                    outbox.put({"type": "error", "error": "Expected a JSON object with a 'type'."})
+                    continue
+                if kind == "cancel":
+                    session.cancel()
+                elif kind != "prompt":
+                    outbox.put({"type": "error", "error": f"Unknown message type '{kind}'."})
+                elif session.busy:
+                    outbox.put({"type": "error", "error": "A turn is already running, cancel it first."})
+                elif not isinstance(text := data.get("text"), str) or not text.strip():
+                    outbox.put({"type": "error", "error": "The prompt is empty."})
+                elif len(text) > self.max_prompt_chars:
+                    outbox.put({"type": "error", "error": f"The prompt is over {self.max_prompt_chars} characters."})
+                else:
+                    session.turn = asyncio.create_task(self._run_turn(session, outbox, text))
+        finally:
+            if session.connection is ws:
+                # nobody is left to read the answer
+                session.cancel()
+                session.connection = None
+            session.last_active = monotonic()
+            writer.cancel()
+        return ws
+
+    async def _run_turn(self, session: Session, outbox: _Outbox, prompt: str) -> None:
+        try:
+            async with self._turn_slots:
+                self._active_turns += 1
+                try:
+                    answer, _ = await session.agent.arun(prompt, on_text=lambda text: outbox.put({"type": "text",
+                                                                                                  "text": text}))
+                finally:
+                    self._active_turns -= 1
+        except asyncio.CancelledError:
+            outbox.put({"type": "cancelled"})
+            raise
+        except Exception as exc:
+            logger.exception("Turn of session {id} failed", id=session.id)
+            outbox.put({"type": "error", "error": f"{type(exc).__name__}: {exc}"})
+        else:
+            timings = session.agent.last_timings
+            outbox.put({"type": "done", "answer": answer, "timings": timings.model_dump() if timings else None})
+        finally:
+            session.turns += 1
+            session.last_active = monotonic()
+            self.turns_served += 1
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            now = monotonic()
+            idle = [session for session in self.sessions.values()
+                    if session.connection is None and not session.busy and now - session.last_active > self.idle_timeout]
+            for session in idle:
+                del self.sessions[session.id]
+                await session.aclose()
+            if idle:
+                logger.info("Closed {n} idle sessions, {left} left", n=len(idle), left=len(self.sessions))
+
+    async def _on_startup(self, app: web.Application) -> None:
+        # created in the loop of the server
+        self._turn_slots = asyncio.Semaphore(self.max_active_turns)
+        self._reaper = asyncio.create_task(self._reap())
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        self._reaper.cancel()
+        sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            if session.connection is not None:
+                await session.connection.close(code=WSCloseCode.GOING_AWAY, message=b"server shutdown")
+        await asyncio.gather(*(session.aclose() for session in sessions))
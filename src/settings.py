@@ -1,3 +1,5 @@
+from typing import Dict, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -23,6 +25,32 @@ class Settings(BaseSettings):
     AZURE_OPENAI_GPT_API_VERSION: str
     AZURE_OPENAI_GPT_ENDPOINT: str
 
+    # secondary deployment used when the primary one fails or misses its deadline
+    AZURE_OPENAI_GPT_FALLBACK_ENDPOINT: Optional[str] = None
+    AZURE_OPENAI_GPT_FALLBACK_API_KEY: Optional[str] = None
+    AZURE_OPENAI_GPT_FALLBACK_DEPLOYMENT: Optional[str] = None
+    LLM_TIMEOUT: float = 30.0
+    # SQLite file of the completion cache, disabled when unset
+    LLM_CACHE_PATH: Optional[str] = None
+    # quota per deployment, e.g. {"gpt-4o-attention-project": {"rpm": 300, "tpm": 50000}}
+    RATE_LIMITS: Dict[str, Dict[str, int]] = {}
+    # token budget of the conversation history, older turns are summarized
+    CONTEXT_MAX_TOKENS: int = 6000
+    # native function calling, the `<tool>` text protocol when False
+    NATIVE_TOOLS: bool = True
+    # server mode (app_tools.py --serve): sessions kept, turns running at once, seconds before a disconnected
+    # session is closed
+    SERVER_MAX_SESSIONS: int = 500
+    SERVER_MAX_ACTIVE_TURNS: int = 200
+    SERVER_IDLE_TIMEOUT: float = 900.0
+    # users of the server by access token, e.g. {"<secret>": "alice"}; every connection is refused when empty
+    SERVER_TOKENS: Dict[str, str] = {}
+    # Google token file of each server user, e.g. {"alice": "tokens/alice.json"}; users without one get no
+    # Gmail or Calendar tools
+    SERVER_GOOGLE_TOKENS: Dict[str, str] = {}
+    # PDF file or directory of PDFs answered from by app_rag.py when no path is given
+    RAG_DOCUMENTS_PATH: Optional[str] = None
+
     model_config = SettingsConfigDict(env_file=".env")
 
     #class Config:
@@ -0,0 +1,292 @@
+import json
+from typing import Any, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel
+
+from src.metadata import Metadata
+
+TOOL_OPEN = "<tool>"
+TOOL_CLOSE = "</tool>"
+
+
+class TextDelta(BaseModel):
+    type: Literal["text"] = "text"
+    text: str
+
+
+class ToolStart(BaseModel):
+    type: Literal["tool_start"] = "tool_start"
+    index: int
+    # None for a `<tool>` text call, whose name is only known once it is complete
+    id: Optional[str] = None
+    name: Optional[str] = None
+
+
+class ToolArgsComplete(BaseModel):
+    type: Literal["tool_args_complete"] = "tool_args_complete"
+    index: int
+    id: Optional[str] = None
+    name: str
+    arguments: Dict[str, Any]
+    # the arguments as sent by the model (JSON)
+    raw_arguments: str
+
+    def as_tool_call(self) -> Dict[str, Any]:
+        """
+        The call in the format of an assistant message.
+        """
+        return {"id": self.id, "type": "function", "function": {"name": self.name, "arguments": self.raw_arguments}}
+
+
+class Usage(BaseModel):
+    type: Literal["usage"] = "usage"
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int = 0
+
+
+class Finish(BaseModel):
+    type: Literal["finish"] = "finish"
+    reason: str
+
+
+StreamEvent = Union[TextDelta, ToolStart, ToolArgsComplete, Usage, Finish]
+
+
+def decode_embedded_json(value: Any) -> Any:
+    """
+    Decode the strings of a parsed payload that hold a JSON object or array themselves, as models sometimes
+    send nested arguments. Other strings are left alone without trying to parse them.
+    """
+    if isinstance(value, str):
+        stripped = value.strip()
+        if stripped[:1] in ("{", "[") and stripped[-1:] in ("}", "]"):
+            try:
+                return decode_embedded_json(json.loads(stripped))
+            except json.JSONDecodeError:
+                return value
+        return value
+    if isinstance(value, dict):
+        return {key: decode_embedded_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_embedded_json(item) for item in value]
+    return value
+
+
+class JsonObjectScanner:
+    """
+    Tell when a JSON object received in pieces is complete, in constant time per character and without parsing it.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.complete = False
+
+    def feed(self, text: str) -> bool:
+        """
+        Scan the next piece; returns whether the object is complete.
+        """
+        for char in text:
+            if self.complete:
+                break
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                self.complete = self.depth == 0
+        return self.complete
+
+
+class _NativeCall:
+    __slots__ = ("id", "name", "arguments", "scanner", "done")
+
+    def __init__(self):
+        self.id: Optional[str] = None
+        self.name = ""
+        self.arguments: List[str] = []
+        self.scanner = JsonObjectScanner()
+        self.done = False
+
+
+class StreamParser:
+    """
+    Incremental parser of a chat completion stream.
+
+    Text goes through a state machine that finds `<tool>` and `</tool>` even when a tag is split across chunks,
+    holding back at most one partial tag; native tool call arguments go through a `JsonObjectScanner` and are
+    decoded once, when complete. Each chunk costs time proportional to its own size only.
+
+    Usage:
+        parser = StreamParser()
+        async for chunk in stream:
+            for event in parser.feed(chunk):
+                ...
+        events = parser.close()
+    """
+
+    def __init__(self):
+        self.metadata: Optional[Metadata] = None
+        self._parts: List[str] = []
+        self._in_tool = False
+        # partial tag held back from the text
+        self._pending = ""
+        self._tool_body: List[str] = []
+        self._text_calls = 0
+        self._calls: Dict[int, _NativeCall] = {}
+
+    @property
+    def text(self) -> str:
+        """
+        The whole text received so far, `<tool>` calls included.
+        """
+        return "".join(self._parts)
+
+    @property
+    def tool_calls(self) -> List[Dict[str, Any]]:
+        """
+        The native tool calls received so far, in the format of an assistant message.
+        """
+        return [
+            {"id": call.id, "type": "function",
+             "function": {"name": call.name, "arguments": "".join(call.arguments) or "{}"}}
+            for _, call in sorted(self._calls.items())
+        ]
+
+    def feed(self, chunk: Any) -> List[StreamEvent]:
+        """
+        Parse a `ChatCompletionChunk`.
+        """
+        events: List[StreamEvent] = []
+        if self.metadata is None:
+            self.metadata = Metadata(**chunk.model_dump())
+        if chunk.usage:
+            # last chunk when the request sets stream_options={"include_usage": True}
+            self.metadata.record_usage(chunk.usage)
+            events.append(Usage(prompt_tokens=self.metadata.prompt_tokens,
+                                completion_tokens=self.metadata.completion_tokens,
+                                cached_tokens=self.metadata.cached_tokens))
+        for choice in chunk.choices[:1]:
+            delta = choice.delta
+            if delta.content:
+                self._parts.append(delta.content)
+                self._feed_text(delta.content, events)
+            for tool_call in delta.tool_calls or ():
+                self._feed_tool_call(tool_call, events)
+            if choice.finish_reason:
+                events.extend(self._finish_calls())
+                events.append(Finish(reason=choice.finish_reason))
+        return events
+
+    def close(self) -> List[StreamEvent]:
+        """
+        End of the stream: flush the text held back and the calls still open.
+        """
+        events: List[StreamEvent] = []
+        if self._pending and not self._in_tool:
+            events.append(TextDelta(text=self._pending))
+        self._pending = ""
+        events.extend(self._finish_calls())
+        return events
+
+    def _feed_text(self, text: str, events: List[StreamEvent]) -> None:
+        # common case: no tag can start in this token
+        if not self._pending and "<" not in text:
+            if self._in_tool:
+                self._tool_body.append(text)
+            else:
+                events.append(TextDelta(text=text))
+            return
+
+        plain: List[str] = []
+        for char in text:
+            tag = TOOL_CLOSE if self._in_tool else TOOL_OPEN
+            candidate = self._pending + char
+            # drop characters that can no longer start the tag
+            while candidate and not tag.startswith(candidate):
+                plain.append(candidate[0])
+                candidate = candidate[1:]
+            self._pending = candidate
+            if candidate != tag:
+                continue
+            self._pending = ""
+            if self._in_tool:
+                self._tool_body.extend(plain)
+                plain = []
+                self._in_tool = False
+                event = self._text_call_complete()
+                if event is not None:
+                    events.append(event)
+            else:
+                if plain:
+                    events.append(TextDelta(text="".join(plain)))
+                plain = []
+                self._in_tool = True
+                self._tool_body = []
+                events.append(ToolStart(index=self._text_calls))
+        if plain:
+            if self._in_tool:
+                self._tool_body.extend(plain)
+            else:
+                events.append(TextDelta(text="".join(plain)))
+
+    def _text_call_complete(self) -> Optional[ToolArgsComplete]:
+        index = self._text_calls
+        self._text_calls += 1
+        try:
+            payload = json.loads("".join(self._tool_body))
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(payload, dict) or not payload.get("name"):
+            return None
+        arguments = payload.get("parameters") or {}
+        return ToolArgsComplete(index=index, name=payload["name"], arguments=decode_embedded_json(arguments),
+                                raw_arguments=json.dumps(arguments))
+
+    def _feed_tool_call(self, delta: Any, events: List[StreamEvent]) -> None:
+        call = self._calls.get(delta.index)
+        if call is None:
+            call = self._calls[delta.index] = _NativeCall()
+        call.id = delta.id or call.id
+        function = delta.function
+        if function is not None and function.name:
+            started = bool(call.name)
+            call.name += function.name
+            if not started:
+                events.append(ToolStart(index=delta.index, id=call.id, name=call.name))
+        if function is not None and function.arguments:
+            call.arguments.append(function.arguments)
+            if not call.done and call.scanner.feed(function.arguments):
+                event = self._native_call_complete(delta.index, call)
+                if event is not None:
+                    events.append(event)
+
+    def _native_call_complete(self, index: int, call: _NativeCall) -> Optional[ToolArgsComplete]:
+        call.done = True
+        raw = "".join(call.arguments) or "{}"
+        try:
+            arguments = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        return ToolArgsComplete(index=index, id=call.id, name=call.name, arguments=decode_embedded_json(arguments),
+                                raw_arguments=raw)
+
+    def _finish_calls(self) -> List[StreamEvent]:
+        # calls whose arguments never closed, or have none
+        events: List[StreamEvent] = []
+        for index, call in sorted(self._calls.items()):
+            if not call.done:
+                event = self._native_call_complete(index, call)
+                if event is not None:
+                    events.append(event)
+        return events
@@ -9,6 +9,7 @@ import msvcrt
 import wave
 import asyncio
 from src.settings import settings
+from src.clients import get_async_whisper_client
 
 
 CHANNELS: int = 1
@@ -96,11 +97,7 @@ class SpeechToText:
             logger.info("Temporary audio file cleaned up.")
 
 async def main():
-    whisper_client = AsyncAzureOpenAI(
-        api_key=settings.AZURE_OPENAI_WHISPER_API_KEY,
-        api_version=settings.AZURE_OPENAI_WHISPER_API_VERSION,
-        azure_endpoint=settings.AZURE_OPENAI_WHISPER_ENDPOINT
-    )
+    whisper_client = get_async_whisper_client()
     stt = SpeechToText()
     
     try:
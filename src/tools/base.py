@@ -2,21 +2,69 @@ from abc import ABC, abstractmethod
 from typing import (
     Any,
     Annotated,
+    ClassVar,
     Literal,
     Optional,
     TypedDict,
     Union,
     Dict,
+    FrozenSet,
+    Tuple,
     cast,
 )
 
 from pydantic import BaseModel, ConfigDict, Field, SkipValidation
 from pydantic.fields import FieldInfo
 from typing_extensions import NotRequired
+from loguru import logger
+
+from src.runnable_cache import MemoryCacheBackend, stable_hash
+
+# results of the tools declaring a `cache_ttl`, shared by every conversation of the process
+_tool_cache = MemoryCacheBackend(max_entries=1024)
+# bumped when a write tool invalidates a read tool, which makes its older keys unreachable; per scope, so that
+# a write to one account leaves the cached reads of the others
+_generations: Dict[Tuple[Optional[str], str], int] = {}
+
+
+def clear_tool_cache() -> None:
+    _tool_cache.clear()
+
+
+def _normalize(value: Any, casefold: bool = False) -> Any:
+    """
+    Normalize an argument for the cache key: repeated whitespace does not matter in strings, nor case with
+    `casefold`.
+    """
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        return value.casefold() if casefold else value
+    if isinstance(value, dict):
+        return {key: _normalize(item, casefold) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item, casefold) for item in value]
+    return value
 
 
 class AsyncBaseTool(BaseModel, ABC):
 
+    # no side effects: the agent may run the tool as soon as its call is complete in the stream
+    read_only: ClassVar[bool] = False
+    # side effects, but safe to start before the end of the response (e.g. idempotent)
+    speculative: ClassVar[bool] = False
+    # seconds a result is reused for the same arguments, never cached when None
+    cache_ttl: ClassVar[Optional[float]] = None
+    # names of the tools whose cached results are stale once this one has run
+    invalidates: ClassVar[Tuple[str, ...]] = ()
+    # fields that are not arguments of the call and stay out of the cache key
+    cache_exclude: ClassVar[FrozenSet[str]] = frozenset({"args_schema", "metadata"})
+    # arguments whose case does not change the result, e.g. a city name
+    cache_casefold: ClassVar[FrozenSet[str]] = frozenset()
+    # tokens the result may take in the prompt, see `src.tools.compaction`
+    output_budget: ClassVar[Optional[int]] = 2000
+    # fields of the result records, most important first: the last ones are truncated first
+    field_priority: ClassVar[Tuple[str, ...]] = ()
+
     args_schema: Annotated[Optional[Dict[str, Any]], "Dict value to be used in json format for prompt"] = Field(
     default=None, description="Json schema for the tool."
     )
@@ -30,8 +78,51 @@ class AsyncBaseTool(BaseModel, ABC):
 
 
 
+    @classmethod
+    def tool_name(cls) -> str:
+        extra = cls.model_config.get("json_schema_extra")
+        return extra.get("name", cls.__name__) if isinstance(extra, dict) else cls.__name__
+
+    def cache_scope(self) -> Optional[str]:
+        """
+        Whose data the result is, when it depends on more than the arguments (e.g. the account of the
+        credentials); results are only shared within the same scope.
+        """
+        return None
+
+    def cache_key(self) -> str:
+        name = self.tool_name()
+        arguments = self.model_dump(mode="json", exclude=set(self.cache_exclude))
+        arguments = {key: _normalize(value, casefold=key in self.cache_casefold) for key, value in arguments.items()}
+        scope = self.cache_scope()
+        return stable_hash({"tool": name, "scope": scope, "generation": _generations.get((scope, name), 0),
+                            "arguments": arguments})
+
     async def arun(self):
-        return await self._arun()
+        if self.cache_ttl is None:
+            try:
+                return await self._arun()
+            finally:
+                self._invalidate()
+
+        key = self.cache_key()
+        hit, result = _tool_cache.get(key)
+        if hit:
+            logger.info("Tool {name} answered from cache", name=self.tool_name())
+            return result
+        result = await self._arun()
+        # empty results are also what the tools return on failure, they are fetched again next time
+        if result:
+            _tool_cache.set(key, result, ttl=self.cache_ttl)
+        self._invalidate()
+        return result
+
+    def _invalidate(self) -> None:
+        if not self.invalidates:
+            return
+        scope = self.cache_scope()
+        for name in self.invalidates:
+            _generations[scope, name] = _generations.get((scope, name), 0) + 1
     
 
     @abstractmethod
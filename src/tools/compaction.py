@@ -0,0 +1,171 @@
+import html
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+from src.context import count_tokens
+
+_TAG = re.compile(r"<[^>]+>")
+_INVISIBLE = re.compile(r"<(script|style|head)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_BREAK = re.compile(r"<\s*(br|/p|/div|/li|/tr|/h\d)\b[^>]*>", re.IGNORECASE)
+_LOOKS_HTML = re.compile(r"<(html|body|div|p|br|table|span|a)\b", re.IGNORECASE)
+# first line of the quoted message in a reply; a "From:" line only counts with the header block of the
+# quoted message under it, as Outlook writes it
+_QUOTE_HEADER = re.compile(
+    r"^(On .{0,200}wrote:|-{2,}\s*Original Message\s*-{2,})[ \t]*$"
+    r"|^From:[ \t]+\S.*(\n[ \t]*(Sent|Date|To|Cc|Subject):.*){2,}",
+    re.IGNORECASE | re.MULTILINE,
+)
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+_SPACES = re.compile(r"[ \t ]+")
+
+# a field is cut down to no less than this before the next one in priority is touched
+MIN_FIELD_TOKENS = 12
+
+
+class CompactionReport(BaseModel):
+    tokens_before: int
+    tokens_after: int
+    dropped_records: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+def strip_html(text: str) -> str:
+    """
+    Text content of an HTML document, or `text` unchanged when it is not HTML.
+    """
+    if not _LOOKS_HTML.search(text):
+        return text
+    text = _INVISIBLE.sub(" ", text)
+    text = _BREAK.sub("\n", text)
+    return html.unescape(_TAG.sub(" ", text))
+
+
+def strip_quoted(text: str) -> str:
+    """
+    Remove the quoted previous messages of a reply: `>` lines and everything after an "On ... wrote:",
+    "Original Message" or "From:/Sent:/To:" header.
+    """
+    match = _QUOTE_HEADER.search(text)
+    # a header on the first line is the message itself, not a quote
+    if match and match.start() > 0:
+        text = text[:match.start()]
+    return "\n".join(line for line in text.splitlines() if not line.lstrip().startswith(">"))
+
+
+def clean_text(text: str) -> str:
+    text = _SPACES.sub(" ", strip_html(text))
+    return _BLANK_LINES.sub("\n", text).strip()
+
+
+def _truncate(text: str, tokens: int) -> str:
+    if count_tokens(text) <= tokens:
+        return text
+    # about four characters per token, then cut back to a word boundary
+    cut = text[:tokens * 4]
+    space = cut.rfind(" ", len(cut) // 2)
+    return (cut[:space] if space != -1 else cut) + " ..."
+
+
+def _render(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_render(item) for item in value)
+    if isinstance(value, dict):
+        return "; ".join(f"{key}: {_render(item)}" for key, item in value.items())
+    return str(value)
+
+
+def _render_records(records: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(
+        "\n".join(f"{key}: {value}" for key, value in record.items() if value not in ("", None, [], {}))
+        for record in records
+    )
+
+
+def compact_tool_output(output: Any, budget: Optional[int] = None, field_priority: Sequence[str] = (),
+                        quoted_fields: Sequence[str] = ("body",)) -> Tuple[str, CompactionReport]:
+    """
+    Turn a tool result into the text sent to the model, within `budget` tokens.
+
+    Records (a dict or a list of dicts) are cleaned field by field: HTML is stripped, quoted replies (in
+    `quoted_fields`) and their long paragraphs already present in a previous record are removed. Then, while over budget,
+    the fields are truncated from the last in `field_priority` to the first (fields not listed go first), and
+    finally the last records are dropped.
+
+    Args:
+        output (Any): The tool result.
+        budget (Optional[int]): Maximum number of tokens, no limit when None.
+        field_priority (Sequence[str]): Field names, most important first.
+        quoted_fields (Sequence[str]): Fields holding message bodies, whose quoted replies are removed.
+
+    Returns:
+        Tuple[str, CompactionReport]: The compacted text and its token counts.
+    """
+    tokens_before = count_tokens(str(output))
+    if isinstance(output, dict):
+        output = [output]
+    if not (isinstance(output, list) and output and all(isinstance(record, dict) for record in output)):
+        text = clean_text(str(output))
+        if budget is not None:
+            text = _truncate(text, budget)
+        return text, CompactionReport(tokens_before=tokens_before, tokens_after=count_tokens(text))
+
+    seen_paragraphs = set()
+    records: List[Dict[str, str]] = []
+    for record in output:
+        cleaned = {}
+        for key, value in record.items():
+            text = value if isinstance(value, str) else _render(value)
+            if "<" in text:
+                text = strip_html(text)
+            if key in quoted_fields:
+                text = strip_quoted(text)
+            paragraphs = []
+            for paragraph in text.splitlines():
+                paragraph = _SPACES.sub(" ", paragraph).strip()
+                # long paragraphs repeated across messages are quoted copies of the same thread
+                if key in quoted_fields and len(paragraph) > 80:
+                    if paragraph in seen_paragraphs:
+                        continue
+                    seen_paragraphs.add(paragraph)
+                if paragraph:
+                    paragraphs.append(paragraph)
+            cleaned[key] = "\n".join(paragraphs)
+        records.append(cleaned)
+
+    dropped = 0
+    text = _render_records(records)
+    if budget is not None and count_tokens(text) > budget:
+        keys = list(dict.fromkeys(key for record in records for key in record))
+        order = [key for key in keys if key not in field_priority] + \
+            [key for key in reversed(field_priority) if key in keys]
+        for key in order:
+            excess = count_tokens(text) - budget
+            if excess <= 0:
+                break
+            # largest per-record cap that removes the excess, never below MIN_FIELD_TOKENS
+            sizes = [count_tokens(record.get(key, "")) for record in records]
+            low, high = MIN_FIELD_TOKENS, max(max(sizes), MIN_FIELD_TOKENS)
+            while low < high:
+                cap = (low + high + 1) // 2
+                if sum(max(0, size - cap) for size in sizes) >= excess:
+                    low = cap
+                else:
+                    high = cap - 1
+            cap = low
+            for record in records:
+                if key in record:
+                    record[key] = _truncate(record[key], cap)
+            text = _render_records(records)
+        while count_tokens(text) > budget and len(records) > 1:
+            records.pop()
+            dropped += 1
+            text = _render_records(records) + f"\n\n({dropped} more not shown)"
+        if count_tokens(text) > budget:
+            text = _truncate(text, budget)
+    return text, CompactionReport(tokens_before=tokens_before, tokens_after=count_tokens(text),
+                                  dropped_records=dropped)
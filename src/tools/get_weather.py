@@ -1,3 +1,5 @@
+from typing import ClassVar, FrozenSet, Optional
+
 import aiohttp
 from pydantic import ConfigDict, Field
 
@@ -10,6 +12,9 @@ class WeatherTool(AsyncBaseTool):
     Fetch detailed weather data using OpenWeatherMap API asynchronously
     """
     model_config = ConfigDict(json_schema_extra={"name": "get_weather_data"})
+    read_only: ClassVar[bool] = True
+    cache_ttl: ClassVar[Optional[float]] = 600.0
+    cache_casefold: ClassVar[FrozenSet[str]] = frozenset({"location"})
     location: str = Field(description="Location to get weather data for", examples="New York")
 
     async def _arun(self):
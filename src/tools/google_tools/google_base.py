@@ -1,5 +1,7 @@
-from typing import Optional
+import asyncio
+from typing import ClassVar, FrozenSet, Optional
 from abc import abstractmethod
+from pathlib import Path
 
 from googleapiclient.discovery import build
 from google.auth.exceptions import GoogleAuthError
@@ -12,12 +14,21 @@ from src.tools.google_tools.credentials import GoogleCredsManager
 class GoogleTool(AsyncBaseTool):
 
     google_creds_manager: Optional[GoogleCredsManager] = None
+    cache_exclude: ClassVar[FrozenSet[str]] = AsyncBaseTool.cache_exclude | {"google_creds_manager"}
 
-    async def arun(self):
-        return await self._arun()
+    def cache_scope(self) -> Optional[str]:
+        # the account whose mailbox or calendar is read
+        if self.google_creds_manager is None:
+            return None
+        return str(Path(self.google_creds_manager.token_file_path).resolve())
 
-    @abstractmethod
     async def _arun(self):
+        # the Google client library is synchronous: the credentials refresh and every `.execute()` run in a worker
+        # thread, so the calls of a response overlap and the event loop keeps reading the stream meanwhile
+        return await asyncio.to_thread(self._run)
+
+    @abstractmethod
+    def _run(self):
         pass
     
     def get_service(self, service_name: str):
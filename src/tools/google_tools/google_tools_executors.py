@@ -1,6 +1,6 @@
 import asyncio
 import os
-from typing import List, Optional, Generator, List
+from typing import ClassVar, List, Optional, Generator, List, Tuple
 from enum import Enum
 from datetime import datetime, timedelta, timezone
 from collections import namedtuple
@@ -36,12 +36,16 @@ class GmailReadTool(GoogleTool):
     Read E-mails from google gmail service
     """
     model_config = ConfigDict(json_schema_extra={"name": "read_gmail_emails"})
+    read_only: ClassVar[bool] = True
+    cache_ttl: ClassVar[Optional[float]] = 60.0
+    output_budget: ClassVar[Optional[int]] = 1500
+    field_priority: ClassVar[Tuple[str, ...]] = ("subject", "from", "date", "body", "attachments", "to", "thread_id")
     max_results: int = Field(description="Number of emails to read")
     
 
-    async def _arun(self) -> List[str]:
+    def _run(self) -> List[dict]:
         """
-        Fetch, process, and format emails into strings, returning a list of formatted email details.
+        Fetch and process emails, returning one record per email (see `field_priority`).
         """
         label: EmailLabels = EmailLabels.INBOX.value
         service = self.get_service('gmail')
@@ -52,8 +56,7 @@ class GmailReadTool(GoogleTool):
             while True:
                 try:
                     email = next(email_iterator)  # Process the next email
-                    formatted_email = self._format_email_details(email)  # Create a string representation
-                    email_strings.append(formatted_email)  # Add the string to the list
+                    email_strings.append(self._email_record(email))  # Add the record to the list
                 except StopIteration:
                     # No more emails to process
                     break
@@ -147,35 +150,33 @@ class GmailReadTool(GoogleTool):
             return []
 
 
-    def _format_email_details(self, email_details: dict) -> str:
+    def _email_record(self, email_details: dict) -> dict:
         """
-        Format email details into a single string for easy representation.
+        Flatten the email details into the record given to the model, after compaction.
         """
         headers = email_details["headers"]
-        attachments = ", ".join(email_details["attachments"]) if email_details["attachments"] else "None"
-        body_snippet = email_details["body"][:2000] + "..." if len(email_details["body"]) > 2000 else email_details["body"]
+        return {
+            "subject": headers["subject"],
+            "from": headers["from"],
+            "to": headers["to"],
+            "date": headers["date"],
+            "body": email_details["body"],
+            "attachments": email_details["attachments"],
+            "thread_id": email_details["thread_id"],
+        }
 
-        return (
-            f"--- Email Details ---\n"
-            f"Thread ID: {email_details['thread_id']}\n"
-            f"Sender: {headers['from']}\n"
-            f"Recipient: {headers['to']}\n"
-            f"Subject: {headers['subject']}\n"
-            f"Date: {headers['date']}\n"
-            f"Body (Snippet): {body_snippet}\n"
-            f"Attachments: {attachments}\n"
-        )
 
 class GmailSendTool(GoogleTool):
     """
     Send e-mails using google gmail service
     """
     model_config = ConfigDict(json_schema_extra={"name": "send_gmail_email"})
+    invalidates: ClassVar[Tuple[str, ...]] = ("read_gmail_emails",)
     to: str = Field(description="Recipient email address")
     subject: str = Field(description="Email subject")
     body: str = Field(description="Complete content of the email. Expected to be long text.")
 
-    async def _arun(self) -> List[str]:
+    def _run(self) -> List[str]:
         """
         Sends multiple emails based on input requests, returning a list of formatted results.
         Each email request should include 'to', 'subject', 'body', and optionally 'attachments'.
@@ -305,11 +306,16 @@ class CalendarReadTool(GoogleTool):
     Read events from google calendar service
     """
     model_config = ConfigDict(json_schema_extra={"name": "get_calendar_appointments"})
+    read_only: ClassVar[bool] = True
+    cache_ttl: ClassVar[Optional[float]] = 30.0
+    output_budget: ClassVar[Optional[int]] = 800
+    field_priority: ClassVar[Tuple[str, ...]] = ("summary", "start", "end", "location", "attendees", "description",
+                                                 "html_link", "event_id")
     max_results: int
     # --- Read Events ---
-    async def _arun(self) -> List[str]:
+    def _run(self) -> List[dict]:
         """
-        Lazily reads calendar events and returns a list of formatted results.
+        Lazily reads calendar events and returns one record per event (see `field_priority`).
         """
         service = self.get_service('calendar')
         logger.add("calendar_events.log", level="INFO", rotation="10 MB")
@@ -327,8 +333,7 @@ class CalendarReadTool(GoogleTool):
             while True:
                 try:
                     event_details = next(event_iterator)  # Fetch next event details lazily
-                    formatted_event = self._format_event_details(event_details)
-                    event_results.append(formatted_event)
+                    event_results.append(event_details)
                     logger.info(f"Event details fetched successfully: {event_details['summary']}")
                 except StopIteration:
                     logger.info("All events processed successfully.")
@@ -378,28 +383,13 @@ class CalendarReadTool(GoogleTool):
                 logger.error(f"Error extracting data from event: {e}")
                 yield {"summary": "Unknown Event", "status": f"Failed: {e}"}
 
-    def _format_event_details(self, event_details: dict) -> str:
-        """
-        Format the event details into a readable string.
-        """
-        logger.debug(f"Formatting event details for: {event_details['summary']}")
-        return (
-            f"--- Calendar Event Details ---\n"
-            f"Summary: {event_details['summary']}\n"
-            f"Start: {event_details['start']}\n"
-            f"End: {event_details['end']}\n"
-            f"Description: {event_details['description']}\n"
-            f"Location: {event_details['location']}\n"
-            f"Attendees: {', '.join(event_details['attendees'])}\n"
-            f"Event ID: {event_details['event_id']}\n"
-            f"HTML Link: {event_details['html_link']}\n"
-        )
 
 class CalendarInsertTool(GoogleTool):
     """
     Insert events using google calendar service
     """
     model_config = ConfigDict(json_schema_extra={"name": "insert_calendar_appointment"})
+    invalidates: ClassVar[Tuple[str, ...]] = ("get_calendar_appointments",)
     summary: str = Field(description="Appointment summary")
     location: str = Field(description="Appointment location", examples=["123 Main Street, Conference Room A, San Francisco, CA", "Online"])
     description: str = Field(description="Appointment description")
@@ -408,7 +398,7 @@ class CalendarInsertTool(GoogleTool):
     attendees: Optional[list[str]] = Field(default=None, description="List of attendee email addresses", examples=["john.doe@gmail.com", "jane.smith@gmail.com"])
 
     # --- Create Events ---
-    async def _arun(self) -> List[str]:
+    def _run(self) -> List[str]:
         """
         Lazily creates calendar events and returns a list of formatted results.
         """
@@ -1,6 +1,7 @@
 import json
 from typing import Any
 
+from src.tools.base import AsyncBaseTool
 from src.tools.schema_generation import MyGenerateJsonSchema
 
 
@@ -19,6 +20,9 @@ def lowercase_first(s: str) -> str:
 def prepare_schemas(models: list[Any]) -> str:
     """Prepare the JSON schemas for a list of pydantic models.
 
+    The schemas are sorted by function name, so that the prompt they end up in does not depend on the
+    order the tools were registered in.
+
     Args:
         models (list[Any]): A list of pydantic model instances.
 
@@ -30,10 +34,37 @@ def prepare_schemas(models: list[Any]) -> str:
         for model in models
         if hasattr(model, "model_json_schema")
     ]
-    print(schemas)
+    schemas.sort(key=lambda schema: schema.get("name") or "")
     return "\n".join(
         [
             f"Use the function '{schema.get('name')}' to {lowercase_first(s=schema.get('description'))}:\n```json\n{json.dumps(schema, indent=4)}\n```"
             for schema in schemas
         ]
-    )
\ No newline at end of file
+    )
+
+def prepare_tools(models: list[Any]) -> list[dict[str, Any]]:
+    """Prepare the `tools` parameter of a chat completion (native function calling) for a list of tools.
+
+    The fields every tool inherits from `AsyncBaseTool` are left out of the parameters, and the tools are
+    sorted by function name like in `prepare_schemas`.
+
+    Args:
+        models (list[Any]): A list of `AsyncBaseTool` classes.
+
+    Returns:
+        list[dict[str, Any]]: One function definition per tool.
+    """
+    tools = []
+    for model in models:
+        if not hasattr(model, "model_json_schema"):
+            continue
+        schema = dict(model.model_json_schema(schema_generator=MyGenerateJsonSchema))
+        name, description = schema.pop("name"), schema.pop("description", "")
+        schema["properties"] = {
+            key: value for key, value in schema.get("properties", {}).items() if key not in AsyncBaseTool.model_fields
+        }
+        if not schema.get("$defs", True):
+            del schema["$defs"]
+        tools.append({"type": "function", "function": {"name": name, "description": description, "parameters": schema}})
+    tools.sort(key=lambda tool: tool["function"]["name"])
+    return tools
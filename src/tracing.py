@@ -0,0 +1,279 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+
+class Span:
+    """
+    Timing record of one step of a chain.
+    """
+
+    __slots__ = ("span_id", "parent_id", "name", "start", "end", "lane", "input_size", "output_size",
+                 "first_chunk", "chunks", "usage", "error")
+
+    def __init__(self, span_id: int, parent_id: Optional[int], name: str, lane: str, input_size: Optional[int]):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.start = perf_counter()
+        self.end: Optional[float] = None
+        self.lane = lane
+        self.input_size = input_size
+        self.output_size: Optional[int] = None
+        self.first_chunk: Optional[float] = None
+        self.chunks = 0
+        self.usage: Dict[str, int] = {}
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else perf_counter()) - self.start
+
+
+_current_tracer: ContextVar[Optional["Tracer"]] = ContextVar("smallchain_tracer", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("smallchain_span", default=None)
+
+
+def get_tracer() -> Optional["Tracer"]:
+    """
+    Return the tracer active in the current context, None when tracing is disabled.
+    """
+    return _current_tracer.get()
+
+
+def size_of(obj: Any) -> Optional[int]:
+    """
+    Rough size of a step's input or output: length of strings and containers, number of tensor elements.
+    """
+    if isinstance(obj, (str, bytes, list, tuple, dict, set)):
+        return len(obj)
+    numel = getattr(obj, "numel", None)
+    if callable(numel):
+        return numel()
+    return None
+
+
+def record_usage(usage: Any) -> None:
+    """
+    Attach token usage (an OpenAI `usage` object or dict) to the step currently running.
+    Does nothing when tracing is disabled.
+    """
+    tracer = _current_tracer.get()
+    span = _current_span.get()
+    if tracer is None or span is None or usage is None:
+        return
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else dict(usage)
+    for key, value in usage.items():
+        if isinstance(value, int):
+            span.usage[key] = span.usage.get(key, 0) + value
+
+
+class Tracer:
+    """
+    Collects a span per runnable step while active.
+
+    Usage:
+        with trace() as tracer:
+            chain.invoke("question")
+        print(tracer.summary())
+        tracer.export_chrome_trace("trace.json")  # open in chrome://tracing or Perfetto
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.origin = perf_counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _lane(self) -> str:
+        # concurrent asyncio tasks share a thread, give each its own row in the trace
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return f"{threading.current_thread().name}:{id(task)}" if task is not None else threading.current_thread().name
+
+    def start_span(self, name: str, data: Any = None) -> Span:
+        """
+        Open a span as a child of the span running in the current context.
+        """
+        parent = _current_span.get()
+        with self._lock:
+            span = Span(next(self._ids), parent.span_id if parent else None, name, self._lane(), size_of(data))
+            self.spans.append(span)
+        return span
+
+    def end_span(self, span: Span, output: Any = None, error: Optional[BaseException] = None) -> None:
+        span.end = perf_counter()
+        if error is not None:
+            span.error = repr(error)
+        elif span.output_size is None:
+            span.output_size = size_of(output)
+
+    @contextmanager
+    def span(self, name: str, data: Any = None) -> Iterator[Span]:
+        """
+        Time the enclosed block as a step; steps started inside it become its children.
+        """
+        span = self.start_span(name, data)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        finally:
+            _current_span.reset(token)
+            if span.end is None:
+                self.end_span(span)
+
+    def trace_iterator(self, name: str, data: Any, iterator: Iterator) -> Iterator:
+        """
+        Wrap the chunk iterator of a streaming step, timing it from creation to exhaustion.
+        """
+        span = self.start_span(name, data)
+        span.output_size = 0
+        try:
+            while True:
+                token = _current_span.set(span)
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    _current_span.reset(token)
+                self._on_chunk(span, chunk)
+                yield chunk
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        finally:
+            if span.end is None:
+                self.end_span(span)
+
+    async def atrace_iterator(self, name: str, data: Any, iterator):
+        """
+        Asynchronous counterpart of `trace_iterator`.
+        """
+        span = self.start_span(name, data)
+        span.output_size = 0
+        try:
+            while True:
+                token = _current_span.set(span)
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    _current_span.reset(token)
+                self._on_chunk(span, chunk)
+                yield chunk
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        finally:
+            if span.end is None:
+                self.end_span(span)
+
+    @staticmethod
+    def _on_chunk(span: Span, chunk: Any) -> None:
+        if span.first_chunk is None:
+            span.first_chunk = perf_counter()
+        span.chunks += 1
+        span.output_size += size_of(chunk) or 0
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """
+        Export the spans in the Chrome trace-event format.
+        """
+        pid = os.getpid()
+        lanes: Dict[str, int] = {}
+        events = []
+        for span in self.spans:
+            tid = lanes.setdefault(span.lane, len(lanes) + 1)
+            args: Dict[str, Any] = {"span_id": span.span_id, "parent_id": span.parent_id,
+                                    "input_size": span.input_size, "output_size": span.output_size}
+            if span.first_chunk is not None:
+                args["time_to_first_chunk_ms"] = round((span.first_chunk - span.start) * 1e3, 3)
+                args["chunks"] = span.chunks
+            if span.usage:
+                args["usage"] = span.usage
+            if span.error:
+                args["error"] = span.error
+            events.append({
+                "name": span.name,
+                "cat": "runnable",
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6, 3),
+                "dur": round(span.duration * 1e6, 3),
+                "pid": pid,
+                "tid": tid,
+                "args": args,
+            })
+        events.extend(
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": lane}}
+            for lane, tid in lanes.items()
+        )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: Union[str, os.PathLike]) -> None:
+        """
+        Write the Chrome trace-event JSON to `path`.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, mode="w") as fp:
+            json.dump(self.to_chrome_trace(), fp)
+
+    def summary(self) -> str:
+        """
+        Per-step table of call count, total/mean/max duration, time to first chunk and tokens.
+        """
+        rows: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            row = rows.setdefault(span.name, {"calls": 0, "total": 0.0, "max": 0.0, "ttfc": [], "tokens": 0, "errors": 0})
+            row["calls"] += 1
+            row["total"] += span.duration
+            row["max"] = max(row["max"], span.duration)
+            row["tokens"] += span.usage.get("total_tokens", 0)
+            row["errors"] += span.error is not None
+            if span.first_chunk is not None:
+                row["ttfc"].append(span.first_chunk - span.start)
+
+        header = f"{'step':<32}{'calls':>7}{'total ms':>12}{'mean ms':>11}{'max ms':>11}{'ttfc ms':>11}{'tokens':>9}{'errors':>8}"
+        lines = [header, "-" * len(header)]
+        for name, row in sorted(rows.items(), key=lambda item: item[1]["total"], reverse=True):
+            ttfc = f"{sum(row['ttfc']) / len(row['ttfc']) * 1e3:.1f}" if row["ttfc"] else "-"
+            lines.append(
+                f"{name[:31]:<32}{row['calls']:>7}{row['total'] * 1e3:>12.1f}{row['total'] / row['calls'] * 1e3:>11.1f}"
+                f"{row['max'] * 1e3:>11.1f}{ttfc:>11}{row['tokens']:>9}{row['errors']:>8}"
+            )
+        return "\n".join(lines)
+
+
+@contextmanager
+def trace(tracer: Optional[Tracer] = None) -> Iterator[Tracer]:
+    """
+    Enable tracing of every runnable invoked in the enclosed block (and in the tasks and threads it starts).
+
+    Args:
+        tracer (Optional[Tracer]): Tracer collecting the spans, a new one by default.
+    """
+    tracer = tracer or Tracer()
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
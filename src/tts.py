@@ -1,13 +1,85 @@
+import re
 import pyaudio
 from openai import AsyncAzureOpenAI
-from typing import Optional
+from typing import AsyncIterator, List, Optional
 from loguru import logger
 import asyncio
 
 from src.settings import settings
+from src.clients import get_async_tts_client
 from src.visualizer import Visualizer
 
 
+# end of a sentence: punctuation, closing quotes or brackets, then a space
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s")
+_CLAUSE_END = re.compile(r"[,;:—]\s")
+# a period after a title, "e.g", "i.e" or an initial (but "I") does not end the sentence
+_ABBREVIATION = re.compile(r"\b(?:Mr|Mrs|Ms|Dr|Prof|Sr|Jr|St|vs|e\.g|i\.e|[A-HJ-Z])$")
+
+
+class SentenceSegmenter:
+    """
+    Cut streamed text into sentences, or clauses when a sentence runs long, as soon as each one is complete.
+    Only the text added since the previous call is scanned for a sentence end.
+    """
+
+    def __init__(self, min_chars: int = 12, clause_chars: int = 80, max_chars: int = 250):
+        """
+        Args:
+            min_chars (int): Shortest segment; shorter sentences are merged with the next one.
+            clause_chars (int): Length from which a segment may end at a comma, semicolon or colon.
+            max_chars (int): Length from which a segment ends at the last space, whatever the punctuation.
+        """
+        self.min_chars = min_chars
+        self.clause_chars = clause_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+        self._scanned = 0
+
+    def push(self, text: str) -> List[str]:
+        """
+        Add text; returns the segments it completed.
+        """
+        self._buffer += text
+        segments = []
+        while (segment := self._next_segment()) is not None:
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self) -> List[str]:
+        """
+        The text left at the end of the stream.
+        """
+        segment, self._buffer, self._scanned = self._buffer.strip(), "", 0
+        return [segment] if segment else []
+
+    def _cut(self, end: int) -> str:
+        segment, self._buffer = self._buffer[:end].strip(), self._buffer[end:]
+        self._scanned = 0
+        return segment
+
+    @staticmethod
+    def _is_abbreviation(buffer: str, start: int, end: int) -> bool:
+        return buffer[start:end].rstrip() == "." and _ABBREVIATION.search(buffer, max(start - 6, 0), start) is not None
+
+    def _next_segment(self) -> Optional[str]:
+        buffer = self._buffer
+        # a sentence end may have started in the previous piece
+        for match in _SENTENCE_END.finditer(buffer, max(self._scanned - 3, 0)):
+            if match.end() >= self.min_chars and not self._is_abbreviation(buffer, *match.span()):
+                return self._cut(match.end())
+        self._scanned = len(buffer)
+        if len(buffer) >= self.clause_chars:
+            clause_ends = [match.end() for match in _CLAUSE_END.finditer(buffer, self.min_chars)]
+            if clause_ends:
+                return self._cut(clause_ends[-1])
+        if len(buffer) >= self.max_chars:
+            space = buffer.rfind(" ", self.min_chars)
+            return self._cut(space + 1 if space != -1 else len(buffer))
+        return None
+
+
 class TextToSpeech:
     """
     A class to asynchronously stream OpenAI Text-to-Speech output in real-time using PyAudio.
@@ -29,6 +101,21 @@ class TextToSpeech:
         self.audio_player = pyaudio.PyAudio()
         self.stream = self.audio_player.open(format=pyaudio.paInt16, channels=1, rate=self.rate, output=True)
 
+    async def _synthesize(self, text: str) -> AsyncIterator[bytes]:
+        """
+        Stream the PCM audio of `text` from the TTS deployment.
+        """
+        async with self.client.audio.speech.with_streaming_response.create(
+            model=self.model,
+            voice=self.voice,
+            response_format="pcm",  # PCM audio format
+            input=text,
+        ) as response:
+            logger.info(f"Response Status Code: {response.status_code}")
+            if response.status_code == 200:
+                async for chunk in response.iter_bytes(chunk_size=1024):
+                    yield chunk
+
     async def stream_text_to_speech(self, text: str, visualizer: Visualizer) -> None:
         """
         Asynchronously stream OpenAI TTS audio output and play it in real-time.
@@ -38,22 +125,12 @@ class TextToSpeech:
         """
         logger.info(f"Starting TTS streaming for text: {text[:100]}...")  # Log a preview of the text
         try:
-            # Initialize the streaming response from OpenAI
-            async with self.client.audio.speech.with_streaming_response.create(
-                model=self.model,
-                voice=self.voice,
-                response_format="pcm",  # PCM audio format
-                input=text,
-            ) as response:
-                logger.info(f"Response Status Code: {response.status_code}")
-                logger.info("Streaming audio...")
-                # Play audio chunks as they are streamed
-                if response.status_code == 200:
-                    visualizer.audio_detected = True
-                    logger.info("Audio data received.")
-                    async for chunk in response.iter_bytes(chunk_size=1024):
-                        #self.stream.write(chunk)
-                        await asyncio.to_thread(self.stream.write, chunk)
+            logger.info("Streaming audio...")
+            # Play audio chunks as they are streamed
+            async for chunk in self._synthesize(text):
+                visualizer.audio_detected = True
+                #self.stream.write(chunk)
+                await asyncio.to_thread(self.stream.write, chunk)
             if not visualizer.audio_detected:
                 logger.warning("No audio data was received during TTS streaming.")
             visualizer.audio_detected=False
@@ -62,6 +139,13 @@ class TextToSpeech:
         finally:
             logger.info("TTS streaming finished.")
 
+    def speech_stream(self, visualizer: Visualizer, prefetch: int = 2,
+                      segmenter: Optional[SentenceSegmenter] = None) -> "SpeechStream":
+        """
+        Speak text while it is still being generated, see `SpeechStream`.
+        """
+        return SpeechStream(self, visualizer, prefetch=prefetch, segmenter=segmenter)
+
     async def close(self) -> None:
         """
         Close the audio stream and release resources asynchronously.
@@ -72,12 +156,92 @@ class TextToSpeech:
             self.stream.close()
         self.audio_player.terminate()
 
+class SpeechStream:
+    """
+    Speak streamed text sentence by sentence: each sentence is sent to TTS as soon as it is complete, up to
+    `prefetch` requests run ahead of the playback, and the audio is played in order without gaps.
+
+    Usage:
+        speech = tts.speech_stream(visualizer)
+        answer, metadata = await agent.arun(prompt, on_text=speech.feed)
+        await speech.finish()
+    """
+
+    def __init__(self, tts: TextToSpeech, visualizer: Visualizer, prefetch: int = 2,
+                 segmenter: Optional[SentenceSegmenter] = None):
+        """
+        Args:
+            tts (TextToSpeech): Synthesizes and plays the audio.
+            visualizer (Visualizer): Animated while audio plays.
+            prefetch (int): Maximum number of TTS requests running at once.
+            segmenter (Optional[SentenceSegmenter]): Cuts the text, default settings when None.
+        """
+        self.tts = tts
+        self.visualizer = visualizer
+        self.segmenter = segmenter or SentenceSegmenter()
+        self._slots = asyncio.Semaphore(prefetch)
+        # audio queue of every segment, in order; None once the text is over
+        self._segments: asyncio.Queue = asyncio.Queue()
+        self._fetches: List[asyncio.Task] = []
+        self._player = asyncio.create_task(self._play())
+
+    def feed(self, text: str) -> None:
+        """
+        Add generated text; complete sentences start their TTS request right away.
+        """
+        for segment in self.segmenter.push(text):
+            self._start(segment)
+
+    def _start(self, segment: str) -> None:
+        audio: asyncio.Queue = asyncio.Queue()
+        self._segments.put_nowait(audio)
+        self._fetches.append(asyncio.create_task(self._fetch(segment, audio)))
+
+    async def _fetch(self, segment: str, audio: asyncio.Queue) -> None:
+        try:
+            async with self._slots:
+                async for chunk in self.tts._synthesize(segment):
+                    audio.put_nowait(chunk)
+        except Exception as e:
+            logger.error(f"Error during TTS streaming: {e}")
+        finally:
+            audio.put_nowait(None)
+
+    async def _play(self) -> None:
+        while (audio := await self._segments.get()) is not None:
+            while (chunk := await audio.get()) is not None:
+                self.visualizer.audio_detected = True
+                await asyncio.to_thread(self.tts.stream.write, chunk)
+        self.visualizer.audio_detected = False
+
+    async def finish(self) -> None:
+        """
+        Speak the rest of the text and wait until everything has been played.
+        """
+        for segment in self.segmenter.flush():
+            self._start(segment)
+        self._segments.put_nowait(None)
+        try:
+            await self._player
+        finally:
+            await asyncio.gather(*self._fetches, return_exceptions=True)
+
+    async def cancel(self) -> None:
+        """
+        Stop speaking, e.g. when the user interrupts.
+        """
+        for task in [self._player, *self._fetches]:
+            task.cancel()
+        await asyncio.gather(self._player, *self._fetches, return_exceptions=True)
+        self.visualizer.audio_detected = False
+
+
 # Example usage
 async def main():
     try:
         visualizer = Visualizer("orb.mp4")
         asyncio.create_task(visualizer._run_video_loop())
-        tts_client = AsyncAzureOpenAI(api_key=settings.AZURE_OPENAI_TTS_API_KEY, api_version=settings.AZURE_OPENAI_TTS_API_VERSION, azure_endpoint=settings.AZURE_OPENAI_TTS_ENDPOINT)
+        tts_client = get_async_tts_client()
         tts_player = TextToSpeech(client=tts_client)
 
         sample_text = """
@@ -0,0 +1,9 @@
+import os
+
+# src.settings reads these at import time; the tests only talk to local fake servers
+for _name in ("AZURE_OPENAI_API_KEY", "AZURE_OPENAI_API_VERSION", "AZURE_OPENAI_ENDPOINT", "GMAIL_HOST_USER",
+              "TIMEZONE", "WEATHER_API_KEY", "GOOGLE_CREDENTIALS_PATH", "GOOGLE_MAPS_API_KEY",
+              "AZURE_OPENAI_TTS_ENDPOINT", "AZURE_OPENAI_TTS_API_KEY", "AZURE_OPENAI_TTS_API_VERSION",
+              "AZURE_OPENAI_WHISPER_ENDPOINT", "AZURE_OPENAI_WHISPER_API_KEY", "AZURE_OPENAI_WHISPER_API_VERSION",
+              "AZURE_OPENAI_GPT_API_KEY", "AZURE_OPENAI_GPT_API_VERSION", "AZURE_OPENAI_GPT_ENDPOINT"):
+    os.environ.setdefault(_name, "test")
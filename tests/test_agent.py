@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import Any, ClassVar, Dict, List, Union
+
+import pytest
+from openai.types.chat import ChatCompletionChunk
+
+from src.agent import Agent
+from src.context import ConversationContext
+from src.prompts import PromptAssembler
+from src.tools.base import AsyncBaseTool, clear_tool_cache
+from src.tools.google_tools.google_tools_executors import GmailReadTool
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_tool_cache()
+    yield
+    clear_tool_cache()
+
+
+def text_chunk(text: str) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate({
+        "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+        "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+    })
+
+
+def tool_call_chunk(index: int, name: str, arguments: Dict[str, Any]) -> ChatCompletionChunk:
+    call = {"index": index, "id": f"call_{index}", "type": "function",
+            "function": {"name": name, "arguments": json.dumps(arguments)}}
+    return ChatCompletionChunk.model_validate({
+        "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+        "choices": [{"index": 0, "delta": {"tool_calls": [call]}, "finish_reason": None}],
+    })
+
+
+class ScriptedClient:
+    """
+    Streams the given responses, one per request, a token (or a prepared chunk) at a time, and records when
+    each chunk was read.
+    """
+
+    def __init__(self, responses: List[List[Union[str, ChatCompletionChunk]]]):
+        self.responses = list(responses)
+        self.read_at: List[float] = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **request):
+        tokens = self.responses.pop(0)
+
+        async def stream():
+            for token in tokens:
+                self.read_at.append(time.perf_counter())
+                yield text_chunk(token) if isinstance(token, str) else token
+                await asyncio.sleep(0.01)
+
+        return stream()
+
+
+class SlowGoogleService:
+    """
+    Answers every request of the Google client library after `delay` seconds, blocking like `.execute()`.
+    """
+
+    def __init__(self, delay: float, response: Dict[str, Any]):
+        self.delay = delay
+        self.response = response
+
+    def __getattr__(self, name: str):
+        return lambda *args, **kwargs: self
+
+    def execute(self) -> Dict[str, Any]:
+        time.sleep(self.delay)
+        return self.response
+
+
+class SlowGmailReadTool(GmailReadTool):
+    def get_service(self, service_name: str):
+        return SlowGoogleService(0.3, {"messages": []})
+
+
+class SlowLookup(AsyncBaseTool):
+    read_only: ClassVar[bool] = True
+    calls: ClassVar[List[str]] = []
+    cancelled: ClassVar[List[str]] = []
+
+    query: str
+
+    async def _arun(self):
+        self.calls.append(self.query)
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            self.cancelled.append(self.query)
+            raise
+        return {"result": self.query}
+
+
+def make_agent(responses: List[List[str]], max_rounds: int = 4) -> Agent:
+    SlowLookup.calls, SlowLookup.cancelled = [], []
+    return Agent(ScriptedClient(responses), "m", tools={"lookup": SlowLookup}, prompt_assembler=PromptAssembler(""),
+                 context=ConversationContext(), native_tools=False, max_rounds=max_rounds, verbose=False)
+
+
+def call(query: str) -> str:
+    return '<tool>{"name": "lookup", "parameters": {"query": "%s"}}</tool>' % query
+
+
+def test_text_protocol_uses_the_first_call_and_cancels_the_others():
+    async def scenario():
+        agent = make_agent([[call("first"), " and ", call("second")], ["done"]])
+        answer, _ = await agent.arun("look up both")
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        return answer, agent.context.messages(), tasks
+
+    answer, messages, tasks = asyncio.run(scenario())
+    assert answer == "done"
+    assert "first" in messages[2]["content"]
+    assert SlowLookup.calls == ["first", "second"]
+    assert SlowLookup.cancelled == ["second"]
+    assert not tasks
+
+
+def test_last_round_cancels_the_runs_it_started():
+    async def scenario():
+        agent = make_agent([[call("late"), " that is all"]], max_rounds=1)
+        await agent.arun("look it up")
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert not asyncio.run(scenario())
+    assert SlowLookup.cancelled == ["late"]
+
+
+def google_agent(responses, speculate: bool) -> Agent:
+    return Agent(ScriptedClient(responses), "m", tools={"read_gmail_emails": SlowGmailReadTool},
+                 prompt_assembler=PromptAssembler(""), context=ConversationContext(), speculate=speculate,
+                 verbose=False)
+
+
+def test_blocking_google_calls_of_a_response_run_in_parallel():
+    async def scenario():
+        agent = google_agent([[tool_call_chunk(0, "read_gmail_emails", {"max_results": 3}),
+                               tool_call_chunk(1, "read_gmail_emails", {"max_results": 5})], ["done"]],
+                             speculate=False)
+        answer, _ = await agent.arun("read my mail")
+        return answer, agent.last_timings.tools
+
+    answer, tools = asyncio.run(scenario())
+    assert answer == "done"
+    # two calls of 0.3 s each, at the same time
+    assert 0.25 < tools < 0.5
+
+
+def test_stream_keeps_being_read_while_a_speculative_tool_runs():
+    async def scenario():
+        # the call is complete in the first chunk, the rest of the response keeps coming every 10 ms
+        agent = google_agent([[tool_call_chunk(0, "read_gmail_emails", {"max_results": 3}), *["."] * 20],
+                              ["done"]], speculate=True)
+        await agent.arun("read my mail")
+        return agent.client.read_at[:21], agent.last_timings
+
+    read_at, timings = asyncio.run(scenario())
+    gaps = [later - earlier for earlier, later in zip(read_at, read_at[1:])]
+    # the 0.3 s read ran while the stream was read, not in front of it
+    assert max(gaps) < 0.1
+    assert timings.tools < 0.25
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from src import clients
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients():
+    asyncio.run(clients.aclose_http_clients())
+    yield
+    asyncio.run(clients.aclose_http_clients())
+
+
+def test_clients_are_shared_per_resource():
+    client = clients.get_azure_client("https://a.example.com", "key", "2024-06-01")
+    assert clients.get_azure_client("https://a.example.com", "key", "2024-06-01") is client
+    assert clients.get_azure_client("https://b.example.com", "key", "2024-06-01") is not client
+    assert client._client is clients.get_http_client()
+
+
+def test_a_closed_http_client_is_not_kept_by_the_azure_clients():
+    client = clients.get_azure_client("https://a.example.com", "key", "2024-06-01")
+    clients.get_http_client().close()
+
+    renewed = clients.get_azure_client("https://a.example.com", "key", "2024-06-01")
+    assert renewed is not client
+    assert renewed._client is clients.get_http_client()
+    assert not renewed._client.is_closed
+
+
+def test_a_closed_async_http_client_is_not_kept_by_the_azure_clients():
+    async def scenario():
+        client = clients.get_async_azure_client("https://a.example.com", "key", "2024-06-01")
+        await clients.get_async_http_client().aclose()
+        # e.g. a client of another resource recreates the pool first
+        clients.get_async_http_client()
+        return client, clients.get_async_azure_client("https://a.example.com", "key", "2024-06-01")
+
+    client, renewed = asyncio.run(scenario())
+    assert renewed is not client
+    assert renewed._client is clients.get_async_http_client()
+    assert not renewed._client.is_closed
@@ -0,0 +1,26 @@
+from src.tools.compaction import strip_quoted
+
+
+def test_from_in_the_message_itself_is_kept():
+    text = "Meeting moved.\nFrom: 9am to 5pm we are in room 3.\nThanks"
+    assert strip_quoted(text) == text
+
+
+def test_underscores_are_kept():
+    text = "Sign here:\n__________\nThanks"
+    assert strip_quoted(text) == text
+
+
+def test_outlook_header_block_is_cut():
+    text = ("Sounds good.\n\nFrom: Alice <alice@example.com>\nSent: Monday, 3 June 2024 10:00\n"
+            "To: Bob <bob@example.com>\nSubject: Lunch\n\nShall we meet at noon?")
+    assert strip_quoted(text) == "Sounds good.\n"
+
+
+def test_reply_markers_are_cut():
+    assert strip_quoted("Yes.\nOn Mon, Jun 3, 2024 at 10:00 Alice wrote:\n> Lunch?") == "Yes."
+    assert strip_quoted("Yes.\n-----Original Message-----\nFrom: Alice\nLunch?") == "Yes."
+
+
+def test_quoted_lines_are_dropped():
+    assert strip_quoted("Agreed.\n> earlier\n>> older\nBye") == "Agreed.\nBye"
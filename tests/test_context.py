@@ -0,0 +1,39 @@
+import asyncio
+
+from src.context import ConversationContext
+
+
+def contents(messages):
+    return [message["content"].split()[0] for message in messages]
+
+
+def test_failed_summary_keeps_the_turns_dropped_meanwhile():
+    async def scenario():
+        release = asyncio.Event()
+        seen = []
+
+        async def failing(summary, messages):
+            await release.wait()
+            raise RuntimeError("summarizer down")
+
+        async def summarize(summary, messages):
+            seen.extend(contents(messages))
+            return "summary"
+
+        context = ConversationContext(budget=200, summarize_at=0.5, min_turns=1, summarizer=failing)
+        for i in range(12):
+            # the budget forces turns out of the window while the first summary runs
+            context.append({"role": "user", "content": f"u{i} " + "x" * 80})
+            context.append({"role": "assistant", "content": f"a{i}"})
+        release.set()
+        await context.wait()
+
+        context.summarizer = summarize
+        context.append({"role": "user", "content": "u12"})
+        await context.wait()
+        return seen, contents(context.messages()[1:])
+
+    summarized, window = asyncio.run(scenario())
+    everything = [f"{role}{i}" for i in range(12) for role in ("u", "a")] + ["u12"]
+    assert sorted(summarized + window) == sorted(everything)
+    assert not set(summarized) & set(window)
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from src.executors import RunnableExecutor, _pack, _release, _unpack
+from src.runnables import Runnable
+
+np = pytest.importorskip("numpy")
+pytestmark = pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs POSIX shared memory in /dev/shm")
+
+
+def shm_segments() -> set:
+    return set(os.listdir("/dev/shm"))
+
+
+class Double(Runnable):
+    def process(self, data):
+        return {"doubled": data["array"] * 2, "pid": os.getpid(), "label": data["label"]}
+
+
+def test_pack_and_release_unlink_the_segments():
+    before = shm_segments()
+    segments = []
+    packed = _pack({"big": np.ones(1 << 18), "small": np.ones(4)}, 1 << 10, segments)
+    assert len(segments) == 1
+    assert segments[0].name.lstrip("/") in shm_segments()
+    # the small array is pickled as it is
+    assert isinstance(packed["small"], np.ndarray)
+
+    views = []
+    unpacked = _unpack(packed, views, copy=True)
+    _release(views, unlink=False)
+    _release(segments, unlink=True)
+    assert np.array_equal(unpacked["big"], np.ones(1 << 18))
+    assert shm_segments() == before
+
+
+def test_process_round_trip_through_shared_memory():
+    before = shm_segments()
+    array = np.arange(1 << 18, dtype=np.float64)
+    output = RunnableExecutor(Double(), kind="process", shared_memory_threshold=1 << 10).invoke(
+        {"array": array, "label": "x"})
+    assert output["pid"] != os.getpid()
+    assert output["label"] == "x"
+    assert np.array_equal(output["doubled"], array * 2)
+    # the result is a copy, not a view onto a segment that is gone
+    assert output["doubled"].flags.owndata
+    assert shm_segments() == before
+
+
+def test_no_segment_is_reported_leaked_at_exit():
+    code = (
+        "import numpy as np\n"
+        "from src.executors import RunnableExecutor\n"
+        "from src.runnables import RunnablePassthrough\n"
+        "executor = RunnableExecutor(RunnablePassthrough(), kind='process', shared_memory_threshold=1024)\n"
+        "for _ in range(3):\n"
+        "    assert executor.invoke(np.ones(1 << 16)).sum() == 1 << 16\n"
+    )
+    before = shm_segments()
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=60,
+                            cwd=Path(__file__).resolve().parents[1])
+    assert result.returncode == 0, result.stderr
+    assert "leaked" not in result.stderr and "KeyError" not in result.stderr
+    assert shm_segments() == before
@@ -0,0 +1,210 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+from openai import AsyncOpenAI
+
+from src.fake_server import FakeServer, FakeServerConfig, Latency
+from src.llm_cache import CachedClient, LLMResponseCache
+from src.rate_limiter import BACKGROUND, QuotaLimits, RateLimitedAsyncTransport, RateLimiter, priority
+from src.resilience import AsyncResilientClient, LatencyTracker
+
+MESSAGES = [{"role": "user", "content": "What is the capital of France?"}]
+
+
+def config(**kwargs) -> FakeServerConfig:
+    return FakeServerConfig(**{"ttft": Latency.parse("const:0.01"), "tokens_per_second": 2000.0,
+                               "completion_tokens": 20, **kwargs})
+
+
+def client_for(server: FakeServer, http_client: httpx.AsyncClient = None) -> AsyncOpenAI:
+    # the SDK's own retries would hide what the wrappers under test do
+    return AsyncOpenAI(base_url=server.url + "/v1", api_key="test", max_retries=0, http_client=http_client)
+
+
+async def stream_text(stream) -> str:
+    parts = []
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+    return "".join(parts)
+
+
+def test_resilient_client_falls_back_on_server_errors():
+    async def scenario():
+        async with FakeServer(config(error_rate=1.0, error_status=500)) as broken, FakeServer(config()) as healthy:
+            client = AsyncResilientClient(client_for(broken), fallbacks=[(client_for(healthy), "fallback-model")],
+                                          timeout=5, hedge=False)
+            completion = await client.chat.completions.create(model="primary-model", messages=MESSAGES)
+            return completion, client.stats, broken.server.requests, healthy.server.requests
+
+    completion, stats, broken_requests, healthy_requests = asyncio.run(scenario())
+    assert completion.choices[0].message.content
+    assert completion.model == "fallback-model"
+    assert stats["fallbacks"] == 1
+    assert broken_requests["chat.completions"] == 1
+    assert healthy_requests["chat.completions"] == 1
+
+
+def test_resilient_client_deadline_covers_the_first_streamed_chunk():
+    async def scenario():
+        async with FakeServer(config(ttft=Latency.parse("const:2.0"))) as slow, FakeServer(config()) as fast:
+            client = AsyncResilientClient(client_for(slow), fallbacks=[client_for(fast)], timeout=0.3, hedge=False)
+            started = time.perf_counter()
+            stream = await client.chat.completions.create(model="m", messages=MESSAGES, stream=True)
+            text = await stream_text(stream)
+            elapsed = time.perf_counter() - started
+
+            alone = AsyncResilientClient(client_for(slow), timeout=0.3, hedge=False)
+            with pytest.raises(TimeoutError):
+                await alone.chat.completions.create(model="m", messages=MESSAGES, stream=True)
+            return text, elapsed, client.stats
+
+    text, elapsed, stats = asyncio.run(scenario())
+    assert text
+    assert elapsed < 1.5
+    assert stats["timeouts"] == 1 and stats["fallbacks"] == 1
+
+
+def test_resilient_client_hedges_a_slow_request():
+    async def scenario():
+        # the server draws the latency of every request independently: one of the two wins early
+        async with FakeServer(config(ttft=Latency.parse("uniform:0.0,1.0"), seed=3)) as server:
+            client = AsyncResilientClient(
+                client_for(server), timeout=5,
+                tracker_factory=lambda: LatencyTracker(initial_delay=0.05, min_samples=1000))
+            await client.chat.completions.create(model="m", messages=MESSAGES)
+            return client.stats, server.server.requests
+
+    stats, requests = asyncio.run(scenario())
+    assert stats["calls"] == 1
+    assert stats["hedged"] == 1
+    assert requests["chat.completions"] == 2
+
+
+def test_cached_client_replays_a_stream_without_calling_the_server(tmp_path):
+    async def scenario():
+        async with FakeServer(config()) as server:
+            cache = LLMResponseCache(path=tmp_path / "llm_cache.sqlite")
+            client = CachedClient(client_for(server), cache=cache, is_async=True)
+            request = {"model": "m", "messages": MESSAGES, "temperature": 0}
+
+            first = await stream_text(await client.chat.completions.create(**request, stream=True))
+            replayed = await stream_text(await client.chat.completions.create(**request, stream=True))
+            # a streamed answer also serves the same request without streaming
+            completion = await client.chat.completions.create(**request)
+            return first, replayed, completion, cache.stats, server.server.requests
+
+    first, replayed, completion, stats, requests = asyncio.run(scenario())
+    assert first and replayed == first
+    assert completion.choices[0].message.content == first
+    assert requests["chat.completions"] == 1
+    assert stats["hits"] == 2 and stats["misses"] == 1
+
+
+def test_cached_client_does_not_store_an_abandoned_stream(tmp_path):
+    async def scenario():
+        async with FakeServer(config()) as server:
+            cache = LLMResponseCache(path=tmp_path / "llm_cache.sqlite")
+            client = CachedClient(client_for(server), cache=cache, is_async=True)
+            stream = await client.chat.completions.create(model="m", messages=MESSAGES, stream=True)
+            async for _ in stream:
+                break
+            await stream.close()
+            await stream_text(await client.chat.completions.create(model="m", messages=MESSAGES, stream=True))
+            return server.server.requests
+
+    assert asyncio.run(scenario())["chat.completions"] == 2
+
+
+def test_cached_client_keeps_sqlite_off_the_event_loop(tmp_path):
+    async def scenario():
+        async with FakeServer(config()) as server:
+            cache = LLMResponseCache(path=tmp_path / "llm_cache.sqlite")
+            threads = []
+            for name in ("get", "set"):
+                method = getattr(cache.backend, name)
+
+                def recorded(*args, _method=method, **kwargs):
+                    threads.append(threading.get_ident())
+                    return _method(*args, **kwargs)
+
+                setattr(cache.backend, name, recorded)
+            client = CachedClient(client_for(server), cache=cache, is_async=True)
+            await client.chat.completions.create(model="m", messages=MESSAGES)
+            await stream_text(await client.chat.completions.create(model="m", messages=MESSAGES, stream=True,
+                                                                   temperature=0))
+            return threads, threading.get_ident()
+
+    threads, loop_thread = asyncio.run(scenario())
+    assert len(threads) == 4
+    assert loop_thread not in threads
+
+
+def rate_limited_client(server: FakeServer, limiter: RateLimiter) -> AsyncOpenAI:
+    transport = RateLimitedAsyncTransport(httpx.AsyncHTTPTransport(), limiter)
+    return client_for(server, http_client=httpx.AsyncClient(transport=transport))
+
+
+def test_rate_limiter_transport_records_streamed_usage():
+    async def scenario():
+        limiter = RateLimiter({"m": QuotaLimits(rpm=100, tpm=100_000)})
+        async with FakeServer(config()) as server:
+            client = rate_limited_client(server, limiter)
+            stream = await client.chat.completions.create(model="m", messages=MESSAGES, stream=True,
+                                                          stream_options={"include_usage": True})
+            usage = None
+            async for chunk in stream:
+                usage = chunk.usage or usage
+            await client.close()
+            return usage, limiter.stats()["m"]
+
+    usage, stats = asyncio.run(scenario())
+    assert stats["granted"] == 1
+    assert stats["used_tokens"] == usage.total_tokens
+    assert stats["queue_depth"] == 0
+
+
+def test_rate_limiter_transport_pauses_the_deployment_after_a_429():
+    async def scenario():
+        limiter = RateLimiter({"m": QuotaLimits(rpm=100)})
+        async with FakeServer(config(error_rate=1.0, error_status=429, retry_after=0.4)) as throttled, \
+                FakeServer(config()) as server:
+            with pytest.raises(openai.RateLimitError):
+                await rate_limited_client(throttled, limiter).chat.completions.create(model="m", messages=MESSAGES)
+            started = time.perf_counter()
+            await rate_limited_client(server, limiter).chat.completions.create(model="m", messages=MESSAGES)
+            return time.perf_counter() - started, limiter.stats()["m"]
+
+    waited, stats = asyncio.run(scenario())
+    assert stats["throttled"] == 1
+    assert waited >= 0.35
+
+
+def test_rate_limiter_transport_serves_interactive_requests_first():
+    async def scenario():
+        # one request per second once the single-request burst is spent
+        limiter = RateLimiter({"m": QuotaLimits(rpm=60)})
+        limiter.scheduler("m").requests.level = 0
+        order = []
+        async with FakeServer(config()) as server:
+            client = rate_limited_client(server, limiter)
+
+            async def call(name: str):
+                await client.chat.completions.create(model="m", messages=MESSAGES, max_tokens=5)
+                order.append(name)
+
+            async def background():
+                with priority(BACKGROUND):
+                    await call("background")
+
+            tasks = [asyncio.create_task(background())]
+            await asyncio.sleep(0.05)
+            tasks.append(asyncio.create_task(call("interactive")))
+            await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "background"]
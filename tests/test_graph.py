@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+
+from src.graph import GRAPH_INPUT, RunnableGraph
+from src.runnables import DictTransformer, Runnable, RunnablePassthrough
+
+
+class Add(Runnable):
+    def __init__(self, amount: int, delay: float = 0.0):
+        super().__init__()
+        self.amount = amount
+        self.delay = delay
+
+    def process(self, data):
+        time.sleep(self.delay)
+        return data + self.amount
+
+    async def aprocess(self, data):
+        await asyncio.sleep(self.delay)
+        return data + self.amount
+
+
+class Total(Runnable):
+    def process(self, data):
+        return sum(data.values()) if isinstance(data, dict) else data
+
+
+def test_cycles_are_detected():
+    graph = (RunnableGraph()
+             .add_node("a", Add(1), deps=["c"])
+             .add_node("b", Add(1), deps=["a"])
+             .add_node("c", Add(1), deps=["b"]))
+    with pytest.raises(ValueError, match="cycle: a -> c -> b -> a"):
+        graph.topological_order()
+    with pytest.raises(ValueError, match="cycle"):
+        graph.invoke(0)
+
+
+def test_unknown_dependencies_and_duplicate_names_are_refused():
+    graph = RunnableGraph().add_node("a", Add(1), deps=["missing"])
+    with pytest.raises(ValueError, match="unknown node 'missing'"):
+        graph.topological_order()
+    with pytest.raises(ValueError, match="already exists"):
+        graph.add_node("a", Add(1))
+    with pytest.raises(ValueError, match="already exists"):
+        graph.add_node(GRAPH_INPUT, Add(1))
+
+
+def test_nodes_come_after_their_dependencies():
+    graph = (RunnableGraph(output="total")
+             .add_node("total", Total(), deps=["left", "right"])
+             .add_node("left", Add(1))
+             .add_node("right", Add(2), deps=["left"]))
+    names = [node.name for node in graph.topological_order()]
+    assert names.index("left") < names.index("right") < names.index("total")
+    assert graph.invoke(1) == 2 + 4
+
+
+def chains():
+    yield Add(1) | Add(2) | Add(3)
+    yield Add(1) | DictTransformer({"x": Add(10), "y": Add(20) | Add(1), "z": RunnablePassthrough()}) | Total()
+    yield DictTransformer({"a": Add(1) | DictTransformer({"b": Add(2)}), "c": Add(3)})
+    # a step with its own `next` inside a sequence
+    step = Add(5)
+    step.next = Add(7)
+    yield step | Add(1)
+
+
+@pytest.mark.parametrize("chain", list(chains()))
+def test_compiled_graph_gives_the_output_of_the_chain(chain):
+    graph = RunnableGraph.from_runnable(chain)
+    expected = chain.invoke(1)
+    assert graph.invoke(1) == expected
+    assert asyncio.run(graph.ainvoke(1)) == expected
+    assert graph.batch([1, 2]) == [expected, chain.invoke(2)]
+    assert asyncio.run(graph.abatch([1, 2])) == [expected, chain.invoke(2)]
+
+
+def test_compiled_transformer_branches_become_nodes():
+    chain = Add(1) | DictTransformer({"x": Add(10), "y": Add(20)}) | Total()
+    graph = RunnableGraph.from_runnable(chain)
+    # one node per step, none of them running the rest of the chain
+    assert len(graph.nodes) == 5
+    assert all(node.flat for node in graph.nodes.values())
+    assert graph.name == f"RunnableGraph({chain.step_name})"
+
+
+def test_independent_branches_run_concurrently():
+    chain = DictTransformer({"x": Add(1, delay=0.2), "y": Add(2, delay=0.2), "z": Add(3, delay=0.2)})
+    graph = RunnableGraph.from_runnable(chain)
+
+    started = time.perf_counter()
+    assert graph.invoke(0) == {"x": 1, "y": 2, "z": 3}
+    assert time.perf_counter() - started < 0.4
+
+    started = time.perf_counter()
+    assert asyncio.run(graph.ainvoke(0)) == {"x": 1, "y": 2, "z": 3}
+    assert time.perf_counter() - started < 0.4
+
+
+def test_max_concurrency_limits_the_running_nodes():
+    graph = RunnableGraph(output="total", max_concurrency=1)
+    for name in "abc":
+        graph.add_node(name, Add(1, delay=0.1))
+    graph.add_node("total", Total(), deps=list("abc"))
+
+    started = time.perf_counter()
+    assert asyncio.run(graph.ainvoke(0)) == 3
+    assert time.perf_counter() - started >= 0.3 * 0.9
@@ -0,0 +1,90 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("langchain_text_splitters")
+pytest.importorskip("PyPDF2")
+pytest.importorskip("fitz")
+pytest.importorskip("pdfplumber")
+
+from src.database import VectorDatabase  # noqa: E402
+from src.ingestion import DirectoryIngestor  # noqa: E402
+from src.pdf_file_utils import PDFDocumentLoader  # noqa: E402
+from src.text_splitter import CRecursiveTextSplitter  # noqa: E402
+
+TEXT = " ".join(f"word{i}" for i in range(60))
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """
+    Replace PDF parsing and embedding with fakes; the list records the parsed file names.
+    """
+    parsed = []
+
+    def parse(self):
+        parsed.append(self.file_path.rsplit("/", 1)[-1])
+        with open(self.file_path) as fp:
+            text = fp.read()
+        self.stats = {"timings": {}}
+        return {"pages": [text], "metadata": {"num_pages": 1}}
+
+    monkeypatch.setattr(PDFDocumentLoader, "_parse", parse)
+    monkeypatch.setattr(VectorDatabase, "acreate_embeddings",
+                        lambda self, texts, embedding_model_name=None: [torch.ones(3) for _ in texts])
+    return parsed
+
+
+def test_changing_the_splitter_does_not_parse_again(tmp_path, parses):
+    (tmp_path / "a.pdf").write_text(TEXT)
+    first = DirectoryIngestor(tmp_path, splitter=CRecursiveTextSplitter(chunk_size=200, chunk_overlap=0))
+    chunks = len(first.ingest().texts)
+
+    second = DirectoryIngestor(tmp_path, splitter=CRecursiveTextSplitter(chunk_size=50, chunk_overlap=0))
+    vectorstore = second.ingest()
+    # the file is chunked again from the cached parse
+    assert second.stats.updated == 1
+    assert len(vectorstore.texts) > chunks
+    assert parses == ["a.pdf"]
+    assert second.parse_cache.hits == 1
+
+
+def test_only_changed_files_are_ingested_again(tmp_path, parses):
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.pdf").write_text(f"{name} {TEXT}")
+    ingestor = DirectoryIngestor(tmp_path)
+    ingestor.ingest()
+    assert ingestor.stats.added == 3
+    manifest = ingestor.load_manifest()
+
+    (tmp_path / "b.pdf").write_text(f"b changed {TEXT}")
+    (tmp_path / "c.pdf").unlink()
+    parses.clear()
+    ingestor = DirectoryIngestor(tmp_path)
+    vectorstore = ingestor.ingest()
+
+    assert ingestor.stats.unchanged == 1 and ingestor.stats.updated == 1 and ingestor.stats.deleted == 1
+    # the unchanged file is neither parsed nor embedded again
+    assert parses == ["b.pdf"]
+    assert ingestor.stats.chunks_deleted == len(manifest["b.pdf"].chunk_ids) + len(manifest["c.pdf"].chunk_ids)
+    sources = {doc.metadata["source"] for doc in vectorstore.texts}
+    assert sources == {"a.pdf", "b.pdf"}
+    assert any(doc.page_content.startswith("b changed") for doc in vectorstore.texts)
+    # the chunks of the unchanged file kept their ids
+    new_manifest = ingestor.load_manifest()
+    assert new_manifest["a.pdf"].chunk_ids == manifest["a.pdf"].chunk_ids
+    assert set(new_manifest) == {"a.pdf", "b.pdf"}
+
+    # and the persisted store matches
+    assert {doc.metadata["source"] for doc in VectorDatabase.load(ingestor.store_path).texts} == sources
+
+
+def test_a_touched_file_with_the_same_content_is_not_ingested_again(tmp_path, parses):
+    path = tmp_path / "a.pdf"
+    path.write_text(TEXT)
+    DirectoryIngestor(tmp_path).ingest()
+    path.write_text(TEXT)
+    parses.clear()
+    ingestor = DirectoryIngestor(tmp_path)
+    ingestor.ingest()
+    assert ingestor.stats.unchanged == 1 and ingestor.stats.updated == 0
+    assert parses == []
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("torch")
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("pdfplumber")
+pytest.importorskip("PyPDF2")
+
+from src.pdf_file_utils import PDFDocumentLoader  # noqa: E402
+
+
+def write_pdf(path) -> None:
+    """
+    Three pages: text only, a ruled 2x2 table, text only with an underline.
+    """
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "A page of plain text, no table here.")
+
+    page = doc.new_page()
+    page.insert_text((72, 60), "Quarterly figures")
+    xs, ys = (72, 222, 372), (100, 130, 160)
+    for y in ys:
+        page.draw_line((xs[0], y), (xs[-1], y))
+    for x in xs:
+        page.draw_line((x, ys[0]), (x, ys[-1]))
+    for row, cells in enumerate((("Quarter", "Revenue"), ("Q1", "42"))):
+        for column, text in enumerate(cells):
+            page.insert_text((xs[column] + 5, ys[row] + 20), text)
+
+    page = doc.new_page()
+    page.insert_text((72, 72), "Underlined text is a single rule, not a table.")
+    page.draw_line((72, 75), (300, 75))
+    doc.save(str(path))
+    doc.close()
+
+
+def test_only_pages_with_ruling_lines_are_candidates(tmp_path):
+    path = tmp_path / "doc.pdf"
+    write_pdf(path)
+    assert PDFDocumentLoader.find_table_candidate_pages(str(path)) == [1]
+
+
+def test_extract_tables_scans_only_the_given_pages(tmp_path):
+    path = tmp_path / "doc.pdf"
+    write_pdf(path)
+    candidates = PDFDocumentLoader.find_table_candidate_pages(str(path))
+    # the pre-screen keeps every table a full scan finds
+    assert PDFDocumentLoader.extract_tables(str(path), pages=candidates) == PDFDocumentLoader.extract_tables(str(path))
+    assert PDFDocumentLoader.extract_tables(str(path), pages=candidates) == [[["Quarter", "Revenue"], ["Q1", "42"]]]
+    assert PDFDocumentLoader.extract_tables(str(path), pages=[0, 2]) == []
@@ -0,0 +1,50 @@
+import re
+from datetime import datetime
+
+from src.prompts import PromptAssembler, generate_context, generate_prompt
+from src.server import session_tools
+from src.tools.utils import prepare_schemas, prepare_tools
+
+TOOLS = list(session_tools(google=True).values())
+
+
+def test_the_text_protocol_only_adds_its_own_section():
+    native = generate_prompt()
+    schemas = prepare_schemas(models=TOOLS)
+    text = generate_prompt(schemas)
+    shared = native[:native.index("    - When a request")]
+    assert text.startswith(shared)
+    assert text.count("Important rules to follow") == 1
+    assert schemas in text and "<tool>" in text
+    assert "<tool>" not in native
+
+
+def test_messages_keep_a_stable_prefix_and_the_context_last():
+    assembler = PromptAssembler(generate_prompt())
+    history = [{"role": "user", "content": "hi"}]
+    first = assembler.messages(history, now=datetime(2024, 1, 1), user_context="In Istanbul")
+    history += [{"role": "assistant", "content": "hello"}, {"role": "user", "content": "weather?"}]
+    second = assembler.messages(history, now=datetime(2024, 1, 2))
+
+    # the system prompt opens every request, byte for byte the same
+    assert first[0] == second[0] == {"role": "system", "content": generate_prompt()}
+    assert first[0]["content"].encode() == second[0]["content"].encode()
+    assert second[1:-1] == history
+    # the volatile part comes after the conversation
+    assert first[-1] == {"role": "system", "content": "Today Date: 2024-01-01\nIn Istanbul"}
+    assert second[-1] == {"role": "system", "content": generate_context(now=datetime(2024, 1, 2))}
+    assert "2024" not in first[0]["content"]
+    assert assembler.fingerprint == PromptAssembler(generate_prompt()).fingerprint
+
+
+def test_schemas_and_tools_are_sorted_by_name():
+    schemas = prepare_schemas(models=TOOLS)
+    names = re.findall(r"^Use the function '(\w+)'", schemas, flags=re.MULTILINE)
+    assert len(names) == len(TOOLS)
+    assert names == sorted(names)
+    # the registration order does not change the prompt
+    assert prepare_schemas(models=TOOLS[::-1]) == schemas
+
+    tools = prepare_tools(models=TOOLS)
+    assert [tool["function"]["name"] for tool in tools] == names
+    assert prepare_tools(models=TOOLS[::-1]) == tools
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+from src.rate_limiter import BACKGROUND, DeploymentScheduler, QuotaLimits, priority
+
+
+def test_withdrawn_grant_refunds_requests_and_tokens():
+    scheduler = DeploymentScheduler("m", QuotaLimits(rpm=10, tpm=1000))
+    with scheduler._lock:
+        ticket = scheduler._enqueue(100)
+        ticket.event = threading.Event()
+        scheduler._pump()
+    assert ticket.granted
+    assert scheduler.requests.level < 10 and scheduler.tokens.level < 1000
+
+    scheduler._withdraw(ticket)
+    assert round(scheduler.requests.level) == 10
+    assert round(scheduler.tokens.level) == 1000
+    assert scheduler.stats()["estimated_tokens"] == 0
+
+
+def test_acquire_wakes_up_when_the_bucket_refills():
+    # one request every 0.1 s
+    scheduler = DeploymentScheduler("m", QuotaLimits(rpm=600))
+    scheduler.requests.level = 0
+    started = time.perf_counter()
+    scheduler.acquire(0)
+    assert 0.05 <= time.perf_counter() - started < 0.5
+
+
+def test_cancelled_waiter_lets_the_next_one_go():
+    async def scenario():
+        # one request every 0.2 s
+        scheduler = DeploymentScheduler("m", QuotaLimits(rpm=300))
+        scheduler.requests.level = 0
+        first = asyncio.create_task(scheduler.aacquire(0))
+        await asyncio.sleep(0.01)
+        with priority(BACKGROUND):
+            second = asyncio.create_task(scheduler.aacquire(0))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        started = time.perf_counter()
+        await second
+        return time.perf_counter() - started, first.cancelled(), scheduler.stats()
+
+    waited, cancelled, stats = asyncio.run(scenario())
+    assert cancelled
+    assert waited < 0.5
+    assert stats["granted"] == 1 and stats["queue_depth"] == 0
+
+
+def test_cancelled_grant_is_given_back_to_the_queue():
+    async def scenario():
+        scheduler = DeploymentScheduler("m", QuotaLimits(rpm=1))
+        # granted as soon as enqueued, then cancelled before the caller could send anything
+        task = asyncio.create_task(scheduler.aacquire(0))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # with the only request of the minute refunded, the next caller does not wait a minute
+        await asyncio.wait_for(scheduler.aacquire(0), timeout=1)
+
+    asyncio.run(scenario())
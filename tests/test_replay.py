@@ -0,0 +1,79 @@
+import asyncio
+import statistics
+
+from openai import AsyncOpenAI
+
+from src.agent import Agent
+from src.context import ConversationContext
+from src.fake_server import FakeServer, FakeServerConfig, Latency
+from src.prompts import PromptAssembler, generate_prompt
+from src.replay import Conversation, load_conversations, replay_conversations, summarize_timings
+
+CONVERSATIONS = [Conversation(name="a", turns=["Hello there", "What can you do?"]),
+                 Conversation(name="b", turns=["Tell me a joke", "Another one", "Thanks"])]
+
+
+class CountingAgent(Agent):
+    running = 0
+    peak = 0
+
+    async def arun(self, prompt, on_text=None):
+        CountingAgent.running += 1
+        CountingAgent.peak = max(CountingAgent.peak, CountingAgent.running)
+        try:
+            return await super().arun(prompt, on_text=on_text)
+        finally:
+            CountingAgent.running -= 1
+
+
+def replay(concurrency: int):
+    async def scenario():
+        config = FakeServerConfig(ttft=Latency.parse("const:0.05"), tokens_per_second=2000.0, completion_tokens=20)
+        async with FakeServer(config) as server:
+            client = AsyncOpenAI(base_url=server.url + "/v1", api_key="test", max_retries=0)
+
+            def make_agent() -> Agent:
+                return CountingAgent(client, "m", tools={}, prompt_assembler=PromptAssembler(generate_prompt()),
+                                     context=ConversationContext(), verbose=False)
+
+            results = await replay_conversations(make_agent, CONVERSATIONS, concurrency=concurrency)
+            return results, server.server.requests["chat.completions"]
+
+    CountingAgent.peak = 0
+    results, requests = asyncio.run(scenario())
+    return results, requests, CountingAgent.peak
+
+
+def test_conversations_are_replayed_under_the_semaphore():
+    results, requests, peak = replay(concurrency=1)
+    assert peak == 1
+    assert requests == 5
+    assert [(result.conversation, result.turn) for result in results] == [
+        ("a", 0), ("a", 1), ("b", 0), ("b", 1), ("b", 2)]
+    assert all(result.answer and result.error is None for result in results)
+
+    _, _, peak = replay(concurrency=2)
+    assert peak == 2
+
+
+def test_summary_of_the_replayed_turns():
+    results, _, _ = replay(concurrency=2)
+    summary = summarize_timings(results)
+
+    assert summary["turns"] == 5 and summary["errors"] == 0
+    assert summary["completion_tokens"] == 5 * 20
+    assert summary["prompt_tokens"] > 0
+    for stage in ("first_text", "llm", "total"):
+        samples = [getattr(result.timings, stage) for result in results]
+        assert summary[stage]["p50"] == statistics.median(samples)
+        assert summary[stage]["p50"] <= summary[stage]["p95"] <= summary[stage]["max"] == max(samples)
+    # every turn waited for the first token
+    assert summary["first_text"]["p50"] >= 0.05
+    assert summary["total"]["p50"] >= summary["first_text"]["p50"]
+
+
+def test_conversations_are_loaded_from_text_files(tmp_path):
+    (tmp_path / "one.txt").write_text("Hello\n\n  What time is it?  \n")
+    (tmp_path / "empty.txt").write_text("\n")
+    (tmp_path / "notes.md").write_text("ignored")
+    assert load_conversations([tmp_path]) == [Conversation(name="one", turns=["Hello", "What time is it?"])]
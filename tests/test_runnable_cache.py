@@ -0,0 +1,144 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from pydantic import BaseModel
+
+from src.runnable_cache import MemoryCacheBackend, RunnableCache, SQLiteCacheBackend, stable_hash
+from src.runnables import Runnable
+
+
+class SlowSquare(Runnable):
+    def __init__(self, delay: float = 0.1):
+        super().__init__()
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def process(self, data):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return data * data
+
+    async def aprocess(self, data):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return data * data
+
+
+def test_concurrent_misses_run_once_in_threads():
+    step = SlowSquare()
+    cache = RunnableCache(step)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(cache.invoke, [3] * 8))
+    assert results == [9] * 8
+    assert step.calls == 1
+    assert cache.stats["misses"] == 1 and cache.stats["coalesced"] + cache.stats["hits"] == 7
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_concurrent_misses_run_once_in_the_event_loop(backend, tmp_path):
+    async def scenario():
+        step = SlowSquare()
+        cache = RunnableCache(step, backend=backend, path=tmp_path / "cache.sqlite")
+        results = await asyncio.gather(*(cache.ainvoke(4) for _ in range(8)))
+        return results, step.calls, cache.stats
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == [16] * 8
+    assert calls == 1
+    assert stats["misses"] == 1 and stats["entries"] == 1
+
+
+def test_sqlite_backend_is_used_off_the_event_loop(tmp_path):
+    async def scenario():
+        cache = RunnableCache(SlowSquare(delay=0), backend="sqlite", path=tmp_path / "cache.sqlite")
+        threads = []
+        for name in ("get", "set"):
+            method = getattr(cache.backend, name)
+
+            def recorded(*args, _method=method, **kwargs):
+                threads.append(threading.get_ident())
+                return _method(*args, **kwargs)
+
+            setattr(cache.backend, name, recorded)
+        await cache.ainvoke(2)
+        await cache.ainvoke(2)
+        return threads, threading.get_ident()
+
+    threads, loop_thread = asyncio.run(scenario())
+    # miss, store, hit
+    assert len(threads) == 3
+    assert loop_thread not in threads
+
+
+@pytest.mark.parametrize("backend_class", [MemoryCacheBackend, SQLiteCacheBackend])
+def test_entries_expire_after_their_ttl(backend_class, tmp_path):
+    backend = backend_class() if backend_class is MemoryCacheBackend else backend_class(path=tmp_path / "c.sqlite")
+    step = SlowSquare(delay=0)
+    cache = RunnableCache(step, backend=backend, ttl=0.1)
+    assert cache.invoke(5) == 25
+    assert cache.invoke(5) == 25
+    assert step.calls == 1
+    time.sleep(0.15)
+    assert cache.invoke(5) == 25
+    assert step.calls == 2
+
+
+def test_memory_backend_evicts_the_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    assert backend.get("a") == (True, 1)
+    backend.set("c", 3)
+    assert backend.get("b") == (False, None)
+    assert backend.get("a") == (True, 1) and backend.get("c") == (True, 3)
+    assert backend.evictions == 1 and len(backend) == 2
+
+
+def test_sqlite_backend_evicts_beyond_max_entries(tmp_path):
+    backend = SQLiteCacheBackend(path=tmp_path / "c.sqlite", max_entries=2)
+    for key in "abc":
+        backend.set(key, key)
+        time.sleep(0.01)
+    assert len(backend) == 2 and backend.evictions == 1
+    assert backend.get("a") == (False, None)
+
+
+class Query(BaseModel):
+    text: str
+    k: int = 4
+
+
+def test_stable_hash_depends_on_values_only():
+    assert stable_hash({"a": 1, "b": [1, 2]}) == stable_hash({"b": [1, 2], "a": 1})
+    assert stable_hash({1, 2, 3}) == stable_hash({3, 2, 1})
+    assert stable_hash(Query(text="x")) == stable_hash(Query(text="x", k=4))
+    assert stable_hash(Query(text="x")) != stable_hash(Query(text="x", k=5))
+    assert stable_hash({"a": 1}) != stable_hash({"a": "1"})
+    with pytest.raises(TypeError):
+        stable_hash(object())
+
+
+def test_stable_hash_of_arrays():
+    np = pytest.importorskip("numpy")
+    array = np.arange(6, dtype=np.float32)
+    assert stable_hash(array) == stable_hash(array.copy())
+    assert stable_hash(array) != stable_hash(array.reshape(2, 3))
+    assert stable_hash(array) != stable_hash(array.astype(np.float64))
+
+
+def test_stable_hash_is_the_same_in_another_process():
+    value = {"query": "café", "k": 4, "filters": {"tags": ("a", "b")}, "blob": b"\x00\x01"}
+    code = ("from src.runnable_cache import stable_hash; "
+            "print(stable_hash({'query': 'café', 'k': 4, 'filters': {'tags': ('a', 'b')}, 'blob': b'\\x00\\x01'}))")
+    other = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                           cwd=Path(__file__).resolve().parents[1], env={**os.environ, "PYTHONHASHSEED": "123"}).stdout.strip()
+    assert other == stable_hash(value)
@@ -0,0 +1,218 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.runnables import DictTransformer, Runnable, RunnablePassthrough, _combine_chunks
+
+
+class Blocking(Runnable):
+    """
+    A step with only a synchronous `process`, which blocks.
+    """
+
+    def __init__(self, delay: float = 0.2):
+        super().__init__()
+        self.delay = delay
+        self.threads = []
+
+    def process(self, data):
+        self.threads.append(threading.get_ident())
+        time.sleep(self.delay)
+        return data
+
+
+class Sleeping(Runnable):
+    def __init__(self, delay: float = 0.2):
+        super().__init__()
+        self.delay = delay
+
+    def process(self, data):
+        raise AssertionError("the asynchronous path must not call process")
+
+    async def aprocess(self, data):
+        await asyncio.sleep(self.delay)
+        return data
+
+
+def test_ainvoke_runs_blocking_steps_in_a_thread():
+    async def scenario():
+        step = Blocking()
+        chain = step | RunnablePassthrough()
+        started = time.perf_counter()
+        results = await asyncio.gather(chain.ainvoke("a"), chain.ainvoke("b"))
+        return results, time.perf_counter() - started, step.threads, threading.get_ident()
+
+    results, elapsed, threads, loop_thread = asyncio.run(scenario())
+    assert results == ["a", "b"]
+    # the two chains overlap instead of blocking the loop one after the other
+    assert elapsed < 0.35
+    assert loop_thread not in threads
+
+
+def test_dict_transformer_gathers_its_branches():
+    async def scenario():
+        transformer = DictTransformer({"x": Sleeping(), "y": Sleeping(), "z": RunnablePassthrough()})
+        started = time.perf_counter()
+        output = await transformer.ainvoke(1)
+        return output, time.perf_counter() - started
+
+    output, elapsed = asyncio.run(scenario())
+    assert output == {"x": 1, "y": 1, "z": 1}
+    assert elapsed < 0.35
+
+
+class Failing(Runnable):
+    def process(self, data):
+        if data % 2:
+            raise ValueError(f"odd {data}")
+        return data
+
+
+class Recorder(Runnable):
+    def __init__(self):
+        super().__init__()
+        self.seen = []
+
+    def process(self, data):
+        self.seen.append(data)
+        return data * 10
+
+
+class Concurrency(Runnable):
+    """
+    Records how many items it processes at the same time.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+
+    def _leave(self):
+        with self._lock:
+            self.running -= 1
+
+    def process(self, data):
+        self._enter()
+        # later items finish first
+        time.sleep(0.01 * (10 - data))
+        self._leave()
+        return data
+
+    async def aprocess(self, data):
+        self._enter()
+        await asyncio.sleep(0.01 * (10 - data))
+        self._leave()
+        return data
+
+
+def test_batch_keeps_the_order_of_the_inputs():
+    chain = Concurrency() | Recorder()
+    assert chain.batch(range(10)) == [i * 10 for i in range(10)]
+    assert asyncio.run(chain.abatch(range(10))) == [i * 10 for i in range(10)]
+
+
+def test_failed_items_pass_through_later_steps():
+    recorder = Recorder()
+    chain = Failing() | recorder
+    outputs = chain.batch(range(5), return_exceptions=True)
+    assert [output if not isinstance(output, Exception) else str(output) for output in outputs] == [
+        0, "odd 1", 20, "odd 3", 40]
+    # the later step only ran on the items that had not failed
+    assert sorted(recorder.seen) == [0, 2, 4]
+
+    recorder.seen.clear()
+    outputs = asyncio.run(chain.abatch(range(5), return_exceptions=True))
+    assert [isinstance(output, ValueError) for output in outputs] == [False, True, False, True, False]
+    assert sorted(recorder.seen) == [0, 2, 4]
+
+
+def test_batch_raises_the_first_error_without_return_exceptions():
+    with pytest.raises(ValueError, match="odd 1"):
+        (Failing() | Recorder()).batch(range(5))
+
+
+def test_batch_respects_max_concurrency():
+    step = Concurrency()
+    assert asyncio.run(step.abatch(range(10), max_concurrency=3)) == list(range(10))
+    assert step.peak == 3
+
+    step = Concurrency()
+    assert step.batch(range(10), max_concurrency=2) == list(range(10))
+    assert step.peak == 2
+
+
+class Words(Runnable):
+    """
+    Streams the words of its input, like an LLM streams tokens.
+    """
+
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def process(self, data):
+        return " ".join(self.process_stream(data))
+
+    def process_stream(self, data):
+        for word in data.split():
+            time.sleep(0.02)
+            self.events.append(("produced", word))
+            yield word
+
+
+class Exclaim(Runnable):
+    def process(self, data):
+        return f"{data}!"
+
+
+def test_stream_yields_chunks_through_a_sequence_as_they_are_produced():
+    events = []
+    chain = Exclaim() | Words(events) | RunnablePassthrough()
+    for chunk in chain.stream("a b c"):
+        events.append(("consumed", chunk))
+    # each chunk reaches the consumer before the next one is produced
+    assert events == [("produced", "a"), ("consumed", "a"), ("produced", "b"), ("consumed", "b"),
+                      ("produced", "c!"), ("consumed", "c!")]
+
+
+def test_astream_yields_chunks_through_a_sequence_as_they_are_produced():
+    events = []
+
+    async def scenario():
+        chain = Exclaim() | Words(events) | RunnablePassthrough()
+        async for chunk in chain.astream("a b c"):
+            events.append(("consumed", chunk))
+
+    asyncio.run(scenario())
+    assert events == [("produced", "a"), ("consumed", "a"), ("produced", "b"), ("consumed", "b"),
+                      ("produced", "c!"), ("consumed", "c!")]
+
+
+def test_non_streaming_steps_combine_their_upstream_chunks():
+    chain = Words([]) | Exclaim()
+    # the words are joined back before the next step runs, once
+    assert list(chain.stream("a b c")) == ["abc!"]
+    assert asyncio.run(_collect(chain.astream("a b c"))) == ["abc!"]
+
+
+async def _collect(chunks):
+    return [chunk async for chunk in chunks]
+
+
+def test_combine_chunks():
+    assert _combine_chunks([]) is None
+    assert _combine_chunks([{"a": 1}]) == {"a": 1}
+    assert _combine_chunks(["a", "b"]) == "ab"
+    assert _combine_chunks([{"a": 1}, {"b": 2}, {"a": 3}]) == {"a": 3, "b": 2}
+    assert _combine_chunks([[1], [2, 3]]) == [1, 2, 3]
+    # chunks that cannot be merged: the last one is the value
+    assert _combine_chunks([1, 2]) == 2
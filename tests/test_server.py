@@ -0,0 +1,135 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List
+
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from src.agent import Agent
+from src.context import ConversationContext
+from src.prompts import PromptAssembler
+from src.server import AssistantServer, session_credentials, session_tools
+
+TOKENS = {"alice-secret": "alice", "bob-secret": "bob"}
+
+
+class EchoAgent:
+    def __init__(self, user: str):
+        self.user = user
+        self.last_timings = None
+        self.context = SimpleNamespace(aclose=self._aclose)
+
+    async def arun(self, prompt, on_text=None):
+        return f"{self.user}: {prompt}", None
+
+    async def _aclose(self):
+        pass
+
+
+def run(scenario):
+    async def main():
+        users: List[str] = []
+
+        def make_agent(user: str) -> EchoAgent:
+            users.append(user)
+            return EchoAgent(user)
+
+        server = AssistantServer(make_agent=make_agent, tokens=TOKENS)
+        async with TestClient(TestServer(server.app())) as client:
+            return await scenario(client, users)
+
+    return asyncio.run(main())
+
+
+async def open_session(client: TestClient, token: str, session: str = None):
+    params = {"session": session} if session else {}
+    ws = await client.ws_connect("/ws", params=params, headers={"Authorization": f"Bearer {token}"})
+    return ws, (await ws.receive_json())["session"]
+
+
+async def ask(ws, text: str) -> str:
+    await ws.send_json({"type": "prompt", "text": text})
+    while (message := await ws.receive_json())["type"] != "done":
+        pass
+    return message["answer"]
+
+
+@pytest.mark.parametrize("headers, params", [({}, {}), ({"Authorization": "Bearer wrong"}, {}),
+                                             ({"Authorization": "Bearer "}, {"token": ""}), ({}, {"token": "nope"})])
+def test_connections_without_a_valid_token_are_refused(headers, params):
+    async def scenario(client, users):
+        with pytest.raises(aiohttp.WSServerHandshakeError) as error:
+            await client.ws_connect("/ws", headers=headers, params=params)
+        return error.value.status, users
+
+    status, users = run(scenario)
+    assert status == 401
+    assert users == []
+
+
+def test_sessions_are_built_for_the_authenticated_user():
+    async def scenario(client, users):
+        ws, _ = await open_session(client, "alice-secret")
+        answer = await ask(ws, "hi")
+        await ws.close()
+        # browsers pass the token in the query
+        ws = await client.ws_connect("/ws", params={"token": "bob-secret"})
+        await ws.receive_json()
+        return answer, await ask(ws, "hello"), users
+
+    alice_answer, bob_answer, users = run(scenario)
+    assert alice_answer == "alice: hi"
+    assert bob_answer == "bob: hello"
+    assert users == ["alice", "bob"]
+
+
+def test_a_session_is_only_resumed_by_its_user():
+    async def scenario(client, users):
+        ws, alice_session = await open_session(client, "alice-secret")
+        await ws.close()
+        ws, bob_session = await open_session(client, "bob-secret", session=alice_session)
+        await ws.close()
+        ws, resumed = await open_session(client, "alice-secret", session=alice_session)
+        await ws.close()
+        return alice_session, bob_session, resumed, users
+
+    alice_session, bob_session, resumed, users = run(scenario)
+    assert bob_session != alice_session
+    assert resumed == alice_session
+    assert users == ["alice", "bob"]
+
+
+def test_sessions_are_offered_the_server_tools_only(tmp_path):
+    (tmp_path / "alice.json").write_text("{}")
+    google_tokens = {"alice": str(tmp_path / "alice.json"), "bob": str(tmp_path / "missing.json")}
+
+    def make_agent(user: str) -> Agent:
+        creds_manager = session_credentials(user, google_tokens)
+        return Agent(None, "m", tools=session_tools(creds_manager is not None), prompt_assembler=PromptAssembler(""),
+                     context=ConversationContext(), dependencies={"google_creds_manager": creds_manager},
+                     verbose=False)
+
+    async def main():
+        server = AssistantServer(make_agent=make_agent, tokens=TOKENS)
+        async with TestClient(TestServer(server.app())) as client:
+            offered = {}
+            for token in ("alice-secret", "bob-secret"):
+                ws, session = await open_session(client, token)
+                await ws.close()
+                agent = server.sessions[session].agent
+                offered[server.sessions[session].user] = (
+                    set(agent.tools), {tool["function"]["name"] for tool in agent.tool_definitions},
+                    agent.dependencies["google_creds_manager"])
+            return offered
+
+    offered = asyncio.run(main())
+    alice_tools, alice_definitions, alice_creds = offered["alice"]
+    bob_tools, bob_definitions, bob_creds = offered["bob"]
+    # the maps tool blocks the event loop and acts on the server host
+    assert "google_maps" not in alice_tools | bob_tools | alice_definitions | bob_definitions
+    assert alice_tools == alice_definitions == {"get_weather_data", "read_gmail_emails", "send_gmail_email",
+                                                "get_calendar_appointments", "insert_calendar_appointment"}
+    assert alice_creds.token_file_path == tmp_path / "alice.json"
+    assert bob_tools == bob_definitions == {"get_weather_data"}
+    assert bob_creds is None
@@ -0,0 +1,163 @@
+import json
+from typing import Any, Dict, List, Optional
+
+import pytest
+from openai.types.chat import ChatCompletionChunk
+
+from src.stream_parser import (
+    StreamParser,
+    TextDelta,
+    ToolArgsComplete,
+    ToolStart,
+    decode_embedded_json,
+)
+
+
+def chunk(content: Optional[str] = None, tool_calls: Optional[List[Dict[str, Any]]] = None,
+          finish_reason: Optional[str] = None) -> ChatCompletionChunk:
+    delta: Dict[str, Any] = {}
+    if content is not None:
+        delta["content"] = content
+    if tool_calls is not None:
+        delta["tool_calls"] = tool_calls
+    return ChatCompletionChunk.model_validate({
+        "id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    })
+
+
+def native(index: int, arguments: str = "", id: Optional[str] = None, name: Optional[str] = None) -> Dict[str, Any]:
+    function: Dict[str, Any] = {"arguments": arguments}
+    if name is not None:
+        function["name"] = name
+    call: Dict[str, Any] = {"index": index, "function": function}
+    if id is not None:
+        call["id"] = id
+        call["type"] = "function"
+    return call
+
+
+def parse(chunks: List[ChatCompletionChunk]) -> List[Any]:
+    parser = StreamParser()
+    events = [event for piece in chunks for event in parser.feed(piece)]
+    return events + parser.close()
+
+
+def text_of(events: List[Any]) -> str:
+    return "".join(event.text for event in events if isinstance(event, TextDelta))
+
+
+def calls_of(events: List[Any]) -> List[ToolArgsComplete]:
+    return [event for event in events if isinstance(event, ToolArgsComplete)]
+
+
+CALL = '<tool>{"name": "get_weather_data", "parameters": {"location": "Paris"}}</tool>'
+TEXT = "Let me check. " + CALL + " Done."
+
+
+@pytest.mark.parametrize("split", range(1, len(TEXT)))
+def test_tags_split_at_any_offset(split):
+    events = parse([chunk(TEXT[:split]), chunk(TEXT[split:])])
+    assert text_of(events) == "Let me check.  Done."
+    [call] = calls_of(events)
+    assert call.index == 0 and call.id is None
+    assert call.name == "get_weather_data"
+    assert call.arguments == {"location": "Paris"}
+    assert [type(event) for event in events].count(ToolStart) == 1
+
+
+def test_one_character_per_chunk():
+    events = parse([chunk(char) for char in TEXT])
+    assert text_of(events) == "Let me check.  Done."
+    assert len(calls_of(events)) == 1
+
+
+def test_angle_brackets_in_text_are_not_held_back():
+    text = "if a < b and b <to c, then <t> is not <tool"
+    parser = StreamParser()
+    events = [event for piece in text.split(" ") for event in parser.feed(chunk(piece + " "))]
+    # only a prefix of the tag is held back, and only until the next character rules it out
+    assert text_of(events) == text + " "
+    assert text_of(parse([chunk("a < b"), chunk(" <tool")])) == "a < b <tool"
+    assert not calls_of(parse([chunk("a < b"), chunk(" <tool")]))
+
+
+def test_text_call_with_nested_and_escaped_json():
+    arguments = {"query": 'he said "hi <b>" \\ {not json}', "filters": {"tags": ["a", "b"]},
+                 "embedded": json.dumps({"inner": [1, 2]})}
+    body = json.dumps({"name": "search", "parameters": arguments})
+    events = parse([chunk("<tool>" + body[:10]), chunk(body[10:] + "</tool>")])
+    [call] = calls_of(events)
+    assert call.arguments["filters"] == {"tags": ["a", "b"]}
+    assert call.arguments["embedded"] == {"inner": [1, 2]}
+    assert json.loads(call.raw_arguments) == arguments
+
+
+def test_native_call_with_nested_and_escaped_json():
+    raw = json.dumps({"body": 'quote " and brace } and \\', "to": ["x@y.z"], "meta": {"depth": {"n": 1}}})
+    pieces = [raw[i:i + 7] for i in range(0, len(raw), 7)]
+    chunks = [chunk(tool_calls=[native(0, id="call_1", name="send_email")])]
+    chunks += [chunk(tool_calls=[native(0, piece)]) for piece in pieces]
+    events = parse(chunks)
+    [call] = calls_of(events)
+    assert call.id == "call_1"
+    assert call.arguments == json.loads(raw)
+    assert call.raw_arguments == raw
+
+
+def test_native_calls_interleaved_by_index():
+    first = json.dumps({"location": "Paris"})
+    second = json.dumps({"location": "Tokyo"})
+    parser = StreamParser()
+    events = []
+    events += parser.feed(chunk(tool_calls=[native(0, id="call_a", name="get_weather_data"),
+                                            native(1, id="call_b", name="get_weather_data")]))
+    for i in range(0, max(len(first), len(second)), 5):
+        # the pieces of the two calls alternate, second first
+        events += parser.feed(chunk(tool_calls=[native(1, second[i:i + 5]), native(0, first[i:i + 5])]))
+    events += parser.feed(chunk(finish_reason="tool_calls"))
+    events += parser.close()
+
+    calls = calls_of(events)
+    assert sorted((call.index, call.id, call.arguments["location"]) for call in calls) == [
+        (0, "call_a", "Paris"), (1, "call_b", "Tokyo")]
+    # each call is reported once, as soon as its own arguments are complete
+    assert len(calls) == 2
+    assert [call["id"] for call in parser.tool_calls] == ["call_a", "call_b"]
+    assert [call["function"]["arguments"] for call in parser.tool_calls] == [first, second]
+
+
+def test_close_with_unterminated_text_call():
+    parser = StreamParser()
+    events = parser.feed(chunk('Sure <tool>{"name": "get_weather_data", "parameters": {'))
+    events += parser.close()
+    assert text_of(events) == "Sure "
+    assert not calls_of(events)
+    assert parser.text.endswith('"parameters": {')
+
+
+def test_close_with_unterminated_native_calls():
+    parser = StreamParser()
+    parser.feed(chunk(tool_calls=[native(0, '{"location": "Par', id="call_a", name="get_weather_data"),
+                                  native(1, "", id="call_b", name="get_current_time")]))
+    events = parser.close()
+    # the broken arguments are not reported, the call without arguments is, with an empty object
+    [call] = calls_of(events)
+    assert (call.index, call.id, call.arguments) == (1, "call_b", {})
+    assert parser.tool_calls[0]["function"]["arguments"] == '{"location": "Par'
+    assert parser.close() == []
+
+
+def test_close_flushes_a_partial_tag_as_text():
+    assert text_of(parse([chunk("almost a tag <too")])) == "almost a tag <too"
+
+
+@pytest.mark.parametrize("value", ["42", "3.5", "true", "false", "null", '"quoted"', "  7  ", "[broken", "{no: json}"])
+def test_decode_embedded_json_leaves_scalars_and_invalid_json(value):
+    assert decode_embedded_json(value) == value
+    assert decode_embedded_json({"field": value}) == {"field": value}
+
+
+def test_decode_embedded_json_decodes_objects_and_arrays_recursively():
+    payload = {"a": json.dumps({"b": json.dumps([1, "2", json.dumps({"c": "true"})])}), "d": [" [1, 2] "], "e": 1}
+    assert decode_embedded_json(payload) == {"a": {"b": [1, "2", {"c": "true"}]}, "d": [[1, 2]], "e": 1}
@@ -0,0 +1,104 @@
+import asyncio
+from pathlib import Path
+from typing import ClassVar, List, Optional, Tuple
+
+import pytest
+from pydantic import ConfigDict
+
+from src.tools.base import AsyncBaseTool, clear_tool_cache
+from src.tools.get_weather import WeatherTool
+from src.tools.google_tools.credentials import GoogleCredsManager
+from src.tools.google_tools.google_tools_executors import GmailReadTool, GmailSendTool
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    clear_tool_cache()
+    yield
+    clear_tool_cache()
+
+
+class Search(AsyncBaseTool):
+    cache_ttl: ClassVar[Optional[float]] = 60.0
+    calls: ClassVar[List[str]] = []
+
+    query: str
+
+    async def _arun(self):
+        self.calls.append(self.query)
+        return [self.query]
+
+
+def test_arguments_keep_their_case_unless_the_tool_opts_in():
+    assert Search(query="Apple  pie").cache_key() == Search(query=" Apple pie ").cache_key()
+    assert Search(query="Apple pie").cache_key() != Search(query="apple pie").cache_key()
+    assert WeatherTool(location="New  York").cache_key() == WeatherTool(location="new york").cache_key()
+
+
+def test_case_sensitive_arguments_are_not_answered_from_another_entry():
+    async def scenario():
+        Search.calls = []
+        return await Search(query="ID-aB3").arun(), await Search(query="id-ab3").arun()
+
+    assert asyncio.run(scenario()) == (["ID-aB3"], ["id-ab3"])
+    assert Search.calls == ["ID-aB3", "id-ab3"]
+
+
+def test_google_results_are_cached_per_account(tmp_path: Path):
+    alice = GoogleCredsManager(token_file_path=tmp_path / "alice.json")
+    bob = GoogleCredsManager(token_file_path=tmp_path / "bob.json")
+    key = GmailReadTool(max_results=5, google_creds_manager=alice).cache_key()
+    assert key == GmailReadTool(max_results=5, google_creds_manager=GoogleCredsManager(
+        token_file_path=tmp_path / "alice.json")).cache_key()
+    assert key != GmailReadTool(max_results=5, google_creds_manager=bob).cache_key()
+
+
+class Inbox(AsyncBaseTool):
+    model_config = ConfigDict(json_schema_extra={"name": "inbox"})
+    cache_ttl: ClassVar[Optional[float]] = 60.0
+    calls: ClassVar[List[str]] = []
+
+    account: str
+
+    def cache_scope(self) -> Optional[str]:
+        return self.account
+
+    async def _arun(self):
+        self.calls.append(self.account)
+        return [f"{self.account}: {len(self.calls)}"]
+
+
+class Send(AsyncBaseTool):
+    invalidates: ClassVar[Tuple[str, ...]] = ("inbox",)
+
+    account: str
+
+    def cache_scope(self) -> Optional[str]:
+        return self.account
+
+    async def _arun(self):
+        return ["sent"]
+
+
+def test_a_write_only_invalidates_the_reads_of_its_scope():
+    async def scenario():
+        Inbox.calls = []
+        await Inbox(account="alice").arun()
+        await Inbox(account="bob").arun()
+        await Send(account="alice").arun()
+        return await Inbox(account="alice").arun(), await Inbox(account="bob").arun()
+
+    assert asyncio.run(scenario()) == (["alice: 3"], ["bob: 2"])
+    # bob's read was still answered from the cache
+    assert Inbox.calls == ["alice", "bob", "alice"]
+
+
+def test_sending_mail_keeps_other_accounts_cached(tmp_path: Path):
+    alice = GoogleCredsManager(token_file_path=tmp_path / "alice.json")
+    bob = GoogleCredsManager(token_file_path=tmp_path / "bob.json")
+    alice_key = GmailReadTool(max_results=5, google_creds_manager=alice).cache_key()
+    bob_key = GmailReadTool(max_results=5, google_creds_manager=bob).cache_key()
+
+    GmailSendTool(to="x@example.com", subject="s", body="b", google_creds_manager=alice)._invalidate()
+    assert GmailReadTool(max_results=5, google_creds_manager=alice).cache_key() != alice_key
+    assert GmailReadTool(max_results=5, google_creds_manager=bob).cache_key() == bob_key
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from src.runnables import Runnable
+from src.tracing import record_usage, trace
+
+
+class Inner(Runnable):
+    name = "inner"
+
+    def process(self, data):
+        time.sleep(0.01)
+        record_usage({"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+        return data + "!"
+
+
+class Outer(Runnable):
+    """
+    A blocking step that calls another runnable, run through `to_thread` by `ainvoke`.
+    """
+    name = "outer"
+
+    def __init__(self):
+        super().__init__()
+        self.inner = Inner()
+        self.thread = None
+
+    def process(self, data):
+        self.thread = threading.current_thread().name
+        return self.inner.invoke(data)
+
+
+class Broken(Runnable):
+    name = "broken"
+
+    def process(self, data):
+        raise RuntimeError("boom")
+
+
+def test_spans_nest_across_threads():
+    async def scenario():
+        outer = Outer()
+        with trace() as tracer:
+            await asyncio.gather(outer.ainvoke("a"), outer.ainvoke("b"))
+        return tracer, outer.thread, threading.current_thread().name
+
+    tracer, worker, loop_thread = asyncio.run(scenario())
+    assert worker != loop_thread
+    outers = [span for span in tracer.spans if span.name == "outer"]
+    inners = [span for span in tracer.spans if span.name == "inner"]
+    assert len(outers) == 2 and len(inners) == 2
+    # each inner step ran in a worker thread and is the child of the outer step that called it
+    assert sorted(span.parent_id for span in inners) == sorted(span.span_id for span in outers)
+    assert all(span.parent_id is None for span in outers)
+    assert all(span.usage == {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5} for span in inners)
+    assert all(span.end is not None for span in tracer.spans)
+
+
+def test_chrome_trace_shape(tmp_path):
+    with trace() as tracer:
+        (Inner() | Inner()).invoke("a")
+        with pytest.raises(RuntimeError):
+            Broken().invoke("a")
+    path = tmp_path / "traces" / "trace.json"
+    tracer.export_chrome_trace(path)
+    exported = json.loads(path.read_text())
+
+    assert exported["displayTimeUnit"] == "ms"
+    complete = [event for event in exported["traceEvents"] if event["ph"] == "X"]
+    metadata = [event for event in exported["traceEvents"] if event["ph"] == "M"]
+    assert len(complete) == len(tracer.spans)
+    for event in complete:
+        assert {"name", "cat", "ph", "ts", "dur", "pid", "tid", "args"} <= set(event)
+        assert event["ts"] >= 0 and event["dur"] >= 0
+        assert isinstance(event["tid"], int)
+    # every lane is named
+    assert {event["tid"] for event in complete} == {event["tid"] for event in metadata}
+    assert all(event["name"] == "thread_name" for event in metadata)
+    [broken] = [event for event in complete if event["name"] == "broken"]
+    assert "RuntimeError" in broken["args"]["error"]
+
+
+def test_summary_aggregates_spans_per_step():
+    with trace() as tracer:
+        for _ in range(3):
+            Inner().invoke("a")
+        with pytest.raises(RuntimeError):
+            Broken().invoke("a")
+    rows = {line.split()[0]: line.split() for line in tracer.summary().splitlines()[2:]}
+
+    inner = rows["inner"]
+    assert inner[1] == "3"
+    total, mean, maximum = map(float, inner[2:5])
+    assert total == pytest.approx(3 * mean, abs=0.2)
+    assert mean <= maximum <= total
+    assert total >= 30 * 0.9
+    # no chunks, 3 x 5 tokens, no error
+    assert inner[5:] == ["-", "15", "0"]
+    assert rows["broken"][1] == "1" and rows["broken"][-1] == "1"
+    # slowest steps first
+    assert list(rows) == ["inner", "broken"]
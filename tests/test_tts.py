@@ -0,0 +1,108 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pyaudio")
+pytest.importorskip("pygame")
+pytest.importorskip("cv2")
+
+from src.tts import SentenceSegmenter, SpeechStream  # noqa: E402
+
+
+def segment(pieces, **kwargs):
+    segmenter = SentenceSegmenter(**kwargs)
+    segments = [segment for piece in pieces for segment in segmenter.push(piece)]
+    return segments + segmenter.flush()
+
+
+TEXT = ("I met Dr. Smith at St. Mary's today. J. R. R. Tolkien wrote it, e.g. the Hobbit. "
+        "Pi is about 3.14 and e is 2.72 roughly! Is that right?")
+SENTENCES = ["I met Dr. Smith at St. Mary's today.", "J. R. R. Tolkien wrote it, e.g. the Hobbit.",
+             "Pi is about 3.14 and e is 2.72 roughly!", "Is that right?"]
+
+
+def test_abbreviations_and_decimals_do_not_end_a_sentence():
+    assert segment([TEXT]) == SENTENCES
+
+
+def test_partial_chunks_give_the_same_sentences():
+    # tokens cut anywhere: inside "3.14", between a period and its space, ...
+    assert segment(list(TEXT)) == SENTENCES
+    assert segment([TEXT[i:i + 3] for i in range(0, len(TEXT), 3)]) == SENTENCES
+
+
+def test_a_sentence_is_returned_as_soon_as_it_is_complete():
+    segmenter = SentenceSegmenter()
+    assert segmenter.push("The weather today is") == []
+    assert segmenter.push(" sunny.") == []
+    # the period may still be a decimal point until the next character arrives
+    assert segmenter.push(" Tomorrow") == ["The weather today is sunny."]
+    assert segmenter.flush() == ["Tomorrow"]
+
+
+def test_short_sentences_are_merged_and_long_ones_cut():
+    assert segment(["Hi. Ok. This is longer. And more"]) == ["Hi. Ok. This is longer.", "And more"]
+    clauses = segment([f"item {i}, " for i in range(30)], clause_chars=40)
+    assert len(clauses) > 1 and all(len(clause) <= 50 and clause.endswith(",") for clause in clauses[:-1])
+    words = segment(["word "] * 100, max_chars=60)
+    assert len(words) > 1 and all(len(chunk) <= 60 for chunk in words)
+    assert " ".join(words).split() == ["word"] * 100
+
+
+class FakeTTS:
+    """
+    Synthesizes each segment as its text, slower for the segments listed in `delays`.
+    """
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.written = []
+        self.finished = []
+        self.running = 0
+        self.peak = 0
+        self.stream = SimpleNamespace(write=self.written.append)
+
+    async def _synthesize(self, text):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delays.get(text, 0.01))
+            yield text.encode()
+            yield b"|"
+        finally:
+            self.running -= 1
+            self.finished.append(text)
+
+
+def test_playback_keeps_the_order_of_the_sentences():
+    first, second, third = "The first sentence is slow.", "The second one is fast.", "And the last one too."
+
+    async def scenario():
+        tts = FakeTTS({first: 0.2})
+        visualizer = SimpleNamespace(audio_detected=False)
+        speech = SpeechStream(tts, visualizer, prefetch=2)
+        for word in f"{first} {second} {third}".split(" "):
+            speech.feed(word + " ")
+        await speech.finish()
+        return tts, visualizer
+
+    tts, visualizer = asyncio.run(scenario())
+    # the later sentences were synthesized first, the audio still plays in order
+    assert tts.finished.index(second) < tts.finished.index(first)
+    assert b"".join(tts.written) == f"{first}|{second}|{third}|".encode()
+    assert tts.peak == 2
+    assert visualizer.audio_detected is False
+
+
+def test_cancel_stops_the_pending_syntheses():
+    async def scenario():
+        tts = FakeTTS({"A sentence that takes forever.": 10})
+        speech = SpeechStream(tts, SimpleNamespace(audio_detected=False))
+        speech.feed("A sentence that takes forever. ")
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(speech.cancel(), timeout=1)
+        return tts
+
+    tts = asyncio.run(scenario())
+    assert tts.written == [] and tts.running == 0